@@ -1,37 +1,180 @@
-import sqlite3
-import os
+import numpy as np
 import pandas as pd
+from db_handler import query_trips
+from db_pool import get_pool
+from metrics import timed_query, timed_step
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "../db/FleetStat.db")
+TRIP_COLUMNS = ["trip_id", "vehicle_number", "distance", "fuel_consumption"]
 
-def get_trip_analytics():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM trip_info", conn)
-    conn.close()
 
-    result = {}
+def _mileage(distance, fuel):
+    # km/l, 0 where no fuel was recorded (same rule as the fleet average)
+    distance = np.asarray(distance, dtype=float)
+    fuel = np.asarray(fuel, dtype=float)
+    out = np.zeros_like(distance)
+    np.divide(distance, fuel, out=out, where=fuel > 0)
+    return out.round(2)
 
+
+@timed_step("analytics.build_trip_analytics")
+def build_trip_analytics(df):
+    """Fleet, per-vehicle and per-trip stats from a trip_info frame in one grouped pass.
+
+    Returns {"fleet": dict, "vehicles": DataFrame indexed by vehicle_number,
+    "trips": DataFrame indexed by trip_id}; the per-vehicle and per-trip frames
+    carry "trips"/"distance"/"fuel"/"mileage" columns.
+    """
     if df.empty:
-        return result
+        return {
+            "fleet": {},
+            "vehicles": pd.DataFrame(columns=["trips", "distance", "fuel", "mileage"]),
+            "trips": pd.DataFrame(columns=["vehicle_number", "distance", "fuel", "mileage"]),
+        }
+
+    df = df[TRIP_COLUMNS].fillna({"distance": 0.0, "fuel_consumption": 0.0})
+
+    total_distance = float(df["distance"].sum())
+    total_fuel = float(df["fuel_consumption"].sum())
+    fleet = {
+        "Total Distance": round(total_distance, 2),
+        "Total Fuel": round(total_fuel, 2),
+        "Average Mileage (km/l)": round(total_distance / total_fuel, 2) if total_fuel > 0 else 0,
+    }
+
+    # trip_id is the primary key, so per-trip stats are the rows themselves
+    trips = df.set_index("trip_id").rename(columns={"fuel_consumption": "fuel"})
+    trips["mileage"] = _mileage(trips["distance"], trips["fuel"])
+    trips[["distance", "fuel"]] = trips[["distance", "fuel"]].round(2)
+
+    vehicles = df.groupby("vehicle_number", sort=True).agg(
+        trips=("trip_id", "size"),
+        distance=("distance", "sum"),
+        fuel=("fuel_consumption", "sum"),
+    )
+    vehicles["mileage"] = _mileage(vehicles["distance"], vehicles["fuel"])
+    vehicles[["distance", "fuel"]] = vehicles[["distance", "fuel"]].round(2)
+
+    return {"fleet": fleet, "vehicles": vehicles, "trips": trips}
+
+
+@timed_query("analytics.load_trips")
+def load_trips(columns=TRIP_COLUMNS, source="sql"):
+    # source: "sql" reads trip_info and the archived months; "snapshot" reads
+    # only these columns from the memory-mapped Parquet snapshot (see
+    # snapshot.py), which holds the archives too; "auto" uses the snapshot
+    # when it is up to date with trip_info and SQL otherwise.
+    if source in ("snapshot", "auto"):
+        import snapshot   # pyarrow is only loaded when a snapshot is used
+        if source == "snapshot" or snapshot.is_fresh(tables=("trip_info",)):
+            return snapshot.read_trips(columns)
+    return query_trips(columns)
+
+
+def get_trip_analytics(source="sql"):
+    return build_trip_analytics(load_trips(TRIP_COLUMNS, source))
+
+
+@timed_query("analytics.get_trip_stats")
+def get_trip_stats(trip_id):
+    with get_pool().reader() as conn:
+        row = conn.execute(
+            "SELECT distance, fuel_consumption FROM trip_info WHERE trip_id = ?", (int(trip_id),)
+        ).fetchone()
+
+    if row is None:
+        return None
+
+    distance, fuel = (v or 0.0 for v in row)
+    return {
+        "distance": round(distance, 2),
+        "fuel": round(fuel, 2),
+        "mileage": round(distance / fuel, 2) if fuel > 0 else 0,
+    }
+
+
+# ---------- Rollup reads (O(1) / O(vehicles), see rollups.py) ----------
+
+@timed_query("analytics.get_fleet_totals")
+def get_fleet_totals():
+    with get_pool().reader() as conn:
+        row = conn.execute(
+            "SELECT trip_count, total_distance, total_fuel FROM fleet_rollup WHERE id = 1"
+        ).fetchone()
+
+    if row is None or not row[0]:
+        return {}
+
+    _, total_distance, total_fuel = row
+    return {
+        "Total Distance": round(total_distance, 2),
+        "Total Fuel": round(total_fuel, 2),
+        "Average Mileage (km/l)": round(total_distance / total_fuel, 2) if total_fuel > 0 else 0,
+    }
+
+
+@timed_query("analytics.get_vehicle_totals")
+def get_vehicle_totals():
+    with get_pool().reader() as conn:
+        df = pd.read_sql_query(
+            """
+            SELECT vehicle_number, trip_count AS trips, total_distance AS distance, total_fuel AS fuel
+            FROM vehicle_rollup ORDER BY vehicle_number
+            """,
+            conn,
+            index_col="vehicle_number",
+        )
+    df["mileage"] = _mileage(df["distance"], df["fuel"])
+    df[["distance", "fuel"]] = df[["distance", "fuel"]].round(2)
+    return df
+
 
-    total_distance = df["distance"].sum()
-    total_fuel = df["fuel_consumption"].sum()
-    avg_mileage = round(total_distance / total_fuel, 2) if total_fuel > 0 else 0
+@timed_query("analytics.get_daily_totals")
+def get_daily_totals(vehicle_number=None, date_from=None, date_to=None):
+    clauses, params = [], []
+    if vehicle_number:
+        clauses.append("vehicle_number = ?")
+        params.append(vehicle_number)
+    if date_from:
+        clauses.append("trip_date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("trip_date <= ?")
+        params.append(str(date_to))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
 
-    result["Total Distance"] = round(total_distance, 2)
-    result["Total Fuel"] = round(total_fuel, 2)
-    result["Average Mileage (km/l)"] = avg_mileage
+    with get_pool().reader() as conn:
+        df = pd.read_sql_query(
+            f"""
+            SELECT vehicle_number, trip_date, trip_count AS trips,
+                   total_distance AS distance, total_fuel AS fuel
+            FROM vehicle_daily_rollup {where} ORDER BY trip_date, vehicle_number
+            """,
+            conn,
+            params=params,
+        )
+    return df
 
-    # Per-trip stats
-    for trip_id in df["trip_id"].unique():
-        trip_df = df[df["trip_id"] == trip_id]
-        d = trip_df["distance"].sum()
-        f = trip_df["fuel_consumption"].sum()
-        m = round(d / f, 2) if f > 0 else 0
 
-        result[f"Total Distance of {trip_id} trip"] = round(d, 2)
-        result[f"Total Fuel used in {trip_id} trip"] = round(f, 2)
-        result[f"Average Mileage in {trip_id} trip (km/l)"] = m
+@timed_query("analytics.get_fleet_daily")
+def get_fleet_daily(date_from=None, date_to=None):
+    # Fleet-wide trips and fuel per day, archived months included
+    clauses, params = [], []
+    if date_from:
+        clauses.append("trip_date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("trip_date <= ?")
+        params.append(str(date_to))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
 
-    return result
+    with get_pool().reader() as conn:
+        df = pd.read_sql_query(
+            f"""
+            SELECT trip_date, trip_count AS trips, total_fuel AS fuel
+            FROM fleet_daily_rollup {where} ORDER BY trip_date
+            """,
+            conn,
+            params=params,
+        )
+    df["fuel_per_trip"] = (df["fuel"] / df["trips"]).round(2)
+    return df
@@ -1,11 +1,34 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import List
-from db_handler import conn
-import pandas as pd
+from fastapi import FastAPI, Depends, Request, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from datetime import date
+from db_pool import get_pool, read_db, write_db
+import db_handler
+from db_handler import insert_trips_bulk, BULK_CHUNK_SIZE
+from fuel_model import get_model_holder, predict_fuel
+from metrics import instrument_app
+from http_cache import add_http_caching, conditional
+import changefeed
+import queries
+import reports
+import csv
+import io
+import json
 import sqlite3
 
-app = FastAPI(title="FleetStat API")
+@asynccontextmanager
+async def lifespan(app):
+    # Load the fuel model once up front; ModelHolder swaps in newer versions
+    await run_in_threadpool(get_model_holder)
+    yield
+
+app = FastAPI(title="FleetStat API", lifespan=lifespan)
+add_http_caching(app)
+instrument_app(app)
+trip_feed = changefeed.ChangeFeed()
 
 # ---------- Pydantic Models ----------
 class Vehicle(BaseModel):
@@ -27,17 +50,90 @@ class Trip(BaseModel):
     lon_end: float
     distance: float
 
+class FuelQuery(BaseModel):
+    distance: float = Field(ge=0)
+    vehicle_type: Optional[str] = None
+    vehicle_number: Optional[str] = None
+
+class FuelBatch(BaseModel):
+    trips: List[FuelQuery]
+
+class ReportRequest(BaseModel):
+    kind: str = Field("fleet", pattern="^(fleet|vehicle)$")
+    period: str = Field(pattern=r"^\d{4}-\d{2}$")
+    vehicle_number: Optional[str] = None
+
+# ---------- Paging & export helpers ----------
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _page(fetch, *args, **kwargs):
+    try:
+        return fetch(*args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _bbox(bbox: Optional[str]):
+    if not bbox:
+        return None
+    try:
+        return queries.parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _export(batches, columns, fmt, filename):
+    # Encode keyset batches as they are fetched; nothing is held beyond one batch
+    def ndjson():
+        for rows in batches:
+            yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+    def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    body = ndjson() if fmt == "ndjson" else csv_rows()
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
 # ---------- API Endpoints ----------
 
-@app.get("/vehicles")
-def get_vehicles():
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM vehicle_info")
-    rows = cursor.fetchall()
-    return rows
+# trip_count / total_distance come from vehicle_rollup, which every trip write changes
+@app.get("/vehicles", dependencies=[Depends(conditional("vehicle_info", "trip_info"))])
+def get_vehicles(
+    limit: int = Query(100, ge=1, le=queries.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    vehicle_number: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+    conn: sqlite3.Connection = Depends(read_db),
+):
+    return _page(queries.vehicle_page, conn, limit=limit, cursor=cursor,
+                 vehicle_type=vehicle_type, vehicle_number=vehicle_number,
+                 vehicle_search=vehicle_search)
+
+@app.get("/vehicles/export")
+def export_vehicles(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    vehicle_type: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+):
+    batches = queries.iter_vehicle_batches(get_pool().reader, vehicle_type=vehicle_type,
+                                           vehicle_search=vehicle_search)
+    return _export(batches, queries.VEHICLE_COLUMNS, format, "vehicles")
 
 @app.post("/add_vehicle")
-def add_vehicle(vehicle: Vehicle):
+def add_vehicle(vehicle: Vehicle, conn: sqlite3.Connection = Depends(write_db)):
     cursor = conn.cursor()
     cursor.execute('''
         INSERT INTO vehicle_info (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date)
@@ -47,14 +143,43 @@ def add_vehicle(vehicle: Vehicle):
     conn.commit()
     return {"message": "✅ Vehicle added successfully"}
 
-@app.get("/trips")
-def get_trips():
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM trip_info")
-    return cursor.fetchall()
+@app.get("/trips", dependencies=[Depends(conditional("trip_info"))])
+def get_trips(
+    limit: int = Query(100, ge=1, le=queries.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order: str = "trip_id",
+    vehicle_number: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+):
+    # trip_info plus the archived months the date range reaches
+    return _page(db_handler.trip_page, limit=limit, cursor=cursor, order=order,
+                 vehicle_number=vehicle_number, vehicle_search=vehicle_search,
+                 date_from=date_from, date_to=date_to,
+                 bbox=_bbox(bbox))
+
+@app.get("/trips/export")
+def export_trips(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    order: str = "trip_id",
+    vehicle_number: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+):
+    if order not in queries.TRIP_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of {', '.join(queries.TRIP_ORDERS)}")
+    batches = db_handler.iter_trip_batches(
+        order=order, vehicle_number=vehicle_number, vehicle_search=vehicle_search,
+        date_from=date_from, date_to=date_to, bbox=_bbox(bbox),
+    )
+    return _export(batches, queries.TRIP_COLUMNS, format, "trips")
 
 @app.post("/add_trip")
-def add_trip(trip: Trip):
+def add_trip(trip: Trip, conn: sqlite3.Connection = Depends(write_db)):
     cursor = conn.cursor()
     cursor.execute('''
         INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date,
@@ -64,22 +189,99 @@ def add_trip(trip: Trip):
           trip.start_location, trip.end_location, trip.lat_start,
           trip.lon_start, trip.lat_end, trip.lon_end, trip.distance))
     conn.commit()
+    trip_feed.notify()
     return {"message": "✅ Trip added successfully"}
 
-@app.get("/analytics")
-def get_analytics():
+@app.get("/trips/stream")
+async def trip_stream(
+    request: Request,
+    after: Optional[int] = Query(None, ge=0, description="last change seq seen (or send Last-Event-ID)"),
+    vehicle_number: Optional[str] = None,
+):
+    # Server-Sent Events with every trip change after `after`; see changefeed.py
+    return changefeed.stream_response(trip_feed, request, after, vehicle_number)
+
+# ---------- Bulk ingestion ----------
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+def _merge(total, part):
+    total["inserted"] += part["inserted"]
+    total["failed"] += part["failed"]
+    total["errors"].extend(part["errors"])
+
+async def _ndjson_lines(request: Request):
+    # Yield (line number, raw line) for each non-blank line as the body streams in
+    buffer = b""
+    index = 0
+    async for block in request.stream():
+        buffer += block
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, line
+                index += 1
+    if buffer.strip():
+        yield index, buffer
+
+def _insert_numbered(pairs):
+    # insert_trips_bulk reports errors by list position; map them back to line numbers
+    part = insert_trips_bulk([record for _, record in pairs])
+    for error in part["errors"]:
+        error["index"] = pairs[error["index"]][0]
+    return part
+
+@app.post("/trips/bulk")
+async def add_trips_bulk(request: Request):
+    # Accepts a JSON array of trips, or NDJSON (one trip per line) streamed with
+    # an application/x-ndjson content type. Rows are validated and inserted in
+    # chunks of BULK_CHUNK_SIZE, one transaction each; bad rows are reported
+    # by index and do not stop the rest of the upload.
+    result = {"inserted": 0, "failed": 0, "errors": []}
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type in NDJSON_TYPES:
+        chunk = []
+        async for index, line in _ndjson_lines(request):
+            try:
+                chunk.append((index, json.loads(line)))
+            except ValueError as e:
+                result["failed"] += 1
+                result["errors"].append({"index": index, "error": f"invalid JSON: {e}"})
+                continue
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                _merge(result, await run_in_threadpool(_insert_numbered, chunk))
+                chunk = []
+        if chunk:
+            _merge(result, await run_in_threadpool(_insert_numbered, chunk))
+    else:
+        try:
+            records = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of trips")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of trips")
+        _merge(result, await run_in_threadpool(insert_trips_bulk, records))
+
+    result["errors"].sort(key=lambda e: e["index"])
+    if result["inserted"]:
+        trip_feed.notify()
+    return result
+
+@app.get("/analytics", dependencies=[Depends(conditional("trip_info"))])
+def get_analytics(conn: sqlite3.Connection = Depends(read_db)):
     cursor = conn.cursor()
-    df = pd.read_sql_query("SELECT * FROM trip_info", conn)
+    cursor.execute("SELECT trip_count, total_distance, total_fuel FROM fleet_rollup WHERE id = 1")
+    row = cursor.fetchone()
 
-    if df.empty:
+    if row is None or not row[0]:
         return {
             "Total Fuel": 0,
             "Total Distance": 0,
             "Average Mileage (km/l)": 0
         }
 
-    total_fuel = df['fuel_consumption'].sum()
-    total_distance = df['distance'].sum()
+    _, total_distance, total_fuel = row
     avg_mileage = total_distance / total_fuel if total_fuel else 0
 
     return {
@@ -87,3 +289,58 @@ def get_analytics():
         "Total Distance": round(total_distance, 2),
         "Average Mileage (km/l)": round(avg_mileage, 2)
     }
+
+# ---------- Fuel prediction ----------
+
+MAX_PREDICT_BATCH = 50000
+
+@app.post("/predict/fuel")
+def predict_fuel_batch(batch: FuelBatch):
+    # One vectorised predict per request, on whichever model version was
+    # current when it started; a version swapped in meanwhile is not mixed in.
+    if len(batch.trips) > MAX_PREDICT_BATCH:
+        raise HTTPException(status_code=413, detail=f"at most {MAX_PREDICT_BATCH} trips per request")
+    predictions, version = predict_fuel(
+        [t.distance for t in batch.trips],
+        [t.vehicle_type for t in batch.trips],
+        [t.vehicle_number for t in batch.trips],
+    )
+    if predictions is None:
+        raise HTTPException(status_code=503, detail="no fuel model trained yet (run fuel_model.py)")
+    return {"model_version": version, "predictions": predictions.round(3).tolist()}
+
+# ---------- Reports (rendered by `python reports.py worker`) ----------
+
+def _job_response(job):
+    if job is None:
+        raise HTTPException(status_code=404, detail="no such report job")
+    if job["status"] == "done":
+        job["download_url"] = f"/reports/{job['job_id']}/download"
+    return job
+
+@app.post("/reports", status_code=202)
+def enqueue_report(request: ReportRequest):
+    try:
+        job_id = reports.enqueue_report(request.kind, request.period, request.vehicle_number)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _job_response(reports.get_job(job_id))
+
+@app.get("/reports")
+def list_reports(limit: int = Query(50, ge=1, le=500)):
+    return [_job_response(job) for job in reports.list_jobs(limit)]
+
+@app.get("/reports/{job_id}")
+def get_report(job_id: int):
+    return _job_response(reports.get_job(job_id))
+
+@app.get("/reports/{job_id}/download")
+def download_report(job_id: int):
+    job = _job_response(reports.get_job(job_id))
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"report is {job['status']}")
+    path = reports.report_path(job)
+    if path is None:
+        raise HTTPException(status_code=410, detail="report file was pruned; enqueue it again")
+    name = f"fleetstat-{job['vehicle_number'] or 'fleet'}-{job['period']}.pdf"
+    return FileResponse(path, media_type="application/pdf", filename=name)
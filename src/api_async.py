@@ -0,0 +1,331 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+
+import api as sync_api
+import changefeed
+import db_handler
+import queries
+from api import (FuelBatch, Trip, Vehicle, MAX_PREDICT_BATCH, NDJSON_TYPES, _bbox, _export, _merge,
+                 _ndjson_lines, _insert_numbered)
+from db_handler import BULK_CHUNK_SIZE, insert_trips_bulk
+from db_pool import READ_POOL_SIZE, get_pool
+from fuel_model import get_model_holder, predict_fuel
+from metrics import instrument_app
+from http_cache import add_http_caching, check, version_headers
+
+# Async variant of api.py (same routes and responses):
+#
+#   uvicorn api_async:app
+#
+# Handlers are `async def` and never touch SQLite on the event loop. Blocking
+# work goes to a DbExecutor: reads run on as many threads as the pool has
+# read connections, writes on a single thread that owns the writer (SQLite
+# serialises writers anyway, so more threads would only queue on the lock).
+# Prediction and any other numpy/pandas work runs on the read threads too.
+# Exports stream a sync generator, which Starlette already iterates on its
+# own worker threads, one keyset batch at a time.
+#
+# No async SQLite driver is used: the available ones wrap sqlite3 in a thread
+# per connection, which is what the executor does with fewer moving parts.
+#
+# Backpressure: each executor admits a bounded number of jobs (running plus
+# queued). Past that, requests are answered at once with 503 and Retry-After
+# instead of waiting behind a queue that would blow every latency budget;
+# load balancers and loadgen.py back off on 503.
+
+MAX_PENDING_READS = int(os.getenv("FLEETSTAT_MAX_PENDING_READS", str(READ_POOL_SIZE * 8)))
+MAX_PENDING_WRITES = int(os.getenv("FLEETSTAT_MAX_PENDING_WRITES", "64"))
+RETRY_AFTER_S = 1
+
+
+class Overloaded(Exception):
+    pass
+
+
+class DbExecutor:
+    def __init__(self, readers=READ_POOL_SIZE, max_reads=MAX_PENDING_READS, max_writes=MAX_PENDING_WRITES):
+        self._reads = ThreadPoolExecutor(readers, thread_name_prefix="db-read")
+        self._writes = ThreadPoolExecutor(1, thread_name_prefix="db-write")
+        self.limits = {"read": max_reads, "write": max_writes}
+        self.pending = {"read": 0, "write": 0}     # only touched on the event loop thread
+        self.rejected = {"read": 0, "write": 0}
+
+    async def _run(self, kind, executor, fn, *args):
+        if self.pending[kind] >= self.limits[kind]:
+            self.rejected[kind] += 1
+            raise Overloaded(f"too many pending {kind}s")
+        self.pending[kind] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            self.pending[kind] -= 1
+
+    async def read(self, fn, *args):
+        # fn(conn, *args) with a pooled read connection
+        return await self._run("read", self._reads, _with_reader, fn, args)
+
+    async def write(self, fn, *args):
+        # fn(conn, *args) inside one writer transaction
+        return await self._run("write", self._writes, _with_writer, fn, args)
+
+    async def compute(self, fn, *args):
+        # fn(*args) that manages its own connections (or none)
+        return await self._run("read", self._reads, fn, *args)
+
+    async def write_call(self, fn, *args):
+        # fn(*args) that takes the writer itself (e.g. insert_trips_bulk)
+        return await self._run("write", self._writes, fn, *args)
+
+    def shutdown(self):
+        self._reads.shutdown(wait=True)
+        self._writes.shutdown(wait=True)
+
+
+def _with_reader(fn, args):
+    with get_pool().reader() as conn:
+        return fn(conn, *args)
+
+
+def _with_writer(fn, args):
+    with get_pool().writer() as conn:
+        return fn(conn, *args)
+
+
+db = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global db
+    db = DbExecutor()
+    await db.compute(get_model_holder)
+    yield
+    db.shutdown()
+
+
+app = FastAPI(title="FleetStat API (async)", lifespan=lifespan)
+add_http_caching(app)
+instrument_app(app)
+trip_feed = changefeed.ChangeFeed(read=lambda fn, *args: db.read(fn, *args))
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request, exc):
+    return JSONResponse({"detail": f"server busy: {exc}"}, status_code=503,
+                        headers={"Retry-After": str(RETRY_AFTER_S)})
+
+
+def conditional(*tables):
+    # http_cache.conditional with the version read on the executor
+    async def dependency(request: Request, response: Response):
+        check(request, response, await db.read(version_headers, tables, request))
+    return dependency
+
+
+async def _page(fetch, **kwargs):
+    try:
+        return await db.read(lambda conn: fetch(conn, **kwargs))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ---------- API Endpoints ----------
+
+# trip_count / total_distance come from vehicle_rollup, which every trip write changes
+@app.get("/vehicles", dependencies=[Depends(conditional("vehicle_info", "trip_info"))])
+async def get_vehicles(
+    limit: int = Query(100, ge=1, le=queries.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    vehicle_number: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+):
+    return await _page(queries.vehicle_page, limit=limit, cursor=cursor,
+                       vehicle_type=vehicle_type, vehicle_number=vehicle_number,
+                       vehicle_search=vehicle_search)
+
+
+@app.get("/vehicles/export")
+async def export_vehicles(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    vehicle_type: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+):
+    batches = queries.iter_vehicle_batches(get_pool().reader, vehicle_type=vehicle_type,
+                                           vehicle_search=vehicle_search)
+    return _export(batches, queries.VEHICLE_COLUMNS, format, "vehicles")
+
+
+def _insert_vehicle(conn, vehicle):
+    conn.execute('''
+        INSERT INTO vehicle_info (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (vehicle.vehicle_name, vehicle.vehicle_number, vehicle.owner_name,
+          vehicle.vehicle_type, vehicle.registration_date))
+
+
+@app.post("/add_vehicle")
+async def add_vehicle(vehicle: Vehicle):
+    await db.write(_insert_vehicle, vehicle)
+    return {"message": "✅ Vehicle added successfully"}
+
+
+@app.get("/trips", dependencies=[Depends(conditional("trip_info"))])
+async def get_trips(
+    limit: int = Query(100, ge=1, le=queries.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order: str = "trip_id",
+    vehicle_number: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+):
+    # trip_info plus the archived months the date range reaches; opens its own connections
+    bbox = _bbox(bbox)
+    try:
+        return await db.compute(lambda: db_handler.trip_page(
+            limit, cursor, order, vehicle_number=vehicle_number, vehicle_search=vehicle_search,
+            date_from=date_from, date_to=date_to, bbox=bbox))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/trips/export")
+async def export_trips(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    order: str = "trip_id",
+    vehicle_number: Optional[str] = None,
+    vehicle_search: Optional[str] = Query(None, description="substring of the vehicle number"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+):
+    if order not in queries.TRIP_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of {', '.join(queries.TRIP_ORDERS)}")
+    batches = db_handler.iter_trip_batches(
+        order=order, vehicle_number=vehicle_number, vehicle_search=vehicle_search,
+        date_from=date_from, date_to=date_to, bbox=_bbox(bbox),
+    )
+    return _export(batches, queries.TRIP_COLUMNS, format, "trips")
+
+
+def _insert_trip(conn, trip):
+    conn.execute('''
+        INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date,
+            start_location, end_location, lat_start, lon_start, lat_end, lon_end, distance)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (trip.vehicle_number, trip.fuel_consumption, trip.trip_date,
+          trip.start_location, trip.end_location, trip.lat_start,
+          trip.lon_start, trip.lat_end, trip.lon_end, trip.distance))
+
+
+@app.post("/add_trip")
+async def add_trip(trip: Trip):
+    await db.write(_insert_trip, trip)
+    trip_feed.notify()
+    return {"message": "✅ Trip added successfully"}
+
+
+@app.get("/trips/stream")
+async def trip_stream(
+    request: Request,
+    after: Optional[int] = Query(None, ge=0, description="last change seq seen (or send Last-Event-ID)"),
+    vehicle_number: Optional[str] = None,
+):
+    return changefeed.stream_response(trip_feed, request, after, vehicle_number)
+
+
+@app.post("/trips/bulk")
+async def add_trips_bulk(request: Request):
+    # Same contract as api.py: a JSON array, or NDJSON streamed in chunks
+    result = {"inserted": 0, "failed": 0, "errors": []}
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type in NDJSON_TYPES:
+        chunk = []
+        async for index, line in _ndjson_lines(request):
+            try:
+                chunk.append((index, json.loads(line)))
+            except ValueError as e:
+                result["failed"] += 1
+                result["errors"].append({"index": index, "error": f"invalid JSON: {e}"})
+                continue
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                _merge(result, await db.write_call(_insert_numbered, chunk))
+                chunk = []
+        if chunk:
+            _merge(result, await db.write_call(_insert_numbered, chunk))
+    else:
+        try:
+            records = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of trips")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of trips")
+        _merge(result, await db.write_call(insert_trips_bulk, records))
+
+    result["errors"].sort(key=lambda e: e["index"])
+    if result["inserted"]:
+        trip_feed.notify()
+    return result
+
+
+def _fleet_totals(conn):
+    row = conn.execute("SELECT trip_count, total_distance, total_fuel FROM fleet_rollup WHERE id = 1").fetchone()
+    if row is None or not row[0]:
+        return {"Total Fuel": 0, "Total Distance": 0, "Average Mileage (km/l)": 0}
+    _, total_distance, total_fuel = row
+    avg_mileage = total_distance / total_fuel if total_fuel else 0
+    return {
+        "Total Fuel": round(total_fuel, 2),
+        "Total Distance": round(total_distance, 2),
+        "Average Mileage (km/l)": round(avg_mileage, 2)
+    }
+
+
+@app.get("/analytics", dependencies=[Depends(conditional("trip_info"))])
+async def get_analytics():
+    return await db.read(_fleet_totals)
+
+
+def _predict(batch):
+    predictions, version = predict_fuel(
+        [t.distance for t in batch.trips],
+        [t.vehicle_type for t in batch.trips],
+        [t.vehicle_number for t in batch.trips],
+    )
+    return None if predictions is None else {"model_version": version,
+                                              "predictions": predictions.round(3).tolist()}
+
+
+@app.post("/predict/fuel")
+async def predict_fuel_batch(batch: FuelBatch):
+    if len(batch.trips) > MAX_PREDICT_BATCH:
+        raise HTTPException(status_code=413, detail=f"at most {MAX_PREDICT_BATCH} trips per request")
+    result = await db.compute(_predict, batch)
+    if result is None:
+        raise HTTPException(status_code=503, detail="no fuel model trained yet (run fuel_model.py)")
+    return result
+
+
+@app.get("/health/db")
+async def db_health():
+    # Executor queue depth, for load balancers and the benchmark
+    return {"pending": db.pending, "limits": db.limits, "rejected": db.rejected}
+
+
+# Report queue endpoints are single-row reads and writes; api.py's handlers
+# run on Starlette's threadpool here as well
+app.post("/reports", status_code=202)(sync_api.enqueue_report)
+app.get("/reports")(sync_api.list_reports)
+app.get("/reports/{job_id}")(sync_api.get_report)
+app.get("/reports/{job_id}/download")(sync_api.download_report)
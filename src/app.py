@@ -1,22 +1,16 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
-import requests
-import joblib
 import folium
 from folium.plugins import HeatMap, MarkerCluster
 from streamlit_folium import st_folium
-from geopy.distance import geodesic
-from datetime import datetime, date
+from geo import estimate_road_km
+from datetime import datetime, date, timedelta
 import os
-import polyline
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 from fpdf import FPDF
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
+from routing import get_router, RoutingError
+from fuel_model import predict_fuel
 
 # ================== ENV SETUP =====================
 load_dotenv()   
@@ -24,10 +18,16 @@ API_KEY = os.getenv("GOOGLE_API_KEY")
 EMAIL_USER = os.getenv("EMAIL_USER") 
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
-# ============== DATABASE CONNECTION ==============
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "../db/FleetStat.db")
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# ============== DATA ACCESS ==============
+# Pages read through app_data's version-checked cache and write through
+# db_handler, both backed by the shared connection pool (which also applies
+# pending schema migrations on first use).
+import app_data
+import metrics
+import reports
+import mailer
+
+metrics.serve_from_env()   # FLEETSTAT_METRICS_PORT: timings and cache ratios of this process
 
 # ============== DARK MODE CONFIG ==============
 if "dark_mode" not in st.session_state:
@@ -71,7 +71,7 @@ st.title("🚗 FleetStat - Smarter Fleet Tracking")
 with st.sidebar:
     st.image("logo.png", width=200)
     st.header("📋 Navigation")
-    menu = ["Dashboard", "Add Vehicle", "Add Trip", "View Vehicles", "View Trips", "Per-Trip Analytics"]
+    menu = ["Dashboard", "Add Vehicle", "Add Trip", "View Vehicles", "View Trips", "Per-Trip Analytics", "Reports"]
     choice = st.selectbox("Select Option", menu)
     st.markdown("---")
     st.info("Tip: Use filters to refine your data view.")
@@ -83,61 +83,78 @@ with st.sidebar:
 
 
 # ---------------- Google Directions Function ----------------
+# Lookups go through routing.get_router(): cached on disk, coalesced, and
+# served by the offline stub provider when no API key is configured.
 def get_route_polyline(start_loc, end_loc,API_KEY):
-    url = "https://maps.googleapis.com/maps/api/directions/json"
-    params = {
-        "origin": start_loc,
-        "destination": end_loc,
-        "key": API_KEY,
-        "mode": "driving"
-    }
-    response = requests.get(url, params=params)
-    data = response.json()
-
-    if data.get("status") == "OK":
-        overview_polyline = data["routes"][0]["overview_polyline"]["points"]
-        points = polyline.decode(overview_polyline)
-        return points
-    else:
-        st.warning(f"Google Directions API error: {data.get('status')}")
-        if "error_message" in data:
-            st.error(data["error_message"])
+    try:
+        return get_router(API_KEY).route(start_loc, end_loc)
+    except RoutingError as e:
+        st.warning(f"Google Directions API error: {e.status}")
+        if e.message:
+            st.error(e.message)
     return []
 
 # ---------------- Google Distance Function ----------------
 def get_road_distance_google(start_loc, end_loc, API_KEY):
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    params = {
-        "origins": start_loc,
-        "destinations": end_loc,
-        "key": API_KEY,
-        "units": "metric"
-    }
-    response = requests.get(url, params=params)
-    data = response.json()
-
-    if data.get("status") == "OK":
-        element = data["rows"][0]["elements"][0]
-        if element["status"] == "OK":
-            distance_text = element["distance"]["text"]
-            distance_value = element["distance"]["value"] / 1000
-            return distance_text, distance_value
-    return None, 0.0
+    try:
+        return get_router(API_KEY).distance(start_loc, end_loc)
+    except RoutingError:
+        return None, 0.0
 
 # ---------------- Imports for Custom Modules ----------------
-from db_handler import insert_vehicle, insert_trip, view_vehicles, view_trips
-from analytics import get_trip_analytics
-from visualize import generate_trip_heatmap
-
-# SQLite connection
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "../db/FleetStat.db")
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+from db_handler import insert_vehicle, insert_trip, update_vehicle_by_number, Update_trip, save_trip_route
+from visualize import fleet_heatmap_cells, heatmap_from_cells
+
+# ---------------- Route Maps ----------------
+# A trip's route is fetched once and stored (trip_routes.py); maps draw the
+# stored copy simplified for the zoom they open at, not every vertex.
+MAP_WIDTH, MAP_HEIGHT = 700, 500
+
+def trip_route_map(trip_id, lat_start, lon_start, lat_end, lon_end):
+    # (folium map, whether a route is drawn)
+    route = app_data.trip_route(trip_id, MAP_WIDTH, MAP_HEIGHT)
+    if route is None:
+        points = get_route_polyline(f"{lat_start},{lon_start}", f"{lat_end},{lon_end}", API_KEY)
+        if points:
+            save_trip_route(trip_id, points)
+            route = app_data.trip_route(trip_id, MAP_WIDTH, MAP_HEIGHT)
+    m = folium.Map(location=[(lat_start + lat_end) / 2, (lon_start + lon_end) / 2],
+                   zoom_start=route[0] if route else 7)
+    folium.Marker([lat_start, lon_start], tooltip="Start", icon=folium.Icon(color="green")).add_to(m)
+    folium.Marker([lat_end, lon_end], tooltip="End", icon=folium.Icon(color="red")).add_to(m)
+    if route:
+        points = route[1]
+        folium.PolyLine(points.tolist(), color="blue", weight=4).add_to(m)
+        m.fit_bounds([points.min(axis=0).tolist(), points.max(axis=0).tolist()])
+    return m, route is not None
+
+# ---------------- Paging ----------------
+# List pages fetch one screen of rows with a keyset cursor (see queries.py).
+# The cursors of the pages already visited are kept in session state, so
+# going back needs no OFFSET scan either.
+PAGE_SIZE = 100
+
+def paged(key, filters, fetch):
+    # fetch(cursor) -> (DataFrame, next cursor); changing the filters starts again at page 1
+    state = st.session_state.setdefault(f"pager_{key}", {"filters": None, "cursors": [None]})
+    if state["filters"] != filters:
+        state["filters"], state["cursors"] = filters, [None]
+    df, next_cursor = fetch(state["cursors"][-1])
+
+    col_prev, col_page, col_next = st.columns([1, 3, 1])
+    if col_prev.button("⬅️ Previous", key=f"{key}_prev", disabled=len(state["cursors"]) == 1):
+        state["cursors"].pop()
+        st.rerun()
+    col_page.caption(f"Page {len(state['cursors'])}")
+    if col_next.button("Next ➡️", key=f"{key}_next", disabled=next_cursor is None):
+        state["cursors"].append(next_cursor)
+        st.rerun()
+    return df
 
 # ---------------- Dashboard ----------------
 if choice == "Dashboard":
     st.subheader("📈 Fleet Overview Dashboard")
-    analytics = get_trip_analytics()
+    analytics = app_data.fleet_totals()
 
     col1, col2, col3 = st.columns(3)
     col1.metric("🚗 Total Distance", f"{analytics.get('Total Distance', '0')} km")
@@ -146,10 +163,10 @@ if choice == "Dashboard":
 
     st.markdown("---")
     st.subheader("🌍 Trip Heatmap")
-    df = pd.read_sql_query("SELECT * FROM trip_info", conn)
+    cells = fleet_heatmap_cells()
 
-    if not df.empty:
-        heatmap = generate_trip_heatmap(df)
+    if len(cells):
+        heatmap = heatmap_from_cells(cells)
         st_folium(heatmap, width=700)
     else:
         st.warning("No trip data available.")
@@ -158,7 +175,7 @@ if choice == "Dashboard":
 elif choice == "Add Vehicle":
     st.subheader("🚘 Add or Update Vehicle")
 
-    df_vehicles = pd.read_sql_query("SELECT * FROM vehicle_info", conn)
+    df_vehicles = app_data.vehicles()
     vehicle_numbers = df_vehicles["vehicle_number"].tolist()
 
     selected_vehicle = st.selectbox("Select Vehicle to Update or Leave Blank to Add New", [""] + vehicle_numbers)
@@ -174,24 +191,22 @@ elif choice == "Add Vehicle":
 
         if st.form_submit_button("Save Vehicle Info"):
             if selected_vehicle:
-                conn.execute("""
-                    UPDATE vehicle_info SET
-                        vehicle_name=?, owner_name=?, vehicle_type=?, registration_date=?
-                    WHERE vehicle_number=?
-                """, (vehicle_name, owner_name, vehicle_type, registration_date, vehicle_number))
-                conn.commit()
+                update_vehicle_by_number(vehicle_number, vehicle_name, owner_name, vehicle_type, registration_date)
                 st.success("✅ Vehicle updated successfully.")
             else:
                 insert_vehicle(vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date)
                 st.success("✅ New vehicle added successfully.")
+            app_data.cache.invalidate(("vehicle_info",))
 # ---------------- Add Trip ----------------
 elif choice == "Add Trip":
     st.subheader("🛣️ Add or Update Trip")
 
-    df_trips = pd.read_sql_query("SELECT * FROM trip_info ORDER BY trip_date DESC", conn)
-    trip_ids = df_trips["trip_id"].tolist()
-    selected_trip = st.selectbox("Select Trip ID to Update or Leave Blank to Add New", [""] + trip_ids)
-    existing = df_trips[df_trips["trip_id"] == selected_trip].iloc[0] if selected_trip else None
+    # one row by primary key rather than the whole table for a dropdown
+    trip_id = st.number_input("Trip ID to Update (0 to Add New)", min_value=0, step=1)
+    existing = app_data.trip(int(trip_id)) if trip_id else None
+    if trip_id and existing is None:
+        st.warning("No trip with that ID (archived trips are read-only).")
+    selected_trip = int(trip_id) if existing is not None else None
 
     with st.form("trip_form"):
         vehicle_number = st.text_input("Vehicle Number", existing["vehicle_number"] if existing is not None else "")
@@ -206,31 +221,26 @@ elif choice == "Add Trip":
 
         if st.form_submit_button("Save Trip Info"):
             distance_text, distance = get_road_distance_google(start_location, end_location, API_KEY)
+            if distance == 0.0 and (lat_start, lon_start) != (lat_end, lon_end):
+                # routing unavailable: fall back to the offline straight-line estimate
+                distance = round(float(estimate_road_km(lat_start, lon_start, lat_end, lon_end)), 3)
+                distance_text = f"~{distance:,.1f} km (estimated)"
+                st.info("ℹ️ Route distance unavailable, using a straight-line estimate.")
             if distance == 0.0:
                 st.error("⚠️ Could not fetch distance. Trip not saved.")
             else:
                 if selected_trip:
-                    conn.execute("""
-                        UPDATE trip_info SET
-                            vehicle_number=?, fuel_consumption=?, trip_date=?,
-                            start_location=?, end_location=?,
-                            lat_start=?, lon_start=?, lat_end=?, lon_end=?, distance=?
-                        WHERE trip_id=?
-                    """, (vehicle_number, fuel, trip_date, start_location, end_location,
-                          lat_start, lon_start, lat_end, lon_end, distance, selected_trip))
-                    conn.commit()
+                    Update_trip(selected_trip, vehicle_number, fuel, trip_date, start_location, end_location,
+                                lat_start, lon_start, lat_end, lon_end, distance)
+                    saved_trip = selected_trip
                     st.success("✅ Trip updated successfully!")
                 else:
-                    insert_trip(vehicle_number, fuel, trip_date, start_location, end_location,
-                                lat_start, lon_start, lat_end, lon_end, distance)
+                    saved_trip = insert_trip(vehicle_number, fuel, trip_date, start_location, end_location,
+                                             lat_start, lon_start, lat_end, lon_end, distance)
                     st.success(f"✅ Trip added successfully. Distance: {distance_text}")
+                app_data.cache.invalidate(("trip_info",))
 
-                m = folium.Map(location=[(lat_start + lat_end) / 2, (lon_start + lon_end) / 2], zoom_start=7)
-                folium.Marker([lat_start, lon_start], tooltip="Start", icon=folium.Icon(color="green")).add_to(m)
-                folium.Marker([lat_end, lon_end], tooltip="End", icon=folium.Icon(color="red")).add_to(m)
-                route_points = get_route_polyline(f"{lat_start},{lon_start}", f"{lat_end},{lon_end}", API_KEY)
-                if route_points:
-                    folium.PolyLine(route_points, color="blue", weight=4).add_to(m)
+                m, _ = trip_route_map(saved_trip, lat_start, lon_start, lat_end, lon_end)
                 st.subheader("🗺 Trip Route")
                 st_folium(m, width=700, height=500)
 
@@ -238,23 +248,8 @@ elif choice == "Add Trip":
 # ---------------- View Vehicles ----------------
 elif choice == "View Vehicles":
     st.subheader("🚙 Vehicle Overview")
-    df = pd.read_sql_query('''
-        SELECT 
-            v.vehicle_name AS "Vehicle Name",
-            v.vehicle_number AS "Vehicle Number",
-            v.owner_name AS "Owner Name",
-            v.vehicle_type AS "Vehicle Type",
-            v.registration_date AS "Registration Date",
-            COUNT(t.trip_id) AS "Total Trips",
-            COALESCE(SUM(t.distance), 0) AS "Total Distance (km)"
-        FROM vehicle_info v
-        LEFT JOIN trip_info t ON v.vehicle_number = t.vehicle_number
-        GROUP BY v.vehicle_number
-    ''', conn)
-
-    search_term = st.text_input("🔍 Search by Vehicle Number").lower()
-    if search_term:
-        df = df[df["Vehicle Number"].str.lower().str.contains(search_term)]
+    search_term = st.text_input("🔍 Search by Vehicle Number").strip() or None
+    df = paged("vehicles", search_term, lambda cursor: app_data.vehicle_page(search_term, cursor, PAGE_SIZE))
 
     if not df.empty:
         st.download_button("Download CSV", df.to_csv(index=False).encode(), "vehicles.csv")
@@ -265,23 +260,31 @@ elif choice == "View Vehicles":
 # ---------------- View Trips ----------------
 elif choice == "View Trips":
     st.subheader("📋 Trip History")
-    df = pd.read_sql_query("SELECT * FROM trip_info ORDER BY trip_date DESC", conn)
+    min_date, max_date = app_data.trip_dates()
 
-    if not df.empty:
-        min_date = pd.to_datetime(df["trip_date"]).min().date()
-        max_date = pd.to_datetime(df["trip_date"]).max().date()
-        start_date = st.date_input("Start Date", value=min_date, min_value=min_date, max_value=max_date)
+    if min_date is not None:
+        # the last 90 days by default; older months are read from their archive files only when asked for
+        default_start = max(min_date, max_date - timedelta(days=90))
+        start_date = st.date_input("Start Date", value=default_start, min_value=min_date, max_value=max_date)
         end_date = st.date_input("End Date", value=max_date, min_value=min_date, max_value=max_date)
 
-        df = df[(pd.to_datetime(df["trip_date"]).dt.date >= start_date) & (pd.to_datetime(df["trip_date"]).dt.date <= end_date)]
+        search_term = st.text_input("Search by Vehicle Number").strip() or None
 
-        search_term = st.text_input("Search by Vehicle Number").lower()
-        if search_term:
-            df = df[df["vehicle_number"].str.lower().str.contains(search_term)]
+        # filters, order and page size run in SQL; only the rows on screen are fetched
+        filters = (start_date, end_date, search_term)
+        st.caption(f"{app_data.trip_count(*filters):,} trips")
+        df = paged("trips", filters, lambda cursor: app_data.trip_page(*filters, cursor, PAGE_SIZE))
+
+        # one batched prediction for the rows on screen, same path as /predict/fuel
+        predicted, model_version = predict_fuel(df["distance"].fillna(0).to_numpy(), None,
+                                                df["vehicle_number"].tolist())
+        if predicted is not None:
+            df = df.assign(**{"Predicted Fuel (L)": predicted.round(2),
+                              "Fuel vs Predicted (L)": (df["fuel_consumption"] - predicted).round(2)})
+            st.caption(f"Predictions from fuel model {model_version}")
 
         st.dataframe(df)
-        analytics = get_trip_analytics()
-        df_trips = view_trips()
+        df_trips = df
         if not df_trips.empty:
             trip_ids = df_trips["trip_id"].tolist()
             selected_trip_id = st.selectbox("Select Trip ID", trip_ids)
@@ -294,24 +297,19 @@ elif choice == "View Trips":
             lat_end = trip["lat_end"]
             lon_end = trip["lon_end"]
 
-            distance_key = f"Total Distance of {selected_trip_id} trip"
-            fuel_key = f"Total Fuel used in {selected_trip_id} trip"
-            mileage_key = f"Average Mileage in {selected_trip_id} trip (km/l)"
+            # archived trips are no longer in trip_info; use the row itself
+            stats = app_data.trip_stats(int(selected_trip_id)) or {
+                "distance": trip["distance"], "fuel": trip["fuel_consumption"],
+                "mileage": round(trip["distance"] / trip["fuel_consumption"], 2) if trip["fuel_consumption"] else "N/A",
+            }
 
             col4, col5, col6 = st.columns(3)
-            col4.metric("🚗 Trip Distance", f"{analytics.get(distance_key, 'N/A')} km")
-            col5.metric("⛽ Fuel Used", f"{analytics.get(fuel_key, 'N/A')} L")
-            col6.metric("⚡ Avg Mileage", f"{analytics.get(mileage_key, 'N/A')} km/L")
-
-            m = folium.Map(location=[(lat_start + lat_end) / 2, (lon_start + lon_end) / 2], zoom_start=7)
-            folium.Marker([lat_start, lon_start], tooltip="Start", icon=folium.Icon(color="green")).add_to(m)
-            folium.Marker([lat_end, lon_end], tooltip="End", icon=folium.Icon(color="red")).add_to(m)
-            origin = f"{lat_start},{lon_start}"
-            destination = f"{lat_end},{lon_end}"
-            route_points = get_route_polyline(origin, destination, API_KEY)
-            if route_points:
-                folium.PolyLine(route_points, color="blue", weight=4).add_to(m)
-            else:
+            col4.metric("🚗 Trip Distance", f"{stats.get('distance', 'N/A')} km")
+            col5.metric("⛽ Fuel Used", f"{stats.get('fuel', 'N/A')} L")
+            col6.metric("⚡ Avg Mileage", f"{stats.get('mileage', 'N/A')} km/L")
+
+            m, has_route = trip_route_map(int(selected_trip_id), lat_start, lon_start, lat_end, lon_end)
+            if not has_route:
                 st.warning("⚠️ Could not fetch driving route. Showing only markers.")
 
             st.subheader("🗺 Trip-Specific Route Map")
@@ -325,38 +323,44 @@ elif choice == "Per-Trip Analytics":
     st.subheader("📊 Per-Trip Fuel Consumption Analysis")
     st.markdown("### Analyze how much fuel is consumed per trip across your fleet.")
 
-    df = pd.read_sql_query(
-        "SELECT trip_id, trip_date, vehicle_number, fuel_consumption FROM trip_info ORDER BY trip_date ASC",
-        conn
-    )
+    min_date, max_date = app_data.trip_dates()
 
-    if not df.empty:
-        df["trip_date"] = pd.to_datetime(df["trip_date"])
-        
-        # Optional filters
+    if min_date is not None:
+
+        # Optional filters; the date range decides which months are read, and
+        # a single vehicle is fetched through its index
         with st.expander("🔍 Filter trips"):
             col1, col2 = st.columns(2)
-            with col1:
-                selected_vehicle = st.selectbox("Select Vehicle", options=["All"] + sorted(df["vehicle_number"].unique().tolist()))
             with col2:
-                date_range = st.date_input("Select Date Range", value=[df["trip_date"].min(), df["trip_date"].max()])
+                date_range = st.date_input("Select Date Range", value=[max(min_date, max_date - timedelta(days=365)), max_date],
+                                           min_value=min_date, max_value=max_date)
+            date_from, date_to = (date_range[0], date_range[-1]) if date_range else (min_date, max_date)
+            with col1:
+                selected_vehicle = st.selectbox("Select Vehicle", options=["All"] + app_data.trip_vehicles())
 
-        # Apply filters
         if selected_vehicle != "All":
-            df = df[df["vehicle_number"] == selected_vehicle]
-        df = df[(df["trip_date"] >= pd.to_datetime(date_range[0])) & (df["trip_date"] <= pd.to_datetime(date_range[1]))]
+            df = app_data.fuel_history(date_from, date_to, selected_vehicle)
+            x, y, y_label = "trip_date", "fuel_consumption", "Fuel (liters)"
+            labels = ("🔻 Min Fuel Used", "🔺 Max Fuel Used", "📉 Avg Fuel Used")
+            stats = (df[y].min(), df[y].max(), df[y].mean())
+        else:
+            # the whole fleet as one point per day, from the fleet daily rollup;
+            # the summary stays per trip, aggregated in SQL
+            df = app_data.fleet_daily(date_from, date_to)
+            x, y, y_label = "trip_date", "fuel_per_trip", "Avg fuel per trip (liters)"
+            labels = ("🔻 Min Fuel Used", "🔺 Max Fuel Used", "📉 Avg Fuel Used")
+            stats = app_data.fuel_stats(date_from, date_to)
 
         if not df.empty:
             # Animated and interactive chart
             import plotly.express as px
             fig = px.line(
                 df,
-                x="trip_date",
-                y="fuel_consumption",
-                color="vehicle_number",
+                x=x,
+                y=y,
                 markers=True,
                 title="🚚 Fuel Consumption Over Time",
-                labels={"trip_date": "Trip Date", "fuel_consumption": "Fuel (liters)", "vehicle_number": "Vehicle"},
+                labels={x: "Trip Date", y: y_label},
                 template="plotly_white",
             )
             fig.update_traces(line=dict(width=2), marker=dict(size=8))
@@ -366,22 +370,73 @@ elif choice == "Per-Trip Analytics":
 
             # Stats summary
             st.markdown("### 📌 Trip Summary Stats")
-            col1, col2, col3 = st.columns(3)
-            col1.metric("🔻 Min Fuel Used", f"{df['fuel_consumption'].min():.2f} L")
-            col2.metric("🔺 Max Fuel Used", f"{df['fuel_consumption'].max():.2f} L")
-            col3.metric("📉 Avg Fuel Used", f"{df['fuel_consumption'].mean():.2f} L")
+            if any(pd.isna(value) for value in stats):
+                # trips in range, but none with a fuel reading: fuel_stats_between
+                # returns Nones and the frame's min/max/mean are NaN
+                st.warning("No fuel readings found for selected filters.")
+            else:
+                for col, label, value in zip(st.columns(3), labels, stats):
+                    col.metric(label, f"{value:.2f} L")
 
-            st.dataframe(df.sort_values("trip_date"), use_container_width=True)
+            st.dataframe(df.sort_values(x), use_container_width=True)
         else:
             st.warning("No trip data found for selected filters.")
     else:
         st.warning("No trip data available to display.")
 
+# ---------------- Reports ----------------
+# Only queues jobs and lists them; PDFs are rendered by `python reports.py worker`.
+elif choice == "Reports":
+    st.subheader("🧾 Monthly Reports")
 
-
-
-
-
-
-
-
+    min_date, max_date = app_data.trip_dates()
+    if min_date is None:
+        st.warning("No trip data available to report on.")
+    else:
+        months = pd.period_range(min_date, max_date, freq="M").astype(str).tolist()[::-1]
+        with st.form("report_form"):
+            col1, col2 = st.columns(2)
+            period = col1.selectbox("Month", months)
+            vehicle = col2.selectbox("Vehicle", ["Whole fleet"] + sorted(app_data.vehicles()["vehicle_number"].tolist()))
+            if st.form_submit_button("Queue Report"):
+                kind, number = ("fleet", None) if vehicle == "Whole fleet" else ("vehicle", vehicle)
+                job_id = reports.enqueue_report(kind, period, number)
+                st.success(f"✅ Report job {job_id} queued. It will appear below when ready.")
+
+    if st.button("🔄 Refresh"):
+        st.rerun()
+    jobs = reports.list_jobs(25)
+    if not jobs:
+        st.info("No reports yet.")
+    label = lambda job: f"#{job['job_id']} {job['vehicle_number'] or 'Fleet'} {job['period']}"
+    for job in jobs:
+        if job["status"] == "running" and job["sections_total"]:
+            st.progress(job["sections_done"] / job["sections_total"], text=f"{label(job)}: rendering")
+        elif job["status"] == "failed":
+            st.error(f"{label(job)}: failed ({job['error']})")
+        else:
+            st.write(f"{label(job)}: {job['status']}")
+
+    # one file is read per rerun, not every listed report
+    ready = [job for job in jobs if reports.report_path(job)]
+    if ready:
+        job = st.selectbox("Finished report", ready, format_func=label)
+        path = reports.report_path(job)
+        file_name = f"fleetstat-{job['vehicle_number'] or 'fleet'}-{job['period']}.pdf"
+        with open(path, "rb") as f:
+            st.download_button("Download PDF", f.read(), file_name, mime="application/pdf")
+
+        # queued for `python mailer.py worker`; the page never talks to SMTP
+        with st.form("report_mail_form"):
+            recipients = st.text_area("Email this report to (one address per line)")
+            if st.form_submit_button("📧 Queue Emails"):
+                addresses = [a.strip() for a in recipients.replace(",", "\n").splitlines() if a.strip()]
+                try:
+                    count = mailer.enqueue_many([{
+                        "recipient": address, "subject": f"FleetStat report {label(job)}",
+                        "body": "Please find the FleetStat report attached.",
+                        "attachment_path": path, "attachment_name": file_name,
+                    } for address in addresses])
+                    st.success(f"✅ {count} email(s) queued.")
+                except ValueError as e:
+                    st.error(str(e))
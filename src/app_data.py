@@ -0,0 +1,208 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import queries
+from analytics import get_fleet_daily, get_fleet_totals, get_trip_stats
+from db_handler import (count_trips_between, fuel_stats_between, get_trip, get_trip_route, query_trips,
+                        trip_date_bounds, trip_page_between)
+from db_pool import get_pool
+from metrics import CACHES
+from versions import VERSIONED_TABLES, table_versions
+
+# Cached data access for the Streamlit app. Streamlit reruns app.py on every
+# interaction; loaders here memoise their result per (name, parameters) and
+# tag it with the change counters of the tables it reads. A rerun costs one
+# primary-key read of table_versions when nothing changed, and a write only
+# evicts entries that depend on the table it touched.
+#
+# Keys include page cursors, date ranges and search terms, so the cache is
+# bounded: least recently used entries go first once it holds MAX_ENTRIES
+# values or MAX_BYTES of them. Entries behind a table that changed (written
+# by any process) are dropped when a lookup notices the new version.
+
+MAX_ENTRIES = int(os.getenv("FLEETSTAT_APP_CACHE_ENTRIES", "256"))
+MAX_BYTES = int(os.getenv("FLEETSTAT_APP_CACHE_MB", "256")) * 1024 * 1024
+
+
+def _size(value):
+    # Rough bytes held by a cached value (DataFrames, and tuples / lists / dicts of them)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class VersionedCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (table versions, value, size), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _versions(self, tables):
+        with get_pool().reader() as conn:
+            versions = table_versions(conn, tables)
+        return tuple(versions.get(t, (0, None))[0] for t in tables)
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def get(self, key, tables, loader):
+        versions = self._versions(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == versions:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            # these tables moved on: nothing cached against the old versions is served again
+            for stale in [k for k, e in self._entries.items() if k[1] == tables and e[0] != versions]:
+                self._drop(stale)
+
+        self.misses += 1
+        value = loader()
+        size = _size(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (versions, value, size)
+            self._bytes += size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def invalidate(self, tables=VERSIONED_TABLES):
+        # Drop entries that read any of these tables (the version check would
+        # catch them on the next read anyway; this frees the memory now)
+        tables = set(tables)
+        with self._lock:
+            for key in [k for k in self._entries if tables & set(k[1])]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+cache = VersionedCache()
+CACHES.register("app_data", cache)
+
+
+def cached(*tables):
+    # Decorator: memoise a loader on its arguments, keyed to the given tables.
+    # Cached DataFrames are shared between reruns - treat them as read-only.
+    def wrap(loader):
+        def load(*args):
+            key = (loader.__name__, tables, args)
+            return cache.get(key, tables, lambda: loader(*args))
+        load.__name__ = loader.__name__
+        return load
+    return wrap
+
+
+def _query(sql, params=()):
+    with get_pool().reader() as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+
+# ---------- Loaders used by the pages ----------
+
+@cached("vehicle_info")
+def vehicles():
+    return _query("SELECT * FROM vehicle_info")
+
+
+@cached("trip_info")
+def trip(trip_id):
+    return get_trip(trip_id)
+
+
+def trip_route(trip_id, width, height):
+    # Not cached: storing a route bumps no table version, and this is two
+    # primary-key reads of a few KiB
+    return get_trip_route(trip_id, width, height)
+
+
+@cached("trip_info")
+def trip_vehicles():
+    # every vehicle number with trips, archived ones included
+    with get_pool().reader() as conn:
+        return [number for number, in conn.execute("SELECT vehicle_number FROM vehicle_rollup ORDER BY 1")]
+
+
+VEHICLE_LABELS = {
+    "vehicle_name": "Vehicle Name", "vehicle_number": "Vehicle Number", "owner_name": "Owner Name",
+    "vehicle_type": "Vehicle Type", "registration_date": "Registration Date", "trip_count": "Total Trips",
+    "total_distance": "Total Distance (km)",
+}
+
+
+@cached("vehicle_info", "trip_info")
+def vehicle_page(search=None, cursor=None, limit=100):
+    # (DataFrame of one page of vehicles with their totals, next page cursor)
+    with get_pool().reader() as conn:
+        page = queries.vehicle_page(conn, limit=limit, cursor=cursor, vehicle_search=search)
+    df = pd.DataFrame(page["items"], columns=queries.VEHICLE_COLUMNS)
+    return df.drop(columns="vehicle_id").rename(columns=VEHICLE_LABELS), page["next_cursor"]
+
+
+@cached("trip_info")
+def trip_page(date_from, date_to, search=None, cursor=None, limit=100):
+    # (DataFrame of one page of trips, newest first, next page cursor)
+    return trip_page_between(limit, cursor, date_from, date_to, vehicle_search=search)
+
+
+@cached("trip_info")
+def trip_count(date_from, date_to, search=None):
+    return count_trips_between(date_from, date_to, vehicle_search=search)
+
+
+@cached("trip_info")
+def trip_dates():
+    # (first, last) trip date as date objects, or (None, None) with no trips
+    first, last = trip_date_bounds()
+    if first is None:
+        return None, None
+    return pd.to_datetime(first).date(), pd.to_datetime(last).date()
+
+
+@cached("trip_info")
+def fuel_history(date_from=None, date_to=None, vehicle_number=None):
+    df = query_trips(["trip_id", "trip_date", "vehicle_number", "fuel_consumption"], date_from, date_to,
+                     vehicle_number)
+    df = df.iloc[::-1].reset_index(drop=True)
+    df["trip_date"] = pd.to_datetime(df["trip_date"])
+    return df
+
+
+@cached("trip_info")
+def fleet_daily(date_from=None, date_to=None):
+    return get_fleet_daily(date_from, date_to)
+
+
+@cached("trip_info")
+def fuel_stats(date_from=None, date_to=None):
+    return fuel_stats_between(date_from, date_to)
+
+
+@cached("trip_info")
+def fleet_totals():
+    return get_fleet_totals()
+
+
+@cached("trip_info")
+def trip_stats(trip_id):
+    return get_trip_stats(trip_id)
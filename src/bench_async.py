@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from realtime_simp import make_trip
+
+# Mixed read/write load against the sync API (api.py) and the async one
+# (api_async.py), each served by uvicorn in its own process over a copy of
+# the same synthetic database.
+#
+#   python bench_async.py --trips 200000 --concurrency 8 32 128 --duration 10
+#
+# Closed loop: `concurrency` clients each send a request as soon as their
+# last one finished, so requests/second is what the server sustains and the
+# latency percentiles include any queueing inside it. 503s (backpressure)
+# are counted separately from errors and left out of the latencies.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS = {"sync": "api:app", "async": "api_async:app"}
+MIX = (("GET /trips", 0.55), ("GET /trips vehicle", 0.15), ("GET /analytics", 0.15), ("POST /add_trip", 0.15))
+
+
+def build_db(path, trips, seed):
+    from db_pool import connect
+    from synth import generate
+
+    conn = connect(path)
+    generate(conn, vehicles=max(20, trips // 500), trips=trips, start_date="2024-01-01", days=365,
+             regions=["rajasthan", "north"], seed=seed)
+    vehicles = [v for v, in conn.execute("SELECT vehicle_number FROM vehicle_info")]
+    conn.close()
+    return vehicles
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(target, db_path):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning",
+         "--no-access-log"],
+        cwd=BASE_DIR, env={**os.environ, "FLEETSTAT_DB": db_path},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(url + "/analytics", timeout=1)
+            return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{target} did not start")
+
+
+async def client_loop(client, vehicles, rng, stop_at, samples):
+    kinds, weights = zip(*MIX)
+    while time.perf_counter() < stop_at:
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "GET /trips":
+            request = client.get("/trips", params={"limit": 100, "order": "-trip_date"})
+        elif kind == "GET /trips vehicle":
+            request = client.get("/trips", params={"limit": 100, "vehicle_number": rng.choice(vehicles)})
+        elif kind == "GET /analytics":
+            request = client.get("/analytics")
+        else:
+            request = client.post("/add_trip", json=make_trip(rng.choice(vehicles), "Truck", rng))
+        t0 = time.perf_counter()
+        try:
+            status = (await request).status_code
+        except httpx.HTTPError:
+            status = 0
+        samples.append((kind, status, time.perf_counter() - t0))
+        if status == 503:
+            await asyncio.sleep(0.05)
+
+
+async def run_level(url, vehicles, concurrency, duration, seed):
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        stop_at = started + duration
+        await asyncio.gather(*(client_loop(client, vehicles, random.Random(seed + i), stop_at, samples)
+                               for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = np.array([t for _, status, t in samples if status == 200])
+    writes = np.array([t for kind, status, t in samples if status == 200 and kind.startswith("POST")])
+    pct = lambda a, q: round(float(np.percentile(a, q)) * 1000, 2) if len(a) else None
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "rps": round(len(ok) / elapsed, 1),
+        "p50_ms": pct(ok, 50), "p95_ms": pct(ok, 95), "p99_ms": pct(ok, 99),
+        "write_p99_ms": pct(writes, 99),
+        "rejected_503": sum(1 for _, status, _ in samples if status == 503),
+        "errors": sum(1 for _, status, _ in samples if status not in (200, 503)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async API under mixed load")
+    parser.add_argument("--trips", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    parser.add_argument("--apps", nargs="+", default=list(APPS), choices=list(APPS))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.db")
+        vehicles = build_db(source, args.trips, args.seed)
+        for name in args.apps:
+            db_path = os.path.join(tmp, f"{name}.db")
+            shutil.copy(source, db_path)
+            proc, url = start_server(APPS[name], db_path)
+            try:
+                results[name] = [asyncio.run(run_level(url, vehicles, c, args.duration, args.seed))
+                                 for c in args.concurrency]
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.trips:,} trips, mix: " + ", ".join(f"{k} {w:.0%}" for k, w in MIX))
+    print(f"{'api':<6}{'conc':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'wr p99':>9}{'503':>7}{'err':>6}")
+    for name, levels in results.items():
+        for r in levels:
+            print(f"{name:<6}{r['concurrency']:>6}{r['rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+                  f"{r['write_p99_ms']!s:>9}{r['rejected_503']:>7}{r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
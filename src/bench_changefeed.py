@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from bench_async import APPS, build_db, start_server
+from realtime_simp import make_trip
+
+# Live dashboard cost: refetching the trip table versus following
+# GET /trips/stream.
+#
+#   python bench_changefeed.py --trips 200000 --clients 50 --writes 200 --rate 20
+#
+# `--clients` streams stay open while trips are posted at `--rate` per
+# second. For each event the time from the POST returning to the event
+# arriving is recorded, as are the bytes each stream receives. One extra
+# client drops halfway through and reconnects with Last-Event-ID at the
+# end; it must see every write exactly once. The baseline is one full
+# refetch of the table (GET /trips/export), which is what a page that
+# reruns SELECT * FROM trip_info pays on every refresh.
+
+
+class Stream:
+    def __init__(self, name):
+        self.name = name
+        self.last_id = None
+        self.bytes = 0
+        self.seen = {}          # start_location token -> arrival time
+        self.duplicates = 0
+        self.reloads = 0
+
+    async def follow(self, client, stop, params=None):
+        headers = {"Last-Event-ID": str(self.last_id)} if self.last_id is not None else {}
+        async with client.stream("GET", "/trips/stream", params=params, headers=headers) as response:
+            event = {}
+            async for line in response.aiter_lines():
+                self.bytes += len(line) + 1
+                if line.startswith("id: "):
+                    event["id"] = int(line[4:])
+                elif line.startswith("data: "):
+                    event["data"] = json.loads(line[6:])
+                elif not line and "id" in event:
+                    self.last_id = event["id"]
+                    data = event["data"]
+                    if data["op"] == "reload":
+                        self.reloads += 1
+                    elif data["op"] == "insert":
+                        token = data["trip"]["start_location"]
+                        if token in self.seen:
+                            self.duplicates += 1
+                        self.seen[token] = time.perf_counter()
+                    event = {}
+                if stop.is_set():
+                    return
+
+
+async def run(url, vehicles, clients, writes, rate, seed):
+    rng = random.Random(seed)
+    limits = httpx.Limits(max_connections=clients + 10)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=httpx.Timeout(60, read=None)) as client:
+        # baseline: one full refetch
+        t0 = time.perf_counter()
+        refetch_bytes = len((await client.get("/trips/export", params={"format": "ndjson"})).content)
+        refetch_s = time.perf_counter() - t0
+
+        stop, stop_early = asyncio.Event(), asyncio.Event()
+        streams = [Stream(f"client-{i}") for i in range(clients)]
+        tasks = [asyncio.create_task(s.follow(client, stop)) for s in streams]
+        resuming = Stream("resuming")
+        first_leg = asyncio.create_task(resuming.follow(client, stop_early))
+        await asyncio.sleep(1.0)            # let every stream subscribe
+
+        posted = {}
+        for i in range(writes):
+            trip = make_trip(rng.choice(vehicles), "Truck", rng)
+            trip["start_location"] = f"bench-{i}"
+            await client.post("/add_trip", json=trip)
+            posted[trip["start_location"]] = time.perf_counter()
+            if i == writes // 2:
+                stop_early.set()
+            await asyncio.sleep(1 / rate)
+        await first_leg
+
+        deadline = time.perf_counter() + 10
+        while time.perf_counter() < deadline and any(len(s.seen) < writes for s in streams):
+            await asyncio.sleep(0.1)
+        stop.set()
+        # streams are idle now; closing the client cancels them
+        for task in tasks:
+            task.cancel()
+        first_half = len(resuming.seen)
+
+        resume_stop = asyncio.Event()
+        second_leg = asyncio.create_task(resuming.follow(client, resume_stop))
+        deadline = time.perf_counter() + 10
+        while time.perf_counter() < deadline and len(resuming.seen) < writes:
+            await asyncio.sleep(0.05)
+        second_leg.cancel()
+
+    latencies = np.array([max(0.0, s.seen[token] - posted[token]) for s in streams for token in s.seen
+                          if token in posted])
+    delivered = sum(len(s.seen) for s in streams)
+    stream_bytes = sum(s.bytes for s in streams)
+    return {
+        "refetch_bytes": refetch_bytes,
+        "refetch_ms": round(refetch_s * 1000, 1),
+        "delivered": delivered,
+        "expected": clients * writes,
+        "duplicates": sum(s.duplicates for s in streams),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 1),
+        "bytes_per_event": round(stream_bytes / max(delivered, 1)),
+        "resume_first_leg": first_half,
+        "resume_total": len(resuming.seen),
+        "resume_duplicates": resuming.duplicates,
+        "resume_reloads": resuming.reloads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trip change stream versus table refetches")
+    parser.add_argument("--trips", type=int, default=200000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="trips posted per second")
+    parser.add_argument("--app", default="sync", choices=list(APPS))
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "FleetStat.db")
+        vehicles = build_db(db_path, args.trips, args.seed)
+        proc, url = start_server(APPS[args.app], db_path)
+        try:
+            r = asyncio.run(run(url, vehicles, args.clients, args.writes, args.rate, args.seed))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    print(f"{args.trips:,} trips, {args.clients} streams ({args.app} API), "
+          f"{args.writes} trips posted at {args.rate:g}/s")
+    print(f"  full refetch:   {r['refetch_bytes']:,} bytes, {r['refetch_ms']} ms per refresh")
+    print(f"  stream:         {r['bytes_per_event']:,} bytes per event per client, "
+          f"{r['delivered']:,}/{r['expected']:,} delivered, {r['duplicates']} duplicates")
+    print(f"  POST -> event:  p50 {r['p50_ms']} ms, p99 {r['p99_ms']} ms")
+    print(f"  resume:         {r['resume_first_leg']} before the drop, {r['resume_total']}/{args.writes} "
+          f"after reconnecting, {r['resume_duplicates']} duplicates, {r['resume_reloads']} reloads")
+
+
+if __name__ == "__main__":
+    main()
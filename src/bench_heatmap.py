@@ -0,0 +1,43 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from visualize import DEFAULT_ZOOM, bin_points, cell_size_for_zoom, generate_trip_heatmap
+
+# Points shipped to the browser, page size and build time: every raw point
+# (generate_trip_heatmap(df, aggregate=False)) vs grid-binned cells.
+
+def synthetic_trips(n, seed=7):
+    rng = np.random.default_rng(seed)
+    # a handful of depots with trips scattered around them
+    depots = np.array([[26.91, 75.79], [28.61, 77.21], [19.08, 72.88], [12.97, 77.59], [22.57, 88.36]])
+    start = depots[rng.integers(0, len(depots), n)] + rng.normal(0, 0.4, (n, 2))
+    end = start + rng.normal(0, 1.2, (n, 2))
+    return pd.DataFrame({"lat_start": start[:, 0], "lon_start": start[:, 1],
+                         "lat_end": end[:, 0], "lon_end": end[:, 1]})
+
+def measure(df, aggregate, zoom):
+    t0 = time.perf_counter()
+    m = generate_trip_heatmap(df, aggregate=aggregate, zoom=zoom)
+    t1 = time.perf_counter()
+    html = m.get_root().render()
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1, len(html)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Heatmap point-count / latency comparison")
+    parser.add_argument("--trips", type=int, nargs="+", default=[10000, 100000, 400000])
+    parser.add_argument("--zoom", type=int, default=DEFAULT_ZOOM)
+    args = parser.parse_args()
+
+    print(f"{'trips':>8} {'mode':<7} {'points':>8} {'build s':>8} {'render s':>9} {'html MB':>8}")
+    for n in args.trips:
+        df = synthetic_trips(n)
+        cells = len(bin_points(np.r_[df.lat_start, df.lat_end], np.r_[df.lon_start, df.lon_end],
+                               cell_size_for_zoom(args.zoom)))
+        for aggregate, points in ((False, 2 * n), (True, cells)):
+            build, render, size = measure(df, aggregate, args.zoom)
+            mode = "binned" if aggregate else "raw"
+            print(f"{n:>8} {mode:<7} {points:>8} {build:>8.3f} {render:>9.3f} {size / 1e6:>8.2f}")
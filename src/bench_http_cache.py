@@ -0,0 +1,91 @@
+import argparse
+import os
+import tempfile
+import time
+
+# Dashboard polling cost with and without conditional GETs and compression.
+#
+#   python bench_http_cache.py --trips 100000 --polls 200 --write-every 20
+#
+# A client polls GET /trips, /vehicles and /analytics in a loop while a trip
+# is added every --write-every polls. Three clients are compared: one that
+# sends neither Accept-Encoding nor validators, one that accepts gzip, and one
+# that also sends If-None-Match with the last ETag. Bytes are counted on the
+# wire (compressed), and time is the in-process request time.
+
+URLS = ["/trips?limit=100&order=-trip_date", "/vehicles?limit=100", "/analytics"]
+
+
+def poll(client, polls, write_every, gzip, etags, make_trip):
+    sent = received = 0
+    not_modified = 0
+    tags = {}
+    started = time.perf_counter()
+    for i in range(polls):
+        if write_every and i and i % write_every == 0:
+            client.post("/add_trip", json=make_trip())
+        for url in URLS:
+            headers = {"Accept-Encoding": "gzip" if gzip else "identity"}
+            if etags and url in tags:
+                headers["If-None-Match"] = tags[url]
+            response = client.get(url, headers=headers)
+            assert response.status_code in (200, 304), response.status_code
+            received += response.num_bytes_downloaded
+            sent += 1
+            if response.status_code == 304:
+                not_modified += 1
+            if "etag" in response.headers:
+                tags[url] = response.headers["etag"]
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": sent,
+        "bytes_per_request": round(received / sent),
+        "ms_per_request": round(elapsed / sent * 1000, 3),
+        "not_modified": not_modified,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polling cost with ETags and compression")
+    parser.add_argument("--trips", type=int, default=100000)
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--write-every", type=int, default=20, help="add a trip every N polls (0: never)")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["FLEETSTAT_DB"] = os.path.join(tmp, "FleetStat.db")
+        from random import Random
+        from db_pool import connect, get_pool
+        from synth import generate
+        from realtime_simp import make_trip
+        from fastapi.testclient import TestClient
+        from api import app
+
+        conn = connect(os.environ["FLEETSTAT_DB"])
+        generate(conn, vehicles=max(20, args.trips // 500), trips=args.trips, start_date="2024-01-01",
+                 days=365, regions=["rajasthan", "north"], seed=args.seed)
+        vehicle, = conn.execute("SELECT vehicle_number FROM vehicle_info LIMIT 1").fetchone()
+        conn.close()
+        rng = Random(args.seed)
+        new_trip = lambda: make_trip(vehicle, "Truck", rng)
+
+        with TestClient(app) as client:
+            results = {
+                "plain": poll(client, args.polls, args.write_every, False, False, new_trip),
+                "gzip": poll(client, args.polls, args.write_every, True, False, new_trip),
+                "gzip + etag": poll(client, args.polls, args.write_every, True, True, new_trip),
+            }
+        get_pool().close()
+
+    base = results["plain"]
+    print(f"{args.trips:,} trips, {args.polls} polls of {len(URLS)} endpoints, a write every {args.write_every} polls")
+    print(f"{'client':<14}{'bytes/req':>11}{'ms/req':>9}{'304s':>7}{'bytes vs plain':>16}{'time vs plain':>15}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['bytes_per_request']:>11,}{r['ms_per_request']:>9}{r['not_modified']:>7}"
+              f"{r['bytes_per_request'] / base['bytes_per_request']:>15.1%}"
+              f"{r['ms_per_request'] / base['ms_per_request']:>15.1%}")
+
+
+if __name__ == "__main__":
+    main()
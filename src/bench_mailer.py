@@ -0,0 +1,160 @@
+import argparse
+import os
+import smtplib
+import socketserver
+import tempfile
+import threading
+import time
+
+# Mail throughput against an in-process SMTP sink: one SMTP session per
+# message (what sending from the page inline would do) versus mailer.py's
+# queue with a persistent session.
+#
+#   python bench_mailer.py --messages 2000 --connect-ms 30
+#
+# --connect-ms delays the sink's greeting to stand in for the TCP + TLS +
+# AUTH round trips of a real provider, which is what a session per message
+# pays every time. Recipients starting with "bounce" get a 550 and ones
+# starting with "later" a 451 on their first attempt, to check that
+# permanent and temporary failures end up failed and retried. On a
+# recipient starting with "drop" the sink hangs up, the first time only.
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        sink = self.server
+        with sink.lock:
+            sink.connections += 1
+        time.sleep(sink.connect_delay)
+        self.reply("220 sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-sink\r\n250 SIZE 52428800" if verb == "EHLO" else "250 sink")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip(" <>")
+                if address.startswith("bounce"):
+                    self.reply("550 no such user")
+                    continue
+                with sink.lock:
+                    first_try = address not in sink.deferred
+                    sink.deferred.add(address)
+                if address.startswith("drop") and first_try:
+                    return
+                self.reply("451 try again later" if address.startswith("later") and first_try else "250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with sink.lock:
+                    sink.received += 1
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:        # MAIL, RSET, NOOP
+                self.reply("250 ok")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay=0.0):
+        super().__init__(("127.0.0.1", 0), SinkHandler)
+        self.connect_delay = connect_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.received = 0
+        self.deferred = set()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def messages(count, bounce_every=0, later_every=0):
+    for i in range(count):
+        prefix = "owner"
+        if bounce_every and i % bounce_every == bounce_every - 1:
+            prefix = "bounce"
+        elif later_every and i % later_every == later_every - 2:
+            prefix = "later"
+        yield {"recipient": f"{prefix}{i}@example.com", "subject": f"FleetStat report {i}",
+               "body": "Monthly report attached.\n" * 20}
+
+
+def per_message_sessions(port, count):
+    # Baseline: connect, send, quit for every message
+    from mailer import build_message
+
+    started = time.perf_counter()
+    for item in messages(count):
+        item.update(attachment_path=None, attachment_name=None)
+        smtp = smtplib.SMTP("127.0.0.1", port)
+        smtp.send_message(build_message(item, "fleetstat@example.com"), "fleetstat@example.com", [item["recipient"]])
+        smtp.quit()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mail queue throughput against a local SMTP sink")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--connect-ms", type=float, default=30, help="simulated connect/TLS/login latency")
+    parser.add_argument("--rate", type=float, default=0, help="mailer rate limit, msg/s (0: unlimited)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["FLEETSTAT_DB"] = os.path.join(tmp, "FleetStat.db")
+        os.environ["MAIL_FROM"] = "fleetstat@example.com"
+        import mailer
+        from db_pool import get_pool
+
+        sink = SmtpSink(args.connect_ms / 1000)
+        baseline_count = min(args.messages, 300)
+        baseline = per_message_sessions(sink.port, baseline_count)
+        baseline_connections = sink.connections
+
+        # the queue, with some bounces and temporary rejections mixed in
+        mailer.BACKOFF_BASE_S = 0.05
+        t0 = time.perf_counter()
+        mailer.enqueue_many(messages(args.messages, bounce_every=100, later_every=50))
+        enqueue_s = time.perf_counter() - t0
+        session = mailer.SmtpSession("127.0.0.1", sink.port, security="none", user=None, password=None)
+        limiter = mailer.RateLimiter(args.rate, burst=max(1, int(args.rate)))
+        received_before = sink.received
+        t0 = time.perf_counter()
+        totals = {"sent": 0, "retry": 0, "failed": 0}
+        while True:
+            run = mailer.run_mailer(session, limiter, once=True)
+            for key in totals:
+                totals[key] += run[key]
+            if mailer.outbox_status().get("queued", 0) == 0:
+                break
+            time.sleep(0.1)     # deferred messages come due after the (shortened) backoff
+        queue_s = time.perf_counter() - t0
+        status = mailer.outbox_status()
+        sink.shutdown()
+        get_pool().close()
+
+    print(f"{args.messages:,} messages, simulated connect latency {args.connect_ms:g} ms, "
+          f"rate limit {args.rate or 'none'}")
+    print(f"  session per message: {baseline_count / baseline:8.1f} msg/s "
+          f"({baseline_connections} connections for {baseline_count} messages)")
+    print(f"  mailer queue:        {totals['sent'] / queue_s:8.1f} msg/s "
+          f"({session.connections} connections, {sink.received - received_before:,} delivered)")
+    print(f"  enqueue:             {args.messages / enqueue_s:8.0f} msg/s")
+    print(f"  outcome: {totals['sent']:,} sent, {totals['retry']:,} deferred and retried, "
+          f"{totals['failed']:,} failed (bounces); outbox {status}")
+
+
+if __name__ == "__main__":
+    main()
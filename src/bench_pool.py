@@ -0,0 +1,144 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from db_pool import ConnectionPool, connect
+from migrations import migrate
+
+# Read throughput with concurrent writers: the old single shared connection
+# (serialised with a lock, which is the best it can safely do) against the
+# reader pool + dedicated writer in WAL mode.
+
+VEHICLES = [f"RJ{n:02d}AB{n * 37 % 10000:04d}" for n in range(1, 51)]
+
+READ_QUERIES = [
+    ("SELECT * FROM trip_info WHERE vehicle_number = ? ORDER BY trip_date DESC LIMIT 50",
+     lambda: (random.choice(VEHICLES),)),
+    ("SELECT trip_count, total_distance, total_fuel FROM vehicle_rollup WHERE vehicle_number = ?",
+     lambda: (random.choice(VEHICLES),)),
+    ("SELECT * FROM trip_info WHERE trip_id > ? ORDER BY trip_id LIMIT 100",
+     lambda: (random.randint(0, 40000),)),
+]
+
+
+def random_trip():
+    distance = round(random.uniform(5, 500), 1)
+    return (random.choice(VEHICLES), round(distance * random.uniform(0.06, 0.15), 2),
+            f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}", "A", "B",
+            26.9, 75.8, 28.3, 74.9, distance)
+
+
+INSERT_SQL = '''
+    INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
+                           lat_start, lon_start, lat_end, lon_end, distance)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def seed(path, trips):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany(INSERT_SQL, (random_trip() for _ in range(trips)))
+    conn.commit()
+    conn.close()
+
+
+class SharedConnection:
+    # Baseline: the previous api.py setup, one connection for every thread.
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def reader(self):
+        with self.lock:
+            yield self.conn
+
+    @contextmanager
+    def writer(self):
+        with self.lock:
+            yield self.conn
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def run(db, readers, writers, duration, write_rate):
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0}
+    count_lock = threading.Lock()
+
+    def read_loop():
+        n = 0
+        while not stop.is_set():
+            sql, params = random.choice(READ_QUERIES)
+            with db.reader() as conn:
+                conn.execute(sql, params()).fetchall()
+            n += 1
+        with count_lock:
+            counts["reads"] += n
+
+    def write_loop():
+        # Each writer is paced to write_rate trips/s (0 = as fast as possible)
+        n = 0
+        interval = 1.0 / write_rate if write_rate else 0.0
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            with db.writer() as conn:
+                conn.execute(INSERT_SQL, random_trip())
+            n += 1
+            if interval:
+                next_at += interval
+                stop.wait(max(0.0, next_at - time.perf_counter()))
+        with count_lock:
+            counts["writes"] += n
+
+    threads = [threading.Thread(target=read_loop) for _ in range(readers)]
+    threads += [threading.Thread(target=write_loop) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return counts["reads"] / duration, counts["writes"] / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FleetStat connection pool benchmark")
+    parser.add_argument("--trips", type=int, default=50000)
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--write-rate", type=float, default=200.0,
+                        help="trips/s per writer thread, 0 for unthrottled")
+    parser.add_argument("--duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.trips)
+
+        print(f"{'mode':<8}{'readers':>8}{'writers':>8}{'reads/s':>12}{'writes/s':>12}")
+        for readers in args.readers:
+            for mode in ("shared", "pool"):
+                if mode == "shared":
+                    # journal_mode is persistent, so put the file back in
+                    # rollback-journal mode for the baseline run
+                    connect(path).execute("PRAGMA journal_mode = DELETE").connection.close()
+                    db = SharedConnection(path)
+                else:
+                    db = ConnectionPool(path, readers=readers)
+                reads, writes = run(db, readers, args.writers, args.duration, args.write_rate)
+                db.close()
+                print(f"{mode:<8}{readers:>8}{args.writers:>8}{reads:>12.0f}{writes:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
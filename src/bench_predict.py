@@ -0,0 +1,106 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# /predict/fuel latency by batch size, in-process through TestClient, next to
+# the bare vectorised predict; then a hot-swap check: requests keep flowing
+# while new model versions are trained and picked up.
+#
+# Runs against a generated database and model directory in a temp dir.
+
+TMP = tempfile.mkdtemp(prefix="fleetstat-predict-")
+os.environ["FLEETSTAT_DB"] = os.path.join(TMP, "FleetStat.db")
+os.environ["FLEETSTAT_MODEL_DIR"] = os.path.join(TMP, "models")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import fuel_model  # noqa: E402
+from api import app  # noqa: E402
+from db_pool import get_pool  # noqa: E402
+from synth import generate  # noqa: E402
+
+
+def percentiles(times):
+    ms = np.array(times) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def make_batch(rng, numbers, types, size):
+    pick = rng.integers(0, len(numbers), size)
+    return [{"distance": float(d), "vehicle_number": numbers[i], "vehicle_type": types[i]}
+            for d, i in zip(rng.uniform(5, 600, size).round(1), pick)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuel prediction latency benchmark")
+    parser.add_argument("--trips", type=int, default=200000)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--requests", type=int, default=200, help="requests per batch size (fewer for big batches)")
+    args = parser.parse_args()
+
+    with get_pool().writer() as conn:
+        generate(conn, vehicles=max(20, args.trips // 500), trips=args.trips, regions=["rajasthan", "north"])
+    fuel_model.train()
+    with get_pool().reader() as conn:
+        numbers, types = zip(*conn.execute("SELECT vehicle_number, vehicle_type FROM vehicle_info"))
+
+    rng = np.random.default_rng(1)
+    with TestClient(app) as client:
+        print(f"{'batch':>7}{'api p50 ms':>12}{'api p99 ms':>12}{'predict p50':>13}{'predict p99':>13}{'trips/s':>12}")
+        for size in args.batches:
+            n = max(10, min(args.requests, args.requests * 100 // size))
+            body = {"trips": make_batch(rng, numbers, types, size)}
+            model = fuel_model.get_model_holder().get()
+            api_times, model_times = [], []
+            for _ in range(n):
+                t0 = time.perf_counter()
+                response = client.post("/predict/fuel", json=body)
+                api_times.append(time.perf_counter() - t0)
+                assert response.status_code == 200, response.text
+                t0 = time.perf_counter()
+                fuel_model.predict_fuel([t["distance"] for t in body["trips"]],
+                                        [t["vehicle_type"] for t in body["trips"]],
+                                        [t["vehicle_number"] for t in body["trips"]], model=model)
+                model_times.append(time.perf_counter() - t0)
+            api50, api99 = percentiles(api_times)
+            m50, m99 = percentiles(model_times)
+            print(f"{size:>7}{api50:>12.2f}{api99:>12.2f}{m50:>13.3f}{m99:>13.3f}{size / np.median(api_times):>12.0f}")
+
+        # hot swap: keep posting while two new versions are trained
+        holder = fuel_model.get_model_holder()
+        holder.check_interval = 0.05
+        stop = threading.Event()
+        seen, failures, sent = set(), [], [0]
+        body = {"trips": make_batch(rng, numbers, types, 100)}
+
+        def hammer():
+            while not stop.is_set():
+                response = client.post("/predict/fuel", json=body)
+                sent[0] += 1
+                if response.status_code == 200:
+                    seen.add(response.json()["model_version"])
+                else:
+                    failures.append(response.status_code)
+
+        worker = threading.Thread(target=hammer)
+        worker.start()
+        for _ in range(2):
+            time.sleep(0.3)
+            fuel_model.train(full=True)
+        time.sleep(0.5)
+        stop.set()
+        worker.join()
+        print(f"hot swap: {sent[0]} requests, {len(failures)} failed, versions served: {', '.join(sorted(seen))}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        get_pool().close()
+        shutil.rmtree(TMP, ignore_errors=True)
@@ -0,0 +1,116 @@
+import argparse
+import math
+import os
+import sqlite3
+import tempfile
+import time
+
+import folium
+import numpy as np
+import polyline
+
+from migrations import migrate
+from trip_routes import MAX_ZOOM, ZOOM_LEVELS, load_route_for_map, pixel_degrees, store_route
+
+# Trip map cost: decoding the provider's encoded polyline and drawing every
+# vertex (what View Trips did on each rerun) versus drawing the stored route
+# at the zoom the map opens at.
+#
+#   python bench_routes.py --points 2000 20000 100000
+#
+# Routes are synthetic roads from Jaipur to Delhi (about 280 km) with
+# `--points` vertices. Timings cover getting the points and rendering the
+# Folium map to HTML; the HTML size is what the browser then has to parse
+# and draw. The check column is the largest distance, in screen pixels at
+# the opening zoom, from any original vertex to the drawn line.
+
+START, END = (26.9124, 75.7873), (28.6139, 77.2090)
+MAP_WIDTH, MAP_HEIGHT = 700, 500
+
+
+def synthetic_route(n, seed=7):
+    # A road that wanders around the straight line with bends on several scales
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, n)
+    line = np.outer(1 - t, START) + np.outer(t, END)
+    normal = np.array([END[1] - START[1], -(END[0] - START[0])])
+    normal /= np.linalg.norm(normal)
+    offset = sum(amplitude * np.sin(2 * np.pi * (cycles * t + rng.random()))
+                 for cycles, amplitude in ((3, 0.08), (40, 0.01), (400, 0.001)))
+    offset += np.cumsum(rng.normal(0, 0.00004, n))
+    offset -= offset[0] + (offset[-1] - offset[0]) * t     # start and end on the cities
+    return np.round(line + offset[:, None] * normal, 5)
+
+
+def render(points):
+    m = folium.Map(location=[(START[0] + END[0]) / 2, (START[1] + END[1]) / 2], zoom_start=7)
+    folium.Marker(list(START), tooltip="Start").add_to(m)
+    folium.Marker(list(END), tooltip="End").add_to(m)
+    folium.PolyLine(points, color="blue", weight=4).add_to(m)
+    return m.get_root().render()
+
+
+def max_error_px(original, drawn, zoom):
+    # Largest distance from an original vertex to the drawn polyline, in pixels
+    scale = math.cos(math.radians(float(original[:, 0].mean())))
+    a = np.column_stack((original[:, 1] * scale, original[:, 0]))
+    b = np.column_stack((drawn[:, 1] * scale, drawn[:, 0]))
+    worst = 0.0
+    for chunk in np.array_split(a, max(1, len(a) // 2000)):
+        p, q = b[:-1], b[1:]
+        d = q - p
+        length2 = np.maximum((d ** 2).sum(axis=1), 1e-18)
+        t = np.clip(((chunk[:, None, :] - p) * d).sum(axis=2) / length2, 0, 1)
+        dist = np.sqrt((((p + t[..., None] * d) - chunk[:, None, :]) ** 2).sum(axis=2)).min(axis=1)
+        worst = max(worst, float(dist.max()))
+    return worst / pixel_degrees(zoom, float(original[:, 0].mean()))
+
+
+def timed(fn, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stored, simplified trip routes versus drawing every vertex")
+    parser.add_argument("--points", type=int, nargs="+", default=[2000, 20000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "FleetStat.db"))
+        migrate(conn)
+        print(f"{'vertices':>9} {'polyline':>10} {'stored':>10} {'store':>8} "
+              f"{'decode+draw':>12} {'html':>9} {'stored+draw':>12} {'html':>9} {'drawn':>7} {'error':>8}")
+        for trip_id, n in enumerate(args.points, start=1):
+            route = synthetic_route(n)
+            encoded = polyline.encode([tuple(p) for p in route.tolist()])
+
+            t0 = time.perf_counter()
+            store_route(conn, trip_id, route)
+            conn.commit()
+            store_s = time.perf_counter() - t0
+            stored_bytes = conn.execute("SELECT SUM(length(points)) FROM trip_route WHERE trip_id = ?",
+                                        (trip_id,)).fetchone()[0]
+
+            baseline_s, baseline_html = timed(lambda: render(polyline.decode(encoded)), args.repeat)
+
+            def stored():
+                zoom, points = load_route_for_map(conn, trip_id, MAP_WIDTH, MAP_HEIGHT)
+                return zoom, points, render(points.tolist())
+            stored_s, (zoom, drawn, stored_html) = timed(stored, args.repeat)
+            error = max_error_px(route, drawn.astype(np.float64), zoom)
+
+            print(f"{n:>9,} {len(encoded):>10,} {stored_bytes:>10,} {store_s * 1000:>6.1f}ms "
+                  f"{baseline_s * 1000:>10.1f}ms {len(baseline_html):>9,} "
+                  f"{stored_s * 1000:>10.1f}ms {len(stored_html):>9,} {len(drawn):>7,} {error:>6.2f}px")
+        print(f"  opening zoom {zoom} of {MAX_ZOOM}; levels stored for zooms {', '.join(map(str, ZOOM_LEVELS))}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Loading trip columns for analytics: pd.read_sql_query over trip_info vs the
+# memory-mapped Parquet snapshot, cold (first read in a fresh process) and
+# warm (repeated reads in one process); plus full vs incremental export.
+#
+# Runs against a generated database and snapshot in a temp dir.
+
+CASES = {
+    "sql 4 cols": ("sql", ["trip_id", "vehicle_number", "distance", "fuel_consumption"]),
+    "sql all cols": ("sql", None),
+    "snapshot 4 cols": ("snapshot", ["trip_id", "vehicle_number", "distance", "fuel_consumption"]),
+    "snapshot all cols": ("snapshot", None),
+}
+
+
+def load(case):
+    import snapshot
+    from analytics import load_trips
+    source, columns = CASES[case]
+    if source == "snapshot":
+        return snapshot.read_trips(columns)
+    return load_trips(columns or snapshot.TRIP_SCHEMA.names, "sql")
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL vs Parquet snapshot load times")
+    parser.add_argument("--trips", type=int, default=1000000)
+    parser.add_argument("--append", type=int, default=10000, help="trips added before the incremental export")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cold", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold:
+        # child process: one first-time load, seconds on stdout
+        print(timed(load, args.cold))
+        return
+
+    tmp = tempfile.mkdtemp(prefix="fleetstat-snapshot-")
+    os.environ["FLEETSTAT_DB"] = os.path.join(tmp, "FleetStat.db")
+    os.environ["FLEETSTAT_SNAPSHOT_DIR"] = os.path.join(tmp, "snapshot")
+    try:
+        import analytics
+        import snapshot
+        from db_handler import insert_trips_bulk
+        from db_pool import get_pool
+        from realtime_simp import make_trip
+        from synth import generate
+
+        with get_pool().writer() as conn:
+            generate(conn, vehicles=max(20, args.trips // 500), trips=args.trips, regions=["rajasthan", "north"])
+
+        full = snapshot.export_snapshot(full=True)
+        insert_trips_bulk([make_trip(f"RJ01AA{i % 500:04d}", "Truck") for i in range(args.append)])
+        incremental = snapshot.export_snapshot()
+        print(f"export: full {full['seconds']:.2f}s ({full['trips_written']:,} trips), "
+              f"{incremental['mode']} {incremental['seconds']:.2f}s ({incremental['trips_written']:,} trips)")
+        size = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(snapshot.SNAPSHOT_DIR) for f in fs)
+        print(f"sizes: sqlite {os.path.getsize(os.environ['FLEETSTAT_DB']) / 1e6:.0f} MB, snapshot {size / 1e6:.0f} MB")
+
+        print(f"{'case':<20}{'cold s':>10}{'warm s':>10}")
+        for case in CASES:
+            cold = float(subprocess.run([sys.executable, os.path.abspath(__file__), "--cold", case],
+                                        capture_output=True, text=True, check=True, env=os.environ).stdout)
+            warm = np.median([timed(load, case) for _ in range(args.repeat)])
+            print(f"{case:<20}{cold:>10.3f}{warm:>10.3f}")
+
+        for source in ("sql", "snapshot"):
+            seconds = np.median([timed(analytics.get_trip_analytics, source) for _ in range(args.repeat)])
+            print(f"get_trip_analytics({source!r}): {seconds:.3f}s")
+        get_pool().close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
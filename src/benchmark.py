@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Reproducible end-to-end benchmark: ingestion, analytics, dashboard page
+# queries and API endpoints against fixed-seed databases of several sizes.
+#
+#   python benchmark.py --scales 10k 100k 1m --output results.json
+#   python benchmark.py --scales 10k --compare results.json --threshold 0.25
+#
+# Each scale runs in its own subprocess with FLEETSTAT_DB pointing at a
+# scratch copy of the dataset, so module-level pools and caches start cold
+# and the cached dataset file is never modified. --compare exits with status
+# 1 when any case is slower than the baseline by more than --threshold.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCALES = {"10k": 10000, "100k": 100000, "1m": 1000000}
+
+MIN_TIME = 1.0        # seconds of repeats per case (at least one run)
+MAX_RUNS = 30
+NOISE_FLOOR_S = 0.0005  # ignore regressions smaller than this in absolute terms
+DATASET_VERSION = 2     # part of the cached dataset's file name; bump when the generator changes
+
+
+# ---------- Dataset ----------
+
+def build_dataset(path, trips, seed):
+    # Fixed-seed fleet of one vehicle per ~500 trips over one year
+    from db_pool import connect
+    from synth import generate
+
+    conn = connect(path)
+    generate(conn, vehicles=max(20, trips // 500), trips=trips, start_date="2024-01-01", days=365,
+             regions=["rajasthan", "north"], seed=seed)
+    conn.close()
+
+
+def dataset_path(data_dir, trips, seed):
+    path = os.path.join(data_dir, f"bench_{trips}_{seed}_v{DATASET_VERSION}.db")
+    if not os.path.exists(path):
+        print(f"building {trips} trip dataset -> {path}", file=sys.stderr)
+        t0 = time.perf_counter()
+        build_dataset(path + ".tmp", trips, seed)
+        os.replace(path + ".tmp", path)
+        print(f"  built in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return path
+
+
+# ---------- Timing ----------
+
+def measure(fn, setup=None, min_time=MIN_TIME, max_runs=MAX_RUNS):
+    times = []
+    while not times or (sum(times) < min_time and len(times) < max_runs):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {
+        "median_s": float(np.median(times)),
+        "min_s": float(min(times)),
+        "runs": len(times),
+    }
+
+
+# ---------- Cases (run inside the per-scale subprocess) ----------
+
+def read_cases(trips):
+    import analytics
+    import app_data
+    import visualize
+    from db_handler import view_trips
+    from db_pool import get_pool
+    from fastapi.testclient import TestClient
+    from api import app
+
+    client = TestClient(app)
+    with get_pool().reader() as conn:
+        vehicle, = conn.execute("SELECT vehicle_number FROM trip_info WHERE trip_id = 1").fetchone()
+    trips_df = view_trips()
+    year = app_data.trip_dates()
+
+    def get(url):
+        def call():
+            response = client.get(url)
+            response.raise_for_status()
+            response.content
+        return call
+
+    def cold(loader, *args):
+        # page data without the app_data cache in front of it
+        return lambda: loader(*args), app_data.cache.clear
+
+    cases = {
+        "analytics.get_trip_analytics": (analytics.get_trip_analytics, None),
+        "analytics.get_fleet_totals": (analytics.get_fleet_totals, None),
+        "analytics.get_vehicle_totals": (analytics.get_vehicle_totals, None),
+        "analytics.get_trip_stats": (lambda: analytics.get_trip_stats(trips // 2), None),
+        "db_handler.view_trips": (view_trips, None),
+        "visualize.generate_trip_heatmap": (lambda: visualize.generate_trip_heatmap(trips_df), None),
+        "visualize.fleet_heatmap_cells": (visualize.fleet_heatmap_cells, visualize._cell_cache.clear),
+        # SQL behind each app.py page
+        "page.dashboard": cold(app_data.fleet_totals),
+        "page.add_vehicle": cold(app_data.vehicles),
+        "page.add_trip": cold(app_data.trip, trips // 2),
+        "page.view_vehicles": cold(app_data.vehicle_page),
+        "page.view_vehicles search": cold(app_data.vehicle_page, vehicle[-5:]),
+        "page.view_trips": cold(lambda: (app_data.trip_count(*year), app_data.trip_page(*year))),
+        "page.view_trips search": cold(lambda: (app_data.trip_count(*year, vehicle[-5:]),
+                                                app_data.trip_page(*year, vehicle[-5:]))),
+        "page.per_trip_analytics": cold(lambda: app_data.fleet_daily(*year)),
+        "page.per_trip_analytics vehicle": cold(app_data.fuel_history, *year, vehicle),
+        "page.cached_rerun": (lambda: app_data.trip_page(*year), None),
+        # API endpoints
+        "api.GET /vehicles": (get("/vehicles?limit=100"), None),
+        "api.GET /vehicles/export": (get("/vehicles/export?format=ndjson"), None),
+        "api.GET /trips": (get("/trips?limit=100"), None),
+        "api.GET /trips deep page": (get(f"/trips?limit=100&order=-trip_date&date_to=2024-03-01"), None),
+        "api.GET /trips vehicle": (get(f"/trips?limit=100&vehicle_number={vehicle}"), None),
+        "api.GET /trips bbox": (get("/trips?limit=100&bbox=75.5,26.5,76.0,27.2"), None),
+        "api.GET /trips/export vehicle": (get(f"/trips/export?format=csv&vehicle_number={vehicle}"), None),
+        "api.GET /analytics": (get("/analytics"), None),
+    }
+    return cases, client
+
+
+def write_cases(trips, seed):
+    from db_handler import insert_trip, insert_trips_bulk, insert_vehicle
+    from realtime_simp import make_trip
+    from random import Random
+
+    from fastapi.testclient import TestClient
+    from api import app
+
+    client = TestClient(app)
+    rng = Random(seed)
+    counter = iter(range(10 ** 9))
+    bulk = [make_trip("BM000001", "Truck", rng) for _ in range(1000)]
+
+    def post(url, make_body):
+        def call():
+            client.post(url, json=make_body()).raise_for_status()
+        return call
+
+    vehicle_body = lambda: {
+        "vehicle_name": "Bench", "vehicle_number": f"BMNEW{next(counter)}", "owner_name": "Bench",
+        "vehicle_type": "Car", "registration_date": "2024-01-01",
+    }
+    cases = {
+        "db_handler.insert_trip": (lambda: insert_trip(**make_trip("BM000001", "Truck", rng)), None),
+        "db_handler.insert_vehicle": (lambda: insert_vehicle(**vehicle_body()), None),
+        "db_handler.insert_trips_bulk x1000": (lambda: insert_trips_bulk(bulk), None),
+        "api.POST /add_trip": (post("/add_trip", lambda: make_trip("BM000001", "Truck", rng)), None),
+        "api.POST /add_vehicle": (post("/add_vehicle", vehicle_body), None),
+        "api.POST /trips/bulk x1000": (post("/trips/bulk", lambda: bulk), None),
+    }
+    return cases, client
+
+
+def run_scale(trips, seed, min_time, only):
+    # Subprocess entry: FLEETSTAT_DB is already set
+    results = {}
+    for make in (lambda: read_cases(trips), lambda: write_cases(trips, seed)):
+        cases, client = make()
+        for name, (fn, setup) in cases.items():
+            if only and not any(word in name for word in only):
+                continue
+            results[name] = measure(fn, setup, min_time)
+            print(f"  {name:<40}{results[name]['median_s'] * 1000:>12.3f} ms", file=sys.stderr)
+        client.close()
+    return results
+
+
+# ---------- Comparison ----------
+
+def compare(baseline, current, threshold):
+    # Returns a list of (scale, case, old s, new s, ratio, verdict)
+    rows = []
+    for scale, cases in current["results"].items():
+        old_cases = baseline.get("results", {}).get(scale, {})
+        for name, result in cases.items():
+            if name not in old_cases:
+                continue
+            old, new = old_cases[name]["median_s"], result["median_s"]
+            ratio = new / old if old else float("inf")
+            verdict = ""
+            if ratio > 1 + threshold and new - old > NOISE_FLOOR_S:
+                verdict = "REGRESSION"
+            elif ratio < 1 - threshold and old - new > NOISE_FLOOR_S:
+                verdict = "faster"
+            rows.append((scale, name, old, new, ratio, verdict))
+    return rows
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FleetStat benchmark suite")
+    parser.add_argument("--scales", nargs="+", default=list(SCALES), help="10k, 100k, 1m or a number of trips")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "fleetstat-bench"),
+                        help="where generated datasets are cached between runs")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds of repeats per case")
+    parser.add_argument("--only", nargs="+", help="run only cases whose name contains one of these")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--trips", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_scale(args.trips, args.seed, args.min_time, args.only), sys.stdout)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+    for scale in args.scales:
+        trips = SCALES.get(scale.lower()) or int(scale)
+        source = dataset_path(args.data_dir, trips, args.seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            work = os.path.join(tmp, "FleetStat.db")
+            shutil.copy(source, work)
+            print(f"{trips} trips", file=sys.stderr)
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--trips", str(trips),
+                   "--seed", str(args.seed), "--min-time", str(args.min_time)]
+            if args.only:
+                cmd += ["--only", *args.only]
+            out = subprocess.run(cmd, cwd=BASE_DIR, env={**os.environ, "FLEETSTAT_DB": work},
+                                 stdout=subprocess.PIPE, text=True, check=True).stdout
+            report["results"][str(trips)] = json.loads(out)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.threshold)
+        print(f"{'trips':>8}  {'case':<40}{'base ms':>12}{'now ms':>12}{'ratio':>8}")
+        for scale, name, old, new, ratio, verdict in rows:
+            print(f"{scale:>8}  {name:<40}{old * 1000:>12.3f}{new * 1000:>12.3f}{ratio:>8.2f}  {verdict}")
+        regressions = [row for row in rows if row[-1] == "REGRESSION"]
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%} against {args.compare}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+from bisect import bisect_right
+
+from queries import TRIP_COLUMNS
+
+# Trip change feed.
+#
+# Triggers append one row per inserted, updated or deleted trip to
+# trip_changes. Its seq (AUTOINCREMENT, so never reused, even after pruning)
+# is the watermark clients resume from. GET /trips/stream serves the log as
+# Server-Sent Events:
+#
+#   id: 812345
+#   event: insert                  insert | update | delete | reload
+#   data: {"seq": 812345, "op": "insert", "trip_id": 90211, "vehicle_number": "RJ14AB1234",
+#          "changed_at": "...", "trip": {...current row...}}
+#
+# A client loads a first page with GET /trips, then opens the stream. Only
+# changes after that moment are sent, or after ?after=<seq> / the
+# Last-Event-ID header that EventSource sends by itself when it reconnects.
+# insert and update both carry the current row and are upserts on the client
+# side. delete carries only the id. `reload` means the feed cannot describe
+# what happened: a bulk load ran with the triggers off
+# (rollups.triggers_suspended), or the client is further behind than the
+# pruned log. The client then refetches and carries on from that event's id.
+#
+# Each API process runs one ChangeFeed. A single poller reads new log rows
+# (a primary-key range scan) every POLL_INTERVAL_S, or right away when this
+# process wrote a trip. It keeps the last BUFFER_EVENTS events in memory and
+# wakes the streams. A live client therefore costs O(new changes): nothing
+# is read from trip_info except the changed rows, once per process. A client
+# resuming from further back than the buffer reads the log directly, page by
+# page.
+#
+# Trips moved to archive files (partitions.py) are not reported as deleted:
+# they still exist, and dashboards follow recent trips. The log is trimmed
+# by `python changefeed.py prune`, run next to the partitions.py job.
+
+POLL_INTERVAL_S = 0.5
+HEARTBEAT_S = 15            # comment line so proxies keep idle streams open
+RETRY_MS = 3000             # EventSource reconnect delay
+PAGE_SIZE = 500
+BUFFER_EVENTS = 5000
+KEEP_CHANGES = 200000
+
+
+def _log(op, row):
+    return (f"INSERT INTO trip_changes (op, trip_id, vehicle_number) "
+            f"VALUES ('{op}', {row}.trip_id, {row}.vehicle_number);")
+
+
+# migrations.py, version 8
+TRIP_CHANGES = f"""
+CREATE TABLE IF NOT EXISTS trip_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,                   -- insert | update | delete | reload
+    trip_id INTEGER,
+    vehicle_number TEXT,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TRIGGER IF NOT EXISTS trip_changes_insert AFTER INSERT ON trip_info
+BEGIN {_log("insert", "NEW")} END;
+
+CREATE TRIGGER IF NOT EXISTS trip_changes_update AFTER UPDATE ON trip_info
+BEGIN
+    -- a trip moved to another vehicle leaves that vehicle's filtered streams
+    INSERT INTO trip_changes (op, trip_id, vehicle_number)
+    SELECT 'delete', OLD.trip_id, OLD.vehicle_number WHERE OLD.vehicle_number IS NOT NEW.vehicle_number;
+    {_log("update", "NEW")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trip_changes_delete AFTER DELETE ON trip_info
+BEGIN {_log("delete", "OLD")} END;
+"""
+
+# ---------- Log reads ----------
+
+def head_seq(conn):
+    # Last seq handed out (sqlite_sequence survives pruning an empty log)
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'trip_changes'").fetchone()
+    return row[0] if row else 0
+
+
+def read_changes(conn, after, limit=PAGE_SIZE):
+    # (events with seq > after, oldest first, carrying the trip's current
+    # row; last seq read). None if the log no longer reaches back to `after`.
+    rows = conn.execute(f"""
+        SELECT c.seq, c.op, c.trip_id, c.vehicle_number, c.changed_at, t.{', t.'.join(TRIP_COLUMNS)}
+        FROM trip_changes c LEFT JOIN trip_info t ON t.trip_id = c.trip_id AND c.op IN ('insert', 'update')
+        WHERE c.seq > ? ORDER BY c.seq LIMIT ?
+    """, (after, limit)).fetchall()
+    # seqs are gapless (a rolled-back insert rolls back its sequence number
+    # too), so a gap right after `after` means pruning got there first
+    if rows and rows[0][0] > after + 1:
+        return None
+    if not rows and after != head_seq(conn):
+        # ahead of the log (another database), or everything after it pruned;
+        # rows committed since the SELECT above are simply read next time
+        if after > head_seq(conn) or not conn.execute(
+                "SELECT 1 FROM trip_changes WHERE seq > ? LIMIT 1", (after,)).fetchone():
+            return None
+    events = []
+    for seq, op, trip_id, vehicle_number, changed_at, *trip in rows:
+        event = {"seq": seq, "op": op, "trip_id": trip_id, "vehicle_number": vehicle_number,
+                 "changed_at": changed_at}
+        if op in ("insert", "update"):
+            if trip[0] is None:
+                continue        # deleted since (a later event says so) or archived
+            event["trip"] = dict(zip(TRIP_COLUMNS, trip))
+        events.append(event)
+    return events, rows[-1][0] if rows else after
+
+
+def prune_changes(conn, keep=KEEP_CHANGES):
+    # Keep the newest `keep` events; clients further behind get a reload
+    return conn.execute("DELETE FROM trip_changes WHERE seq <= ?", (head_seq(conn) - keep,)).rowcount
+
+
+def _read_on_thread(fn, *args):
+    # Default reader for ChangeFeed: fn(conn, *args) on a pooled connection, off the event loop
+    from db_pool import get_pool   # db_pool -> migrations -> changefeed at import time
+
+    def run():
+        with get_pool().reader() as conn:
+            return fn(conn, *args)
+    return asyncio.to_thread(run)
+
+
+# ---------- Fan-out ----------
+
+class ChangeFeed:
+    # One poller per process, any number of streams. `read` is an async
+    # callable, read(fn, *args) -> fn(conn, *args), e.g. api_async's db.read.
+    def __init__(self, read=_read_on_thread, poll_interval=POLL_INTERVAL_S, buffer_size=BUFFER_EVENTS):
+        self._read = read
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.subscribers = 0
+        self.polls = 0
+        self.last_error = None
+        self._loop = None
+
+    def _bind(self):
+        # asyncio objects belong to one loop; start afresh on a new one (tests, reloads)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.head = None            # last seq read from the log
+            self.events = []            # recent events, ascending seq
+            self.seqs = []
+            self.complete_after = None  # the buffer holds every event after this seq
+            self._new = asyncio.Event()     # replaced after every wake-up
+            self._wake = asyncio.Event()
+            self._poller = None
+
+    def notify(self):
+        # A trip was written in this process: poll now rather than at the next
+        # tick. Safe to call from any thread.
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _poll(self):
+        while self.subscribers:
+            self._wake.clear()
+            try:
+                result = await self._read(read_changes, self.head, PAGE_SIZE)
+            except Exception as e:      # overloaded or locked: try again next tick
+                self.last_error = f"{type(e).__name__}: {e}"
+                result = [], self.head
+            self.polls += 1
+            if result is None:
+                # pruned past our own head (a very long stall): start over
+                self.head = await self._read(head_seq)
+                self.complete_after = self.head
+                self.events, self.seqs = [], []
+                self._publish()
+                continue
+            events, last = result
+            if last != self.head:
+                full_page = last - self.head >= PAGE_SIZE
+                self.head = last
+                self.events += events
+                self.seqs += [e["seq"] for e in events]
+                if len(self.events) > 2 * self.buffer_size:
+                    self.complete_after = self.seqs[-self.buffer_size - 1]
+                    del self.events[:-self.buffer_size], self.seqs[:-self.buffer_size]
+                self._publish()
+                if full_page:
+                    continue    # more may be waiting
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        self._poller = None
+
+    def _publish(self):
+        new, self._new = self._new, asyncio.Event()
+        new.set()
+
+    def _buffered(self, cursor):
+        # The next page after `cursor` from memory, or None if it is not all there
+        if cursor < self.complete_after:
+            return None
+        start = bisect_right(self.seqs, cursor)
+        end = start + PAGE_SIZE
+        return self.events[start:end], self.seqs[end - 1] if end < len(self.seqs) else self.head
+
+    async def subscribe(self, after=None, vehicle_number=None):
+        # Async generator of event lists for one stream; [] is a heartbeat
+        self._bind()
+        self.subscribers += 1
+        try:
+            if self.head is None:
+                self.head = self.complete_after = await self._read(head_seq)
+            if self._poller is None:
+                self._poller = asyncio.create_task(self._poll())
+            cursor = self.head if after is None else after
+            if cursor > self.head and cursor > await self._read(head_seq):
+                # an id from another database (or a rebuilt one)
+                yield [{"seq": self.head, "op": "reload"}]
+                cursor = self.head
+            while True:
+                if cursor < self.head:
+                    result = self._buffered(cursor) or await self._read(read_changes, cursor, PAGE_SIZE)
+                    if result is None:
+                        result = [{"seq": self.head, "op": "reload"}], self.head
+                    events, cursor = result
+                    events = [e for e in events if vehicle_number is None or e["op"] == "reload"
+                              or e["vehicle_number"] == vehicle_number]
+                    if events:
+                        yield events
+                    continue
+                # caught up (a direct read may even be ahead of the poller)
+                new = self._new
+                try:
+                    await asyncio.wait_for(new.wait(), HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield []
+        finally:
+            self.subscribers -= 1
+
+
+# ---------- Server-Sent Events ----------
+
+def format_events(events):
+    return "".join(f"id: {e['seq']}\nevent: {e['op']}\ndata: {json.dumps(e)}\n\n" for e in events)
+
+
+def stream_response(feed, request, after=None, vehicle_number=None):
+    # StreamingResponse for GET /trips/stream; Last-Event-ID wins over ?after=
+    from fastapi import HTTPException
+    from fastapi.responses import StreamingResponse
+
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be a change sequence number")
+
+    async def body():
+        yield f"retry: {RETRY_MS}\n\n"
+        async for events in feed.subscribe(after, vehicle_number):
+            yield format_events(events) if events else ": keepalive\n\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+if __name__ == "__main__":
+    from db_pool import get_pool
+
+    parser = argparse.ArgumentParser(description="FleetStat trip change log")
+    parser.add_argument("command", choices=["status", "prune"])
+    parser.add_argument("--keep", type=int, default=KEEP_CHANGES, help="events kept by prune")
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        with get_pool().writer() as conn:
+            removed = prune_changes(conn, args.keep)
+        print(f"✅ removed {removed:,} change(s), kept the newest {args.keep:,}")
+    else:
+        with get_pool().reader() as conn:
+            count, first = conn.execute("SELECT COUNT(*), MIN(seq) FROM trip_changes").fetchone()
+            print(f"  {count:,} changes logged, seq {first or 0} .. {head_seq(conn)}")
@@ -1,63 +1,344 @@
+import heapq
+import math
 import sqlite3
-import os
+from datetime import date, datetime
+from itertools import islice
+from operator import itemgetter
 import pandas as pd
+from db_pool import get_pool
+from metrics import timed_query
+import partitions
+from queries import (EXPORT_BATCH_SIZE, MAX_PAGE_SIZE, TRIP_COLUMNS, TRIP_ORDERS, decode_cursor, encode_cursor,
+                     fetch_trips, resolve_search, trip_filters, trip_key)
+import trip_routes
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "../db/FleetStat.db")
+TRIP_FIELDS = ("vehicle_number", "fuel_consumption", "trip_date", "start_location", "end_location",
+               "lat_start", "lon_start", "lat_end", "lon_end", "distance")
+BULK_CHUNK_SIZE = 1000
 
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-c = conn.cursor()
+INSERT_TRIP_SQL = f'''
+    INSERT INTO trip_info ({", ".join(TRIP_FIELDS)})
+    VALUES ({", ".join("?" * len(TRIP_FIELDS))})
+'''
 
+@timed_query("db_handler.insert_vehicle")
 def insert_vehicle(vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date):
-    c.execute('''
-        INSERT INTO vehicle_info (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date))
-    conn.commit()
+    with get_pool().writer() as conn:
+        cur = conn.execute('''
+            INSERT INTO vehicle_info (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date))
+        return cur.lastrowid
 
+@timed_query("db_handler.insert_trip")
 def insert_trip(vehicle_number, fuel_consumption, trip_date, start_location, end_location,
                 lat_start, lon_start, lat_end, lon_end, distance):
-    c.execute('''
-        INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
-                               lat_start, lon_start, lat_end, lon_end, distance)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
-          lat_start, lon_start, lat_end, lon_end, distance))
-    conn.commit()
+    with get_pool().writer() as conn:
+        cur = conn.execute('''
+            INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
+                                   lat_start, lon_start, lat_end, lon_end, distance)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
+              lat_start, lon_start, lat_end, lon_end, distance))
+        return cur.lastrowid
 
+@timed_query("db_handler.Update_vehicle")
 def Update_vehicle(vehicle_id, vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date):
-    c.execute('''
-        UPDATE vehicle_info
-        SET vehicle_name = ?, vehicle_number = ?, owner_name = ?, vehicle_type = ?, registration_date = ?
-        WHERE vehicle_id = ?
-    ''', (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date, vehicle_id))
-    conn.commit()
+    with get_pool().writer() as conn:
+        conn.execute('''
+            UPDATE vehicle_info
+            SET vehicle_name = ?, vehicle_number = ?, owner_name = ?, vehicle_type = ?, registration_date = ?
+            WHERE vehicle_id = ?
+        ''', (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date, vehicle_id))
 
+@timed_query("db_handler.update_vehicle_by_number")
+def update_vehicle_by_number(vehicle_number, vehicle_name, owner_name, vehicle_type, registration_date):
+    with get_pool().writer() as conn:
+        conn.execute('''
+            UPDATE vehicle_info
+            SET vehicle_name = ?, owner_name = ?, vehicle_type = ?, registration_date = ?
+            WHERE vehicle_number = ?
+        ''', (vehicle_name, owner_name, vehicle_type, registration_date, vehicle_number))
+
+@timed_query("db_handler.Update_trip")
 def Update_trip(trip_id, vehicle_number, fuel_consumption, trip_date, start_location, end_location,
                 lat_start, lon_start, lat_end, lon_end, distance):
-    c.execute('''
-        UPDATE trip_info
-        SET vehicle_number = ?, fuel_consumption = ?, trip_date = ?, start_location = ?, end_location = ?,
-            lat_start = ?, lon_start = ?, lat_end = ?, lon_end = ?, distance = ?
-        WHERE trip_id = ?
-    ''', (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
-          lat_start, lon_start, lat_end, lon_end, distance, trip_id))
-    conn.commit()
+    with get_pool().writer() as conn:
+        conn.execute('''
+            UPDATE trip_info
+            SET vehicle_number = ?, fuel_consumption = ?, trip_date = ?, start_location = ?, end_location = ?,
+                lat_start = ?, lon_start = ?, lat_end = ?, lon_end = ?, distance = ?
+            WHERE trip_id = ?
+        ''', (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
+              lat_start, lon_start, lat_end, lon_end, distance, trip_id))
 
+@timed_query("db_handler.delete_vehicle")
 def delete_vehicle(vehicle_id):
-    c.execute('DELETE FROM vehicle_info WHERE vehicle_id = ?', (vehicle_id,))
-    conn.commit()
-    
+    with get_pool().writer() as conn:
+        conn.execute('DELETE FROM vehicle_info WHERE vehicle_id = ?', (vehicle_id,))
+
+@timed_query("db_handler.delete_trip")
 def delete_trip(trip_id):
-    c.execute('DELETE FROM trip_info WHERE trip_id = ?', (trip_id,))
-    conn.commit()
+    with get_pool().writer() as conn:
+        conn.execute('DELETE FROM trip_info WHERE trip_id = ?', (trip_id,))
 
+@timed_query("db_handler.view_vehicles")
 def view_vehicles():
-    c.execute('SELECT * FROM vehicle_info')
-    return c.fetchall()
+    with get_pool().reader() as conn:
+        return conn.execute('SELECT * FROM vehicle_info').fetchall()
 
+@timed_query("db_handler.view_trips")
 def view_trips():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM trip_info ORDER BY trip_date DESC", conn)
-    conn.close()
+    with get_pool().reader() as conn:
+        return pd.read_sql_query("SELECT * FROM trip_info ORDER BY trip_date DESC", conn)
+
+# ---------- Trips across partitions ----------
+# trip_info holds recent months; older months live in read-only archive
+# files (partitions.py). These read both, opening only the archives whose
+# dates overlap the requested range.
+
+def _read_sources(fn, date_from=None, date_to=None):
+    # [fn(conn)] for trip_info's database and each archive overlapping the range
+    with get_pool().reader() as conn:
+        results = [fn(conn)]
+    for _, path in partitions.archived_partitions(date_from, date_to):
+        conn = partitions.open_archive(path)
+        try:
+            results.append(fn(conn))
+        finally:
+            conn.close()
+    return results
+
+def _resolve(filters):
+    # vehicle_search is resolved once against the main database's search index
+    # and applied to archives as a plain vehicle_number condition
+    with get_pool().reader() as conn:
+        return resolve_search(conn, filters)
+
+def _filters(date_from, date_to, vehicle_number, vehicle_search):
+    return _resolve({"vehicle_number": vehicle_number, "date_from": date_from, "date_to": date_to,
+                     "vehicle_search": vehicle_search})
+
+@timed_query("db_handler.query_trips")
+def query_trips(columns=None, date_from=None, date_to=None, vehicle_number=None, vehicle_search=None):
+    # Trips as a DataFrame, newest first when trip_date is selected
+    columns = list(columns or TRIP_COLUMNS)
+    clauses, params = trip_filters(**_filters(date_from, date_to, vehicle_number, vehicle_search))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"SELECT {', '.join(columns)} FROM trip_info {where}"
+
+    frames = _read_sources(lambda conn: pd.read_sql_query(sql, conn, params=params), date_from, date_to)
+    frames = [f for f in frames if not f.empty] or frames[:1]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if "trip_date" in columns:
+        order = [c for c in ("trip_date", "trip_id") if c in columns]
+        df = df.sort_values(order, ascending=False, ignore_index=True)
     return df
+
+def _merged_trips(order, after, limit, filters):
+    # Up to `limit` rows after keyset `after`, in `order`. Every source answers
+    # the same keyset query and the sorted results are merged, so a page costs
+    # O(limit) per source however many trips the range holds.
+    key_columns, descending = TRIP_ORDERS[order]
+    key = itemgetter(*(TRIP_COLUMNS.index(c) for c in key_columns))
+    sources = _read_sources(lambda conn: fetch_trips(conn, order, after, limit, filters),
+                            filters.get("date_from"), filters.get("date_to"))
+    return list(islice(heapq.merge(*sources, key=key, reverse=descending), limit))
+
+@timed_query("db_handler.trip_page")
+def trip_page(limit=100, cursor=None, order="trip_id", **filters):
+    # queries.trip_page over trip_info and the archives: {"items", "next_cursor"}
+    if order not in TRIP_ORDERS:
+        raise ValueError(f"order must be one of {', '.join(TRIP_ORDERS)}")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    after = decode_cursor(cursor, order, len(TRIP_ORDERS[order][0])) if cursor else None
+    rows = _merged_trips(order, after, limit + 1, _resolve(filters))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(order, trip_key(rows[-1], order))
+    return {"items": [dict(zip(TRIP_COLUMNS, row)) for row in rows], "next_cursor": next_cursor}
+
+def iter_trip_batches(order="trip_id", batch_size=EXPORT_BATCH_SIZE, **filters):
+    # queries.iter_trip_batches over trip_info and the archives; connections
+    # are held for one batch at a time
+    filters = _resolve(filters)
+    after = None
+    while True:
+        rows = _merged_trips(order, after, batch_size, filters)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = trip_key(rows[-1], order)
+
+PAGE_ORDER = "-trip_date"
+
+@timed_query("db_handler.trip_page_between", rows=lambda page: len(page[0]))
+def trip_page_between(limit=100, cursor=None, date_from=None, date_to=None, vehicle_number=None,
+                      vehicle_search=None):
+    # One page of trips, newest first, as (DataFrame, next page cursor or None)
+    page = trip_page(limit, cursor, PAGE_ORDER, date_from=date_from, date_to=date_to,
+                     vehicle_number=vehicle_number, vehicle_search=vehicle_search)
+    return pd.DataFrame(page["items"], columns=TRIP_COLUMNS), page["next_cursor"]
+
+@timed_query("db_handler.count_trips_between", rows=None)
+def count_trips_between(date_from=None, date_to=None, vehicle_number=None, vehicle_search=None):
+    clauses, params = trip_filters(**_filters(date_from, date_to, vehicle_number, vehicle_search))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"SELECT COUNT(*) FROM trip_info {where}"
+    return sum(_read_sources(lambda conn: conn.execute(sql, params).fetchone()[0], date_from, date_to))
+
+@timed_query("db_handler.fuel_stats_between", rows=None)
+def fuel_stats_between(date_from=None, date_to=None, vehicle_number=None):
+    # Per-trip (min, max, mean) fuel_consumption over trip_info and the
+    # archives in the range, aggregated in SQL; Nones when there are no trips
+    clauses, params = trip_filters(**_filters(date_from, date_to, vehicle_number, None))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"""
+        SELECT MIN(fuel_consumption), MAX(fuel_consumption), SUM(fuel_consumption), COUNT(fuel_consumption)
+        FROM trip_info {where}
+    """
+    parts = [row for row in _read_sources(lambda conn: conn.execute(sql, params).fetchone(), date_from, date_to)
+             if row[3]]
+    if not parts:
+        return None, None, None
+    return (min(p[0] for p in parts), max(p[1] for p in parts),
+            sum(p[2] for p in parts) / sum(p[3] for p in parts))
+
+@timed_query("db_handler.get_trip", rows=None)
+def get_trip(trip_id):
+    # One trip_info row as a dict (archived trips are read-only and not returned)
+    with get_pool().reader() as conn:
+        row = conn.execute(f"SELECT {', '.join(TRIP_COLUMNS)} FROM trip_info WHERE trip_id = ?",
+                           (int(trip_id),)).fetchone()
+    return dict(zip(TRIP_COLUMNS, row)) if row else None
+
+def trip_date_bounds():
+    return partitions.date_bounds()
+
+# ---------- Trip routes ----------
+
+@timed_query("db_handler.save_trip_route", rows=None)
+def save_trip_route(trip_id, points):
+    # Store a fetched route (archived trips included); [(lat, lon), ...]
+    with get_pool().writer() as conn:
+        return trip_routes.store_route(conn, int(trip_id), points)
+
+@timed_query("db_handler.get_trip_route", rows=lambda route: len(route[1]) if route else 0)
+def get_trip_route(trip_id, width, height):
+    # (zoom, points) to draw the trip's stored route in a width x height map, or None
+    with get_pool().reader() as conn:
+        return trip_routes.load_route_for_map(conn, int(trip_id), width, height)
+
+# ---------- Bulk ingestion ----------
+
+def _number(record, field, low=None, high=None):
+    value = record.get(field)
+    if value is None or isinstance(value, bool):
+        raise ValueError(f"{field}: a number is required")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: {value!r} is not a number")
+    if not math.isfinite(value):
+        raise ValueError(f"{field}: must be finite")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ValueError(f"{field}: {value} is outside [{low}, {high}]")
+    return value
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    if value is None:
+        if required:
+            raise ValueError(f"{field}: is required")
+        value = ""
+    if not isinstance(value, str):
+        raise ValueError(f"{field}: a string is required")
+    value = value.strip()
+    if required and not value:
+        raise ValueError(f"{field}: must not be empty")
+    return value
+
+def _trip_date(record):
+    value = record.get("trip_date")
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value.strip()[:10]).isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"trip_date: {value!r} is not an ISO date (YYYY-MM-DD)")
+
+def trip_row(record):
+    # Validate one trip (a dict keyed like TRIP_FIELDS, or a sequence in that
+    # order) and return the tuple to insert; raises ValueError with the reason.
+    if not isinstance(record, dict):
+        if not isinstance(record, (list, tuple)) or len(record) != len(TRIP_FIELDS):
+            raise ValueError(f"expected an object or a {len(TRIP_FIELDS)}-item row")
+        record = dict(zip(TRIP_FIELDS, record))
+    return (
+        _text(record, "vehicle_number", required=True),
+        _number(record, "fuel_consumption", low=0),
+        _trip_date(record),
+        _text(record, "start_location"),
+        _text(record, "end_location"),
+        _number(record, "lat_start", -90, 90),
+        _number(record, "lon_start", -180, 180),
+        _number(record, "lat_end", -90, 90),
+        _number(record, "lon_end", -180, 180),
+        _number(record, "distance", low=0),
+    )
+
+def _insert_chunk(conn, rows):
+    # One executemany per chunk; if the database rejects any row, redo the
+    # chunk row by row so only the offending rows are reported.
+    conn.execute("SAVEPOINT bulk_chunk")
+    try:
+        conn.executemany(INSERT_TRIP_SQL, [row for _, row in rows])
+        conn.execute("RELEASE bulk_chunk")
+        return len(rows), []
+    except sqlite3.DatabaseError:
+        conn.execute("ROLLBACK TO bulk_chunk")
+        conn.execute("RELEASE bulk_chunk")
+
+    inserted, errors = 0, []
+    for index, row in rows:
+        try:
+            conn.execute(INSERT_TRIP_SQL, row)
+            inserted += 1
+        except sqlite3.DatabaseError as e:
+            errors.append({"index": index, "error": str(e)})
+    return inserted, errors
+
+@timed_query("db_handler.insert_trips_bulk")
+def insert_trips_bulk(trips, chunk_size=BULK_CHUNK_SIZE, offset=0):
+    # Insert an iterable of trips in chunks, each chunk validated up front and
+    # written in a single transaction. Invalid rows are skipped and reported
+    # by position (starting at offset) instead of failing the whole batch.
+    result = {"inserted": 0, "failed": 0, "errors": []}
+    records = enumerate(trips, start=offset)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+
+        rows = []
+        for index, record in chunk:
+            try:
+                rows.append((index, trip_row(record)))
+            except ValueError as e:
+                result["errors"].append({"index": index, "error": str(e)})
+
+        if rows:
+            with get_pool().writer() as conn:
+                inserted, errors = _insert_chunk(conn, rows)
+            result["inserted"] += inserted
+            result["errors"].extend(errors)
+
+    result["failed"] = len(result["errors"])
+    return result
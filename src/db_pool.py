@@ -0,0 +1,152 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from migrations import migrate
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Resolved against this file, not the working directory, so every entry point
+# (streamlit, uvicorn, scripts run from the repo root or src/) finds the same
+# database. FLEETSTAT_DB points FleetStat at another file (tests, benchmarks).
+DB_PATH = os.path.abspath(os.getenv("FLEETSTAT_DB") or os.path.join(BASE_DIR, "..", "db", "FleetStat.db"))
+
+# Per-connection tuning. WAL lets readers run while the writer commits;
+# synchronous=NORMAL is durable across app crashes in WAL mode and only
+# fsyncs at checkpoints.
+PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -64000,          # KiB, i.e. ~64 MB page cache per connection
+    "mmap_size": 268435456,        # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,          # ms to wait on another process' write lock
+}
+
+READ_POOL_SIZE = int(os.getenv("FLEETSTAT_DB_READERS", "8"))
+CHECKOUT_TIMEOUT = float(os.getenv("FLEETSTAT_DB_CHECKOUT_TIMEOUT", "30"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect(path=DB_PATH, readonly=False):
+    if not readonly:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=PRAGMAS["busy_timeout"] / 1000)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    # A bounded set of read connections handed out one per request/thread,
+    # plus a single writer connection guarded by a lock (SQLite allows one
+    # writer at a time anyway; queueing in-process avoids busy retries).
+
+    def __init__(self, path=DB_PATH, readers=READ_POOL_SIZE, timeout=CHECKOUT_TIMEOUT):
+        self.path = path
+        self.max_readers = readers
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._closed = False
+
+        # The writer is opened eagerly: it switches the file to WAL and
+        # applies pending migrations before any reader touches it.
+        with self._write_lock:
+            self._writer = connect(self.path)
+            self._writer.execute("PRAGMA journal_mode = WAL")
+            migrate(self._writer)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._open_lock:
+            if self._opened < self.max_readers:
+                self._opened += 1
+                try:
+                    return connect(self.path, readonly=True)
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"no read connection available after {self.timeout}s")
+
+    @contextmanager
+    def reader(self):
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            # Ending the read transaction releases the WAL snapshot so the
+            # writer can checkpoint past it.
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def writer(self):
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        if not self._write_lock.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"writer busy for more than {self.timeout}s")
+        try:
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            self._write_lock.release()
+
+    def close(self):
+        self._closed = True
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+# ---------- FastAPI dependencies (one checkout per request) ----------
+
+def read_db():
+    with get_pool().reader() as conn:
+        yield conn
+
+
+def write_db():
+    with get_pool().writer() as conn:
+        yield conn
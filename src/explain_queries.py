@@ -0,0 +1,48 @@
+import sys
+
+from db_pool import DB_PATH, connect
+from migrations import schema_version
+
+# EXPLAIN QUERY PLAN for the statements app.py and api.py issue, to check
+# they hit the trip_info indexes rather than scanning the table.
+#   python explain_queries.py [path/to/FleetStat.db]
+
+QUERIES = [
+    ("View Trips / Add Trip listing",
+     "SELECT * FROM trip_info ORDER BY trip_date DESC", ()),
+    ("Per-Trip Analytics",
+     "SELECT trip_id, trip_date, vehicle_number, fuel_consumption FROM trip_info ORDER BY trip_date ASC", ()),
+    ("GET /trips?vehicle_number=..&order=-trip_date",
+     "SELECT * FROM trip_info WHERE vehicle_number = ? ORDER BY trip_date DESC, trip_id DESC LIMIT 101",
+     ("ABC123",)),
+    ("GET /trips?date_from=..&date_to=..",
+     "SELECT * FROM trip_info WHERE trip_date >= ? AND trip_date < date(?, '+1 day') "
+     "ORDER BY trip_id LIMIT 101",
+     ("2025-05-01", "2025-05-31")),
+    ("GET /trips?vehicle_number=..&date_from=..&date_to=..",
+     "SELECT * FROM trip_info WHERE vehicle_number = ? AND trip_date >= ? AND trip_date < date(?, '+1 day') "
+     "ORDER BY trip_id LIMIT 101",
+     ("ABC123", "2025-05-01", "2025-05-31")),
+    ("View Trips metrics (get_trip_stats)",
+     "SELECT distance, fuel_consumption FROM trip_info WHERE trip_id = ?", (1,)),
+    ("vehicle <-> trip join (vehicle trip counts from trip_info)",
+     "SELECT v.vehicle_number, COUNT(t.trip_id), COALESCE(SUM(t.distance), 0) "
+     "FROM vehicle_info v LEFT JOIN trip_info t ON v.vehicle_number = t.vehicle_number "
+     "GROUP BY v.vehicle_number", ()),
+]
+
+
+def explain(conn, sql, params):
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [detail for _, _, _, detail in rows]
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = connect(path, readonly=True)
+    print(f"schema version {schema_version(conn)} - {path}")
+    for name, sql, params in QUERIES:
+        print(f"\n{name}")
+        for detail in explain(conn, sql, params):
+            print(f"  {detail}")
+    conn.close()
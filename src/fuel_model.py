@@ -0,0 +1,424 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from db_pool import get_pool
+from metrics import timed_step
+
+# Fuel-consumption model trained by streaming trip_info in keyset chunks.
+#
+# The fit is ordinary least squares kept as its sufficient statistics
+# (X'X, X'y, y'y, n), which add up across chunks: an update only reads the
+# trips with trip_id above the previous artifact's watermark, adds their
+# statistics to the stored ones and re-solves a small linear system.
+#
+# Features, per trip:
+#   vehicle_type one-hot            (per-type intercept)
+#   distance x vehicle_type one-hot (per-type litres per km)
+#   distance x vehicle history rate (the vehicle's own litres per km over its
+#                                    earlier trips, shrunk towards its type's)
+#
+# Incremental runs only see new trips; edits or deletes of already-trained
+# trips are picked up by a --full retrain.
+#
+# Each run writes ml_models/fuel/fuel-vNNNN.joblib plus a .json with its
+# metadata (rows, watermark, error, timings); LATEST names the current one.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.abspath(os.getenv("FLEETSTAT_MODEL_DIR") or os.path.join(BASE_DIR, "..", "ml_models", "fuel"))
+LATEST_FILE = "LATEST"
+
+VEHICLE_TYPES = ("Car", "Bike", "Truck", "Bus", "Other")
+FEATURES = ([f"type={t}" for t in VEHICLE_TYPES] + [f"distance*type={t}" for t in VEHICLE_TYPES]
+            + ["distance*history_rate"])
+
+CHUNK_SIZE = 200000
+HISTORY_PRIOR_KM = 200.0      # weight of the type rate in a vehicle's history rate
+DEFAULT_RATE = 0.1            # litres per km before any trip is seen
+RIDGE = 1e-6                  # keeps the system solvable when a type has no trips yet
+
+CHUNK_SQL = '''
+    SELECT t.trip_id, t.vehicle_number, v.vehicle_type, t.distance, t.fuel_consumption
+    FROM trip_info t LEFT JOIN vehicle_info v ON v.vehicle_number = t.vehicle_number
+    WHERE t.trip_id > ? ORDER BY t.trip_id LIMIT ?
+'''
+
+
+# ---------- Features ----------
+
+def _type_index(vehicle_types):
+    types = pd.Series(vehicle_types, dtype=object)
+    index = pd.Categorical(types, categories=VEHICLE_TYPES).codes
+    return np.where(index < 0, len(VEHICLE_TYPES) - 1, index)
+
+
+def design_matrix(distance, vehicle_types, history_rate):
+    distance = np.asarray(distance, dtype=np.float64)
+    onehot = np.zeros((len(distance), len(VEHICLE_TYPES)))
+    onehot[np.arange(len(distance)), _type_index(vehicle_types)] = 1.0
+    return np.column_stack([onehot, onehot * distance[:, None], distance * np.asarray(history_rate)])
+
+
+def _rate(fuel, distance, prior_rate):
+    return (fuel + HISTORY_PRIOR_KM * prior_rate) / (distance + HISTORY_PRIOR_KM)
+
+
+def new_state():
+    k = len(FEATURES)
+    return {
+        "xtx": np.zeros((k, k)),
+        "xty": np.zeros(k),
+        "yty": 0.0,
+        "n": 0,
+        "watermark": 0,
+        "fleet": [0.0, 0.0],      # distance, fuel
+        "types": {t: [0.0, 0.0] for t in VEHICLE_TYPES},
+        "vehicles": {},           # vehicle_number -> [distance, fuel, trips]
+    }
+
+
+def fleet_rate(state):
+    distance, fuel = state["fleet"]
+    return fuel / distance if distance > 0 else DEFAULT_RATE
+
+
+def type_rates(state, type_index):
+    # litres per km seen so far for each row's vehicle type (fleet rate if none)
+    fleet = fleet_rate(state)
+    rates = np.array([fuel / distance if distance > 0 else fleet
+                      for distance, fuel in (state["types"][t] for t in VEHICLE_TYPES)])
+    return rates[type_index]
+
+
+def history_rates(state, vehicle_numbers, vehicle_types):
+    # Rate each vehicle would be predicted with today (all of its history)
+    prior = type_rates(state, _type_index(vehicle_types))
+    stats = state["vehicles"]     # [distance, fuel, trips]
+    return np.array([_rate(stats[v][1], stats[v][0], p) if v in stats else p
+                     for v, p in zip(vehicle_numbers, prior)])
+
+
+def add_chunk(state, df):
+    # Fold a chunk of trips (ordered by trip_id) into the statistics. Each trip
+    # sees only its vehicle's earlier trips, as a prediction would.
+    type_index = _type_index(df["vehicle_type"])
+    base = type_rates(state, type_index)
+    prior = pd.DataFrame.from_dict(state["vehicles"], orient="index", columns=["distance", "fuel", "trips"])
+    key = df["vehicle_number"].fillna("")
+    before = prior.reindex(key).fillna(0.0).to_numpy(dtype=np.float64)
+    grouped = df.groupby(key, sort=False)
+    earlier_distance = before[:, 0] + grouped["distance"].cumsum().to_numpy() - df["distance"].to_numpy()
+    earlier_fuel = before[:, 1] + grouped["fuel_consumption"].cumsum().to_numpy() - df["fuel_consumption"].to_numpy()
+
+    X = design_matrix(df["distance"], df["vehicle_type"], _rate(earlier_fuel, earlier_distance, base))
+    y = df["fuel_consumption"].to_numpy(dtype=np.float64)
+    state["xtx"] += X.T @ X
+    state["xty"] += X.T @ y
+    state["yty"] += float(y @ y)
+    state["n"] += len(y)
+    state["watermark"] = int(df["trip_id"].iloc[-1])
+    state["fleet"][0] += float(df["distance"].sum())
+    state["fleet"][1] += float(df["fuel_consumption"].sum())
+    for t, name in enumerate(VEHICLE_TYPES):
+        of_type = type_index == t
+        state["types"][name][0] += float(df["distance"].to_numpy()[of_type].sum())
+        state["types"][name][1] += float(df["fuel_consumption"].to_numpy()[of_type].sum())
+
+    totals = grouped.agg(distance=("distance", "sum"), fuel=("fuel_consumption", "sum"), trips=("trip_id", "size"))
+    vehicles = state["vehicles"]
+    for vehicle, distance, fuel, trips in totals.itertuples():
+        stats = vehicles.setdefault(vehicle, [0.0, 0.0, 0])
+        stats[0] += distance
+        stats[1] += fuel
+        stats[2] += int(trips)
+    return X, y
+
+
+def solve(state):
+    k = len(FEATURES)
+    return np.linalg.solve(state["xtx"] + RIDGE * np.eye(k), state["xty"])
+
+
+def training_error(state, coef):
+    # Residual sum of squares from the statistics alone, no rescan
+    if not state["n"]:
+        return {"rmse": None, "r2": None}
+    sse = state["yty"] - 2 * coef @ state["xty"] + coef @ state["xtx"] @ coef
+    mean = state["xty"][:len(VEHICLE_TYPES)].sum() / state["n"]    # type one-hots sum to 1
+    sst = state["yty"] - state["n"] * mean ** 2
+    return {"rmse": float(np.sqrt(max(sse, 0.0) / state["n"])),
+            "r2": float(1 - sse / sst) if sst > 0 else None}
+
+
+# ---------- Model ----------
+
+class FuelModel:
+    def __init__(self, coef, state, metadata):
+        self.coef = np.asarray(coef)
+        self.state = state
+        self.metadata = metadata
+
+    @property
+    def version(self):
+        return self.metadata.get("version")
+
+    @timed_step("fuel_model.predict")
+    def predict(self, distance, vehicle_types, vehicle_numbers=None):
+        # Litres for each trip; vehicles without history use their type's rate
+        distance = np.asarray(distance, dtype=np.float64)
+        if vehicle_numbers is None:
+            rates = type_rates(self.state, _type_index(vehicle_types))
+        else:
+            rates = history_rates(self.state, vehicle_numbers, vehicle_types)
+        return np.maximum(design_matrix(distance, vehicle_types, rates) @ self.coef, 0.0)
+
+
+# ---------- Artifacts ----------
+
+def _version_name(number):
+    return f"fuel-v{number:04d}"
+
+
+def list_versions(model_dir=MODEL_DIR):
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(f[:-5] for f in os.listdir(model_dir) if f.startswith("fuel-v") and f.endswith(".json"))
+
+
+def latest_version(model_dir=MODEL_DIR):
+    try:
+        with open(os.path.join(model_dir, LATEST_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_model(version=None, model_dir=MODEL_DIR):
+    # The named version, or the one LATEST points at; None if nothing is trained
+    version = version or latest_version(model_dir)
+    if version is None:
+        return None
+    artifact = joblib.load(os.path.join(model_dir, f"{version}.joblib"))
+    return FuelModel(artifact["coef"], artifact["state"], artifact["metadata"])
+
+
+def save_model(coef, state, metadata, model_dir=MODEL_DIR):
+    os.makedirs(model_dir, exist_ok=True)
+    existing = list_versions(model_dir)
+    number = int(existing[-1].rsplit("v", 1)[1]) + 1 if existing else 1
+    version = metadata["version"] = _version_name(number)
+
+    # artifact and metadata first, then flip LATEST with an atomic rename
+    path = os.path.join(model_dir, version)
+    joblib.dump({"coef": coef, "state": state, "metadata": metadata}, path + ".joblib")
+    with open(path + ".json", "w") as f:
+        json.dump(metadata, f, indent=2)
+    tmp = os.path.join(model_dir, LATEST_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(model_dir, LATEST_FILE))
+    return version
+
+
+# ---------- Serving ----------
+
+RELOAD_CHECK_INTERVAL = 2.0   # seconds between looks at LATEST
+
+
+class ModelHolder:
+    # The model being served. Readers take a reference with get() and keep
+    # using it for the whole batch; a newer artifact named by LATEST is loaded
+    # on a background thread and swapped in with a single assignment, so no
+    # request waits on the load or sees half a model.
+
+    def __init__(self, model_dir=MODEL_DIR, check_interval=RELOAD_CHECK_INTERVAL):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self.model = None
+        self._checked_at = 0.0
+        self._loading = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        # Blocking (re)load of LATEST; used at startup
+        self._swap(latest_version(self.model_dir))
+        return self.model
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._maybe_reload()
+        return self.model
+
+    def _maybe_reload(self):
+        version = latest_version(self.model_dir)
+        current = self.model.version if self.model else None
+        if version is None or version == current:
+            return
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._swap, args=(version,), daemon=True).start()
+
+    def _swap(self, version):
+        try:
+            if version is not None:
+                self.model = load_model(version, self.model_dir)
+        finally:
+            with self._lock:
+                self._loading = False
+
+
+_holder = None
+_holder_lock = threading.Lock()
+
+
+def get_model_holder():
+    global _holder
+    if _holder is None:
+        with _holder_lock:
+            if _holder is None:
+                _holder = ModelHolder()
+                _holder.load()
+    return _holder
+
+
+def vehicle_types_for(vehicle_numbers):
+    # {vehicle_number: vehicle_type} for the given numbers, one query
+    numbers = sorted({v for v in vehicle_numbers if v})
+    if not numbers:
+        return {}
+    with get_pool().reader() as conn:
+        return dict(conn.execute(
+            "SELECT vehicle_number, vehicle_type FROM vehicle_info "
+            "WHERE vehicle_number IN (SELECT value FROM json_each(?))",
+            (json.dumps(numbers),),
+        ).fetchall())
+
+
+def predict_fuel(distance, vehicle_types=None, vehicle_numbers=None, model=None):
+    # One vectorised prediction for a batch of trips. Missing vehicle types
+    # are looked up from vehicle_info by vehicle number. Returns
+    # (litres array, model version) or (None, None) when no model is trained.
+    model = model or get_model_holder().get()
+    if model is None:
+        return None, None
+    n = len(distance)
+    if vehicle_types is None:
+        vehicle_types = [None] * n
+    if vehicle_numbers is not None and any(t is None for t in vehicle_types):
+        known = vehicle_types_for(vehicle_numbers)
+        vehicle_types = [t if t is not None else known.get(v) for t, v in zip(vehicle_types, vehicle_numbers)]
+    return model.predict(distance, vehicle_types, vehicle_numbers), model.version
+
+
+# ---------- Training ----------
+
+def iter_trip_chunks(after=0, chunk_size=CHUNK_SIZE):
+    while True:
+        with get_pool().reader() as conn:
+            df = pd.read_sql_query(CHUNK_SQL, conn, params=(after, chunk_size))
+        if df.empty:
+            return
+        after = int(df["trip_id"].iloc[-1])
+        yield df
+
+
+def train(full=False, chunk_size=CHUNK_SIZE, model_dir=MODEL_DIR):
+    # Update the latest model with trips added since its watermark (or start
+    # over with full=True). Returns (FuelModel, metadata of the new version),
+    # or (latest FuelModel, None) when there is nothing new to learn from.
+    started = time.perf_counter()
+    previous = None if full else load_model(model_dir=model_dir)
+    state = previous.state if previous else new_state()
+    start_watermark = state["watermark"]
+    timings = {"read_s": 0.0, "fit_s": 0.0}
+    new_rows = skipped = 0
+    new_abs_error = 0.0
+
+    t0 = time.perf_counter()
+    for df in iter_trip_chunks(state["watermark"], chunk_size):
+        t1 = time.perf_counter()
+        timings["read_s"] += t1 - t0
+        usable = df["distance"].gt(0) & df["fuel_consumption"].ge(0)
+        skipped += int((~usable).sum())
+        watermark = int(df["trip_id"].iloc[-1])
+        df = df[usable]
+        if not df.empty:
+            X, y = add_chunk(state, df)
+            if previous is not None:
+                # how the previous version did on trips it has not seen
+                new_abs_error += float(np.abs(X @ previous.coef - y).sum())
+            new_rows += len(y)
+        state["watermark"] = watermark
+        t0 = time.perf_counter()
+        timings["fit_s"] += t0 - t1
+
+    if previous is not None and state["watermark"] == start_watermark:
+        return previous, None
+
+    t1 = time.perf_counter()
+    coef = solve(state) if state["n"] else np.zeros(len(FEATURES))
+    timings["solve_s"] = time.perf_counter() - t1
+    timings["total_s"] = time.perf_counter() - started
+
+    metadata = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "mode": "incremental" if previous else "full",
+        "parent": previous.version if previous else None,
+        "features": FEATURES,
+        "coef": [round(float(c), 6) for c in coef],
+        "rows": state["n"],
+        "new_rows": new_rows,
+        "skipped_rows": skipped,
+        "vehicles": len(state["vehicles"]),
+        "watermark": state["watermark"],
+        "previous_watermark": start_watermark,
+        "train": training_error(state, coef),
+        "parent_mae_on_new_rows": round(new_abs_error / new_rows, 4) if previous and new_rows else None,
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+    }
+    save_model(coef, state, metadata, model_dir)
+    return FuelModel(coef, state, metadata), metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train / update the fuel consumption model")
+    parser.add_argument("--full", action="store_true", help="retrain from every trip instead of updating")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--list", action="store_true", help="list saved versions")
+    args = parser.parse_args()
+
+    if args.list:
+        latest = latest_version(args.model_dir)
+        for version in list_versions(args.model_dir):
+            with open(os.path.join(args.model_dir, f"{version}.json")) as f:
+                meta = json.load(f)
+            mark = "*" if version == latest else " "
+            print(f"{mark} {version}  {meta['created_at']}  {meta['mode']:<11} rows {meta['rows']:>9,}  "
+                  f"watermark {meta['watermark']:>9}  rmse {meta['train']['rmse']}")
+        return
+
+    model, meta = train(args.full, args.chunk_size, args.model_dir)
+    if meta is None:
+        print(f"No new trips since {model.version} (watermark {model.state['watermark']})")
+        return
+    if not meta["rows"]:
+        print(f"✅ {meta['version']}: no usable trips yet, the model predicts 0 L")
+        return
+    print(f"✅ {meta['version']} ({meta['mode']}): {meta['new_rows']:,} new rows, {meta['rows']:,} total, "
+          f"rmse {meta['train']['rmse']:.3f} L, r2 {meta['train']['r2']:.3f}, {meta['timings']['total_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
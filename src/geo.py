@@ -0,0 +1,166 @@
+import argparse
+
+import numpy as np
+
+# Vectorised distance maths over coordinate arrays (degrees in, km out) plus a
+# batch job that checks / backfills trip_info.distance against them.
+
+EARTH_RADIUS_KM = 6371.0088            # mean radius (IUGG)
+WGS84_A = 6378137.0                     # metres
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+# Road distance is rarely the straight line; this is the factor used to
+# estimate it when no routing provider answers.
+DETOUR_FACTOR = 1.25
+
+
+def _arrays(*values):
+    return [np.asarray(v, dtype=np.float64) for v in values]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Great-circle distance on a sphere; ~0.5% error, very cheap
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in _arrays(lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def _vincenty_terms(lam, sinU1, cosU1, sinU2, cosU2):
+    sinLam, cosLam = np.sin(lam), np.cos(lam)
+    sinSigma = np.sqrt((cosU2 * sinLam) ** 2 + (cosU1 * sinU2 - sinU1 * cosU2 * cosLam) ** 2)
+    cosSigma = sinU1 * sinU2 + cosU1 * cosU2 * cosLam
+    sigma = np.arctan2(sinSigma, cosSigma)
+    sinAlpha = np.where(sinSigma == 0, 0.0, cosU1 * cosU2 * sinLam / sinSigma)
+    cos2Alpha = 1 - sinAlpha ** 2
+    cos2SigmaM = np.where(cos2Alpha == 0, 0.0, cosSigma - 2 * sinU1 * sinU2 / cos2Alpha)
+    return sinSigma, cosSigma, sigma, sinAlpha, cos2Alpha, cos2SigmaM
+
+
+def geodesic_km(lat1, lon1, lat2, lon2, max_iter=100, tol=1e-12):
+    # Vincenty's inverse formula on the WGS-84 ellipsoid (sub-millimetre).
+    # Each iteration only recomputes the pairs that have not converged yet;
+    # the few nearly-antipodal pairs that never converge fall back to the
+    # haversine distance.
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*_arrays(lat1, lon1, lat2, lon2))
+    shape = lat1.shape
+    lat1, lon1, lat2, lon2 = (v.ravel() for v in (lat1, lon1, lat2, lon2))
+    a, b, f = WGS84_A, WGS84_B, WGS84_F
+
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lam = L.copy()
+        active = np.flatnonzero(np.isfinite(L) & np.isfinite(U1) & np.isfinite(U2))
+        for _ in range(max_iter):
+            if not active.size:
+                break
+            lam_a = lam[active]
+            sinSigma, cosSigma, sigma, sinAlpha, cos2Alpha, cos2SigmaM = _vincenty_terms(
+                lam_a, sinU1[active], cosU1[active], sinU2[active], cosU2[active]
+            )
+            C = f / 16 * cos2Alpha * (4 + f * (4 - 3 * cos2Alpha))
+            new = L[active] + (1 - C) * f * sinAlpha * (
+                sigma + C * sinSigma * (cos2SigmaM + C * cosSigma * (-1 + 2 * cos2SigmaM ** 2))
+            )
+            lam[active] = new
+            active = active[~(np.abs(new - lam_a) < tol)]
+
+        sinSigma, cosSigma, sigma, _, cos2Alpha, cos2SigmaM = _vincenty_terms(lam, sinU1, cosU1, sinU2, cosU2)
+        u2 = cos2Alpha * (a ** 2 - b ** 2) / b ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sinSigma * (cos2SigmaM + B / 4 * (
+            cosSigma * (-1 + 2 * cos2SigmaM ** 2)
+            - B / 6 * cos2SigmaM * (-3 + 4 * sinSigma ** 2) * (-3 + 4 * cos2SigmaM ** 2)
+        ))
+        km = b * A * (sigma - delta_sigma) / 1000
+
+    if active.size:
+        km[active] = haversine_km(lat1[active], lon1[active], lat2[active], lon2[active])
+    km = km.reshape(shape)
+    return km if shape else float(km)
+
+
+def estimate_road_km(lat1, lon1, lat2, lon2):
+    return haversine_km(lat1, lon1, lat2, lon2) * DETOUR_FACTOR
+
+
+# ---------- trip_info validation / backfill ----------
+
+CHUNK_SIZE = 100000
+
+
+def iter_trip_chunks(chunk_size=CHUNK_SIZE):
+    # (trip_id, lat_start, lon_start, lat_end, lon_end, distance) as float arrays, keyset by trip_id
+    from db_pool import get_pool   # the distance maths stays importable without the database
+    after = 0
+    while True:
+        with get_pool().reader() as conn:
+            rows = conn.execute(
+                """
+                SELECT trip_id, lat_start, lon_start, lat_end, lon_end, distance FROM trip_info
+                WHERE trip_id > ? ORDER BY trip_id LIMIT ?
+                """,
+                (after, chunk_size),
+            ).fetchall()
+        if not rows:
+            return
+        data = np.array(rows, dtype=np.float64)   # NULLs become nan
+        yield data
+        after = int(data[-1, 0])
+
+
+def check_trip_distances(min_ratio=1.0, max_ratio=3.0, backfill=False, chunk_size=CHUNK_SIZE):
+    # Flag trips whose stored distance is shorter than the straight line
+    # (impossible by road) or more than max_ratio times it. With backfill,
+    # trips with no stored distance get the detour-factor estimate.
+    # Returns (summary dict, list of flagged (trip_id, stored, straight_line)).
+    summary = {"checked": 0, "too_short": 0, "too_long": 0, "missing": 0, "backfilled": 0, "no_coords": 0}
+    flagged = []
+    for data in iter_trip_chunks(chunk_size):
+        trip_id, lat1, lon1, lat2, lon2, stored = data.T
+        straight = geodesic_km(lat1, lon1, lat2, lon2)
+        no_coords = np.isnan(straight)
+        missing = (np.isnan(stored) | (stored <= 0)) & ~no_coords
+        known = ~(missing | no_coords | np.isnan(stored))
+        # a little slack for rounding on very short trips
+        too_short = known & (stored < straight * min_ratio - 0.5)
+        too_long = known & (straight > 0) & (stored > straight * max_ratio + 0.5)
+
+        summary["checked"] += len(trip_id)
+        summary["no_coords"] += int(no_coords.sum())
+        summary["missing"] += int(missing.sum())
+        summary["too_short"] += int(too_short.sum())
+        summary["too_long"] += int(too_long.sum())
+        bad = too_short | too_long
+        flagged += zip(trip_id[bad].astype(int).tolist(), stored[bad].tolist(), straight[bad].round(3).tolist())
+
+        if backfill and missing.any():
+            estimates = (straight[missing] * DETOUR_FACTOR).round(3)
+            from db_pool import get_pool
+            with get_pool().writer() as conn:
+                conn.executemany(
+                    "UPDATE trip_info SET distance = ? WHERE trip_id = ?",
+                    zip(estimates.tolist(), trip_id[missing].astype(int).tolist()),
+                )
+            summary["backfilled"] += int(missing.sum())
+    return summary, flagged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate trip_info.distance against straight-line distance")
+    parser.add_argument("--min-ratio", type=float, default=1.0)
+    parser.add_argument("--max-ratio", type=float, default=3.0)
+    parser.add_argument("--backfill", action="store_true", help="fill missing distances with an estimate")
+    parser.add_argument("--show", type=int, default=20, help="number of flagged trips to list")
+    args = parser.parse_args()
+
+    summary, flagged = check_trip_distances(args.min_ratio, args.max_ratio, args.backfill)
+    print(", ".join(f"{k}: {v}" for k, v in summary.items()))
+    for trip_id, stored, straight in flagged[:args.show]:
+        print(f"  trip {trip_id}: stored {stored:.2f} km, straight line {straight:.2f} km")
@@ -0,0 +1,85 @@
+import hashlib
+
+from fastapi import Request, Response
+from starlette.middleware.gzip import GZipMiddleware
+
+from db_pool import get_pool
+from metrics import CACHES, HitCounter
+from versions import table_versions
+
+# Conditional GETs and compression for the API.
+#
+# A read endpoint's body depends only on its query string and the tables it
+# reads, so the ETag is built from the table_versions counters (one
+# primary-key read) plus a hash of the path and query. A client that sends
+# the ETag back in If-None-Match gets a 304 with no body before the endpoint
+# queries anything. Tags are weak because the same body may be sent
+# gzip/brotli-encoded or not. There is no Last-Modified: at one-second
+# resolution, a write in the same second as the previous response would
+# still get a 304 on If-Modified-Since.
+#
+# Responses of MIN_COMPRESS_BYTES or more are compressed: brotli when the
+# optional brotli-asgi package is installed and the client accepts it, gzip
+# otherwise.
+
+MIN_COMPRESS_BYTES = 1000
+GZIP_LEVEL = 6            # 9 costs ~2x the CPU for a few percent smaller pages
+CACHE_CONTROL = "private, no-cache"     # always revalidate, but keep a copy
+
+revalidations = HitCounter()            # 304s vs full responses
+CACHES.register("http_conditional", revalidations)
+
+
+class NotModified(Exception):
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def version_headers(conn, tables, request: Request):
+    # ETag / Cache-Control for this request against the current table versions
+    versions = table_versions(conn, tables)
+    counters = "-".join(str(versions.get(t, (0, None))[0]) for t in tables)
+    query = hashlib.blake2b(f"{request.url.path}?{request.url.query}".encode(), digest_size=6).hexdigest()
+    return {"ETag": f'W/"{counters}-{query}"', "Cache-Control": CACHE_CONTROL}
+
+
+def is_not_modified(request: Request, headers):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    etag = headers["ETag"].removeprefix("W/")
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def check(request: Request, response: Response, headers):
+    # Raise NotModified, or put the validators on the response that follows
+    if is_not_modified(request, headers):
+        revalidations.hit()
+        raise NotModified(headers)
+    revalidations.miss()
+    response.headers.update(headers)
+
+
+def conditional(*tables):
+    # Dependency for sync endpoints: Depends(conditional("trip_info"))
+    def dependency(request: Request, response: Response):
+        with get_pool().reader() as conn:
+            headers = version_headers(conn, tables, request)
+        check(request, response, headers)
+    return dependency
+
+
+async def not_modified_response(request, exc: NotModified):
+    return Response(status_code=304, headers=exc.headers)
+
+
+def add_http_caching(app):
+    # 304 handling plus response compression
+    app.add_exception_handler(NotModified, not_modified_response)
+    try:
+        from brotli_asgi import BrotliMiddleware    # optional: pip install brotli-asgi
+    except ImportError:
+        app.add_middleware(GZipMiddleware, minimum_size=MIN_COMPRESS_BYTES, compresslevel=GZIP_LEVEL)
+    else:
+        app.add_middleware(BrotliMiddleware, minimum_size=MIN_COMPRESS_BYTES, gzip_fallback=True)
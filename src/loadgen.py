@@ -0,0 +1,240 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from random import Random
+
+import numpy as np
+
+from realtime_simp import VEHICLE_TYPES, make_trip
+
+# Fleet-scale ingestion load: N simulated vehicles sending trips at a target
+# rate, through the database layer or the HTTP API.
+#
+# Load is open-loop: a scheduler releases trips on a fixed timetable and a
+# pool of workers sends them. Latency is measured from the scheduled time, so
+# when the target cannot keep up the queueing delay shows in the percentiles
+# instead of silently lowering the offered rate.
+#
+#   soak: one rate for --duration seconds
+#   ramp: --start-rate, raised by --step every --step-duration seconds until
+#         --max-rate or until the target saturates (achieved rate below 90% of
+#         offered, or p99 above --slo-ms)
+#
+# Point FLEETSTAT_DB at a scratch copy for the db targets; every trip is
+# really written.
+
+SATURATION_RATIO = 0.9
+
+
+# ---------- Targets ----------
+
+class DbTarget:
+    # insert_trip / insert_trips_bulk through the connection pool
+    def __init__(self, batch):
+        from db_handler import insert_trip, insert_trips_bulk
+        self.batch = batch
+        self.insert_trip = insert_trip
+        self.insert_trips_bulk = insert_trips_bulk
+
+    def send(self, trips):
+        if self.batch > 1:
+            result = self.insert_trips_bulk(trips)
+            if result["failed"]:
+                raise RuntimeError(f"{result['failed']} rows rejected: {result['errors'][0]['error']}")
+        else:
+            self.insert_trip(**trips[0])
+
+    def close(self):
+        pass
+
+
+class ApiTarget:
+    # POST /add_trip (or /trips/bulk) to a running server, or to the app
+    # in-process through TestClient when no URL is given
+    def __init__(self, url, batch, workers):
+        if url:
+            import requests
+            from requests.adapters import HTTPAdapter
+            self.client = requests.Session()
+            self.client.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+            self.client.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+            self.base = url.rstrip("/")
+            self.options = {"timeout": 30}
+        else:
+            from fastapi.testclient import TestClient
+            from api import app
+            self.client = TestClient(app)
+            self.base = ""
+            self.options = {}
+        self.batch = batch
+
+    def send(self, trips):
+        if self.batch > 1:
+            response = self.client.post(f"{self.base}/trips/bulk", json=trips, **self.options)
+        else:
+            response = self.client.post(f"{self.base}/add_trip", json=trips[0], **self.options)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        if self.batch > 1 and response.json().get("failed"):
+            raise RuntimeError(f"{response.json()['failed']} rows rejected")
+
+    def close(self):
+        self.client.close()
+
+
+# ---------- Load loop ----------
+
+def run_stage(target, fleet, rate, duration, workers, batch, seed):
+    # Offer `rate` trips/s for `duration` seconds. Returns a stats dict.
+    rng = Random(seed)
+    jobs = queue.Queue()
+    latencies = []
+    service = []
+    errors = {}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            scheduled, trips = job
+            started = time.perf_counter()
+            error = None
+            try:
+                target.send(trips)
+            except Exception as e:
+                error = type(e).__name__ if not str(e) else str(e)[:80]
+            done = time.perf_counter()
+            with lock:
+                if error:
+                    errors[error] = errors.get(error, 0) + len(trips)
+                else:
+                    latencies.append(done - scheduled)
+                    service.append(done - started)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+
+    interval = batch / rate
+    start = time.perf_counter()
+    sent = 0
+    n = 0
+    while True:
+        scheduled = start + n * interval
+        if scheduled - start >= duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        trips = []
+        for _ in range(batch):
+            vehicle_number, vehicle_type = fleet[(sent + len(trips)) % len(fleet)]
+            trips.append(make_trip(vehicle_number, vehicle_type, rng))
+        jobs.put((scheduled, trips))
+        sent += batch
+        n += 1
+
+    for _ in threads:
+        jobs.put(None)
+    for t in threads:
+        t.join()
+    # the offered window, or longer if the backlog took longer to drain
+    elapsed = max(time.perf_counter() - start, duration)
+
+    ok = len(latencies) * batch
+    failed = sum(errors.values())
+    stats = {
+        "offered_rate": rate,
+        "achieved_rate": round(ok / elapsed, 1),
+        "sent": sent,
+        "ok": ok,
+        "errors": failed,
+        "error_types": errors,
+        "elapsed_s": round(elapsed, 2),
+    }
+    if latencies:
+        lat = np.array(latencies) * 1000
+        stats.update({f"p{p}_ms": round(float(np.percentile(lat, p)), 2) for p in (50, 95, 99)})
+        stats["max_ms"] = round(float(lat.max()), 2)
+        stats["service_p50_ms"] = round(float(np.percentile(np.array(service) * 1000, 50)), 2)
+    return stats
+
+
+def saturated(stats, slo_ms):
+    if stats["achieved_rate"] < stats["offered_rate"] * SATURATION_RATIO:
+        return True
+    return slo_ms is not None and stats.get("p99_ms", float("inf")) > slo_ms
+
+
+def make_fleet(vehicles, prefix, seed):
+    rng = Random(seed)
+    return [(f"{prefix}{n:05d}", rng.choice(VEHICLE_TYPES)) for n in range(1, vehicles + 1)]
+
+
+def print_stats(stage, stats):
+    print(f"{stage:>6}{stats['offered_rate']:>10.0f}{stats['achieved_rate']:>10.0f}"
+          f"{stats.get('p50_ms', 0):>10.1f}{stats.get('p95_ms', 0):>10.1f}{stats.get('p99_ms', 0):>10.1f}"
+          f"{stats['errors']:>8}")
+    for error, count in stats["error_types"].items():
+        print(f"{'':>6}  {count} x {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FleetStat trip ingestion load generator")
+    parser.add_argument("--target", choices=["db", "api"], default="db")
+    parser.add_argument("--url", help="API base URL; with --target api and no URL the app runs in-process")
+    parser.add_argument("--mode", choices=["soak", "ramp"], default="soak")
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8, help="concurrent senders")
+    parser.add_argument("--batch", type=int, default=1, help="trips per request; >1 uses the bulk path")
+    parser.add_argument("--rate", type=float, default=100.0, help="soak: trips/s")
+    parser.add_argument("--duration", type=float, default=30.0, help="soak: seconds")
+    parser.add_argument("--start-rate", type=float, default=50.0)
+    parser.add_argument("--step", type=float, default=50.0)
+    parser.add_argument("--max-rate", type=float, default=5000.0)
+    parser.add_argument("--step-duration", type=float, default=10.0)
+    parser.add_argument("--slo-ms", type=float, help="ramp: stop once p99 latency exceeds this")
+    parser.add_argument("--prefix", default="LG", help="vehicle number prefix for generated trips")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write per-stage results to this file")
+    args = parser.parse_args()
+
+    if args.target == "db":
+        target = DbTarget(args.batch)
+    else:
+        target = ApiTarget(args.url, args.batch, args.workers)
+    fleet = make_fleet(args.vehicles, args.prefix, args.seed)
+
+    if args.mode == "soak":
+        rates = [args.rate]
+        duration = args.duration
+    else:
+        rates = list(np.arange(args.start_rate, args.max_rate + args.step / 2, args.step))
+        duration = args.step_duration
+
+    print(f"{args.target} target, {args.vehicles} vehicles, {args.workers} workers, batch {args.batch}")
+    print(f"{'stage':>6}{'offered':>10}{'achieved':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    results = []
+    try:
+        for stage, rate in enumerate(rates, 1):
+            stats = run_stage(target, fleet, float(rate), duration, args.workers, args.batch, args.seed + stage)
+            results.append(stats)
+            print_stats(stage, stats)
+            if args.mode == "ramp" and saturated(stats, args.slo_ms):
+                sustained = results[-2]["achieved_rate"] if len(results) > 1 else 0
+                print(f"saturated at {rate:.0f} trips/s offered; last sustained stage: {sustained:.0f} trips/s")
+                break
+    finally:
+        target.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "stages": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
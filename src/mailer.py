@@ -0,0 +1,321 @@
+import argparse
+import os
+import random
+import smtplib
+import socket
+import ssl
+import threading
+import time
+from datetime import datetime, timezone
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from db_pool import get_pool
+
+# Outbound mail queue.
+#
+#   python mailer.py worker           send queued mail until stopped
+#   python mailer.py status           counts by status
+#
+# Pages and jobs call enqueue_mail() / enqueue_many(), which only insert
+# rows into mail_outbox. One worker process drains it: it claims a batch
+# under a lease, sends the batch over a single SMTP session that stays open
+# across batches (re-opened after MAX_PER_CONNECTION messages, an idle gap or
+# a dropped connection) and paces itself with a token bucket at MAIL_RATE
+# messages/second. Temporary failures (4xx replies, network errors) are
+# retried with exponential backoff and jitter; permanent ones (5xx, refused
+# recipient) and messages out of attempts are marked failed.
+#
+# Delivery is at-least-once: if the worker dies after the server accepted a
+# message but before the batch was recorded, the message is sent again when
+# its lease runs out.
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "starttls")     # starttls | ssl | none
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASS = os.getenv("EMAIL_PASS")
+MAIL_FROM = os.getenv("MAIL_FROM") or EMAIL_USER
+
+MAIL_RATE = float(os.getenv("MAIL_RATE", "5"))         # messages/second; most providers throttle
+MAIL_BURST = int(os.getenv("MAIL_BURST", "10"))
+BATCH_SIZE = int(os.getenv("MAIL_BATCH", "50"))
+MAX_PER_CONNECTION = int(os.getenv("MAIL_MAX_PER_CONNECTION", "100"))
+IDLE_RECONNECT_S = 60       # servers drop idle sessions; check with NOOP after this long
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_S = 30
+BACKOFF_MAX_S = 3600
+LEASE_S = 300
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# ---------- Queue ----------
+
+MESSAGE_FIELDS = ("recipient", "subject", "body", "attachment_path", "attachment_name")
+
+
+def enqueue_many(messages):
+    # messages: dicts with recipient, subject, body and optionally
+    # attachment_path / attachment_name; returns the number queued
+    rows = []
+    for m in messages:
+        if not m.get("recipient") or "@" not in m["recipient"]:
+            raise ValueError(f"invalid recipient: {m.get('recipient')!r}")
+        rows.append(tuple(m.get(field) for field in MESSAGE_FIELDS) + (time.time(),))
+    with get_pool().writer() as conn:
+        conn.executemany(
+            f"INSERT INTO mail_outbox ({', '.join(MESSAGE_FIELDS)}, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+    return len(rows)
+
+
+def enqueue_mail(recipient, subject, body, attachment_path=None, attachment_name=None):
+    return enqueue_many([{"recipient": recipient, "subject": subject, "body": body,
+                          "attachment_path": attachment_path, "attachment_name": attachment_name}])
+
+
+def outbox_status():
+    with get_pool().reader() as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM mail_outbox GROUP BY status").fetchall())
+
+
+def claim_batch(size=BATCH_SIZE):
+    now = time.time()
+    with get_pool().writer() as conn:
+        rows = conn.execute(f"""
+            UPDATE mail_outbox SET status = 'sending', lease_until = ?, attempts = attempts + 1
+            WHERE message_id IN (
+                SELECT message_id FROM mail_outbox
+                WHERE (status = 'queued' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_until < ?)
+                ORDER BY next_attempt_at, message_id LIMIT ?
+            )
+            RETURNING message_id, attempts, {', '.join(MESSAGE_FIELDS)}
+        """, (now + LEASE_S, now, now, size)).fetchall()
+    rows.sort()
+    return [dict(zip(("message_id", "attempts") + MESSAGE_FIELDS, row)) for row in rows]
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def record_results(sent, retry, failed):
+    # sent: [message_id]; retry / failed: [(message_id, attempts, error)].
+    # A retry's attempts is written back: claim_batch already counted one,
+    # which send_batch hands back for messages it never got to try.
+    now = time.time()
+    with get_pool().writer() as conn:
+        conn.executemany("UPDATE mail_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE message_id = ?",
+                         [(_now(), message_id) for message_id in sent])
+        conn.executemany(
+            "UPDATE mail_outbox SET status = 'queued', attempts = ?, next_attempt_at = ?, last_error = ? "
+            "WHERE message_id = ?",
+            [(attempts, now + backoff(attempts), error, message_id) for message_id, attempts, error in retry],
+        )
+        conn.executemany("UPDATE mail_outbox SET status = 'failed', last_error = ? WHERE message_id = ?",
+                         [(error, message_id) for message_id, _, error in failed])
+
+
+# ---------- Sending ----------
+
+class RateLimiter:
+    # Token bucket: `rate` tokens a second, at most `burst` saved up
+    def __init__(self, rate=MAIL_RATE, burst=MAIL_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class SmtpSession:
+    # One SMTP connection reused across messages
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, security=SMTP_SECURITY, user=EMAIL_USER,
+                 password=EMAIL_PASS, timeout=SMTP_TIMEOUT, max_messages=MAX_PER_CONNECTION):
+        self.host, self.port, self.security = host, port, security
+        self.user, self.password = user, password
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.smtp = None
+        self.sent_on_connection = 0
+        self.last_used = 0.0
+        self.connections = 0
+
+    def _open(self):
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+        if self.user and self.password:
+            try:
+                smtp.login(self.user, self.password)
+            except BaseException:
+                smtp.close()
+                raise
+        self.smtp = smtp
+        self.sent_on_connection = 0
+        self.connections += 1
+
+    def _usable(self):
+        if self.smtp is None or self.sent_on_connection >= self.max_messages:
+            return False
+        if time.monotonic() - self.last_used > IDLE_RECONNECT_S:
+            try:
+                return self.smtp.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                return False
+        return True
+
+    def send(self, message, sender, recipient):
+        if not self._usable():
+            self.close()
+            self._open()
+        try:
+            self.smtp.send_message(message, sender, [recipient])
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            raise
+        except smtplib.SMTPException:
+            # the server answered (refused recipient, 4xx/5xx): the session is
+            # still good. SMTPException is an OSError, hence the order here.
+            raise
+        except OSError:
+            self.close()
+            raise
+        self.sent_on_connection += 1
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self.smtp.close()
+            self.smtp = None
+
+
+def build_message(item, sender=MAIL_FROM, attachments=None):
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = item["recipient"]
+    message["Subject"] = item["subject"] or ""
+    message.attach(MIMEText(item["body"] or "", "plain"))
+    path = item["attachment_path"]
+    if path:
+        # the same report often goes to many recipients: read it once per batch
+        if attachments is None or path not in attachments:
+            with open(path, "rb") as f:
+                data = f.read()
+            if attachments is not None:
+                attachments[path] = data
+        else:
+            data = attachments[path]
+        part = MIMEApplication(data, Name=item["attachment_name"] or os.path.basename(path))
+        part["Content-Disposition"] = f'attachment; filename="{item["attachment_name"] or os.path.basename(path)}"'
+        message.attach(part)
+    return message
+
+
+def _classify(error):
+    # "retry" for temporary problems, "fail" for permanent ones. Login and
+    # connect errors are configuration or server trouble, not the message's.
+    if isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPConnectError)):
+        return "retry"
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return "retry" if codes and all(400 <= code < 500 for code in codes) else "fail"
+    if isinstance(error, smtplib.SMTPResponseException):
+        return "retry" if 400 <= error.smtp_code < 500 else "fail"
+    if isinstance(error, (smtplib.SMTPException, OSError)):
+        return "retry"
+    return "fail"
+
+
+def send_batch(batch, session, limiter, sender=MAIL_FROM):
+    # Send a claimed batch; returns (sent, retry, failed) as record_results() takes them
+    sent, retry, failed = [], [], []
+    attachments = {}
+    for index, item in enumerate(batch):
+        try:
+            message = build_message(item, sender, attachments)
+        except OSError as e:
+            failed.append((item["message_id"], item["attempts"], f"attachment: {e}"))
+            continue
+        limiter.acquire()
+        try:
+            session.send(message, sender, item["recipient"])
+            sent.append(item["message_id"])
+        except (smtplib.SMTPException, OSError) as e:
+            error = f"{type(e).__name__}: {e}"[:500]
+            if _classify(e) == "fail" or item["attempts"] >= MAX_ATTEMPTS:
+                failed.append((item["message_id"], item["attempts"], error))
+            else:
+                retry.append((item["message_id"], item["attempts"], error))
+            if session.smtp is None:
+                # the connection went away; put the rest back untried, with
+                # the attempt claim_batch counted taken off again
+                retry += [(i["message_id"], i["attempts"] - 1, error) for i in batch[index + 1:]]
+                break
+    return sent, retry, failed
+
+
+def run_mailer(session=None, limiter=None, once=False, poll_interval=2.0, stop=None):
+    # Drain the outbox; with once=True return when nothing is due
+    session = session or SmtpSession()
+    limiter = limiter or RateLimiter()
+    stop = stop or threading.Event()
+    totals = {"sent": 0, "retry": 0, "failed": 0}
+    try:
+        while not stop.is_set():
+            batch = claim_batch()
+            if not batch:
+                if once:
+                    break
+                # keep the session only while there is work
+                if session.smtp is not None and time.monotonic() - session.last_used > IDLE_RECONNECT_S:
+                    session.close()
+                stop.wait(poll_interval)
+                continue
+            sent, retry, failed = send_batch(batch, session, limiter)
+            record_results(sent, retry, failed)
+            totals["sent"] += len(sent)
+            totals["retry"] += len(retry)
+            totals["failed"] += len(failed)
+    finally:
+        session.close()
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FleetStat outbound mail queue")
+    parser.add_argument("command", choices=["worker", "status"])
+    parser.add_argument("--once", action="store_true", help="exit when nothing is due")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for status, count in sorted(outbox_status().items()):
+            print(f"  {status:<8}{count:>8,}")
+    else:
+        print(f"sending via {SMTP_HOST}:{SMTP_PORT} at up to {MAIL_RATE:g} msg/s "
+              f"(host {socket.gethostname()})")
+        totals = run_mailer(once=args.once)
+        print(f"✅ sent {totals['sent']:,}, deferred {totals['retry']:,}, failed {totals['failed']:,}")
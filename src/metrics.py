@@ -0,0 +1,384 @@
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+# In-process metrics in the Prometheus text format.
+#
+#   fleetstat_http_request_duration_seconds{method, route, status}   API handlers
+#   fleetstat_query_duration_seconds{query, outcome} / fleetstat_query_rows{query}
+#                                                         named SQL calls; outcome is
+#                                                         ok or the exception's class
+#   fleetstat_compute_duration_seconds{step}              pandas / numpy work
+#   fleetstat_external_call_duration_seconds{service, call, outcome}
+#                                                         Google APIs etc.
+#   fleetstat_cache_requests_total{cache, result}         hits and misses of the
+#                                                         caches registered below
+#
+# api.py serves them at GET /metrics; other processes (the Streamlit app) can
+# serve them on their own port with FLEETSTAT_METRICS_PORT. Recording is a
+# perf_counter() pair, a bisect and a locked list update; FLEETSTAT_METRICS=0
+# turns the decorators and middleware into pass-throughs.
+#
+# Profiling: with FLEETSTAT_PROFILE_DIR set, an API request carrying an
+# `X-Profile: 1` header is sampled (every thread's stack every
+# PROFILE_INTERVAL_S) while it runs. If it takes at least
+# FLEETSTAT_PROFILE_MIN_MS, the samples are written to the directory in
+# collapsed-stack format (flamegraph.pl, speedscope) and the file name is
+# returned in an X-Profile-File header. Streamed responses (Server-Sent
+# Events, exports) are passed through unprofiled, since the header would have
+# to wait for the whole body. Without the variable the check is one header
+# lookup.
+
+ENABLED = os.getenv("FLEETSTAT_METRICS", "1") != "0"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+PROFILE_DIR = os.getenv("FLEETSTAT_PROFILE_DIR")
+PROFILE_MIN_S = float(os.getenv("FLEETSTAT_PROFILE_MIN_MS", "0")) / 1000
+PROFILE_INTERVAL_S = 0.001
+
+
+# ---------- Metric types ----------
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}       # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        names = self.labelnames + ("le",)
+        for labels, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class HitCounter:
+    # hits / misses for code that has no cache object of its own
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        self.hits += 1
+
+    def miss(self):
+        self.misses += 1
+
+
+class CacheStats:
+    # Reads .hits / .misses from registered caches at scrape time, so the
+    # caches themselves keep their existing counters and pay nothing extra
+    name = "fleetstat_cache_requests_total"
+
+    def __init__(self):
+        self._caches = {}
+        _registry.append(self)
+
+    def register(self, cache_name, cache):
+        self._caches[cache_name] = cache
+
+    def render(self):
+        lines = [f"# HELP {self.name} Cache lookups by result", f"# TYPE {self.name} counter"]
+        for cache_name, cache in sorted(self._caches.items()):
+            for result, attribute in (("hit", "hits"), ("miss", "misses")):
+                count = getattr(cache, attribute, 0)
+                lines.append(f"{self.name}{_labels(('cache', 'result'), (cache_name, result))} {count}")
+        return lines
+
+
+_registry = []
+
+REQUEST_LATENCY = Histogram("fleetstat_http_request_duration_seconds", "API request latency",
+                            ("method", "route", "status"))
+QUERY_LATENCY = Histogram("fleetstat_query_duration_seconds", "Named database call latency", ("query", "outcome"))
+QUERY_ROWS = Histogram("fleetstat_query_rows", "Rows returned or written by named database calls",
+                       ("query",), ROW_BUCKETS)
+COMPUTE_LATENCY = Histogram("fleetstat_compute_duration_seconds", "In-process data processing time", ("step",))
+EXTERNAL_LATENCY = Histogram("fleetstat_external_call_duration_seconds", "Calls to external services",
+                             ("service", "call", "outcome"))
+CACHES = CacheStats()
+
+
+def render():
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---------- Recording helpers ----------
+
+def _count_rows(result):
+    if result is None:
+        return None
+    if isinstance(result, dict):
+        for key in ("inserted", "items"):
+            if key in result:
+                value = result[key]
+                return value if isinstance(value, int) else len(value)
+        return None
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def timed_query(name, rows=_count_rows):
+    # Decorator: latency and row count of a named database call
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            outcome = "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "ok"
+            except Exception as e:
+                outcome = type(e).__name__
+                raise
+            finally:
+                QUERY_LATENCY.observe(time.perf_counter() - t0, name, outcome)
+            count = rows(result) if rows else None
+            if count is not None:
+                QUERY_ROWS.observe(count, name)
+            return result
+        return call
+    return wrap
+
+
+def timed_step(name):
+    # Decorator: latency of a compute step (pandas aggregation, model predict)
+    def wrap(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                COMPUTE_LATENCY.observe(time.perf_counter() - t0, name)
+        return call
+    return wrap
+
+
+@contextmanager
+def external_call(service, call):
+    # with external_call("google", "directions"): ...
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        if ENABLED:
+            EXTERNAL_LATENCY.observe(time.perf_counter() - t0, service, call, outcome)
+
+
+# ---------- Sampling profiler ----------
+
+class SamplingProfiler:
+    # Samples the Python stacks of every other thread at a fixed interval and
+    # tallies them; only stacks that pass through FleetStat's own modules are
+    # kept, so idle pool and server threads do not drown the profile.
+    def __init__(self, interval=PROFILE_INTERVAL_S):
+        self.interval = interval
+        self.samples = _Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack, ours = [], False
+                while frame is not None:
+                    code = frame.f_code
+                    ours = ours or code.co_filename.startswith(BASE_DIR)
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                if ours:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _profile_requested(scope):
+    if PROFILE_DIR is None:
+        return False
+    return any(name == b"x-profile" and value not in (b"", b"0") for name, value in scope["headers"])
+
+
+# ---------- ASGI middleware ----------
+
+class MetricsMiddleware:
+    # Request latency per route template (not raw path, to bound cardinality)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            return await self.app(scope, receive, send)
+
+        status = [500]
+        profiler = SamplingProfiler().start() if _profile_requested(scope) else None
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            if profiler is None:
+                await self.app(scope, receive, send_wrapper)
+            else:
+                await self._profiled(scope, receive, send, profiler, t0)
+                status[0] = scope.get("fleetstat.status", status[0])
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(time.perf_counter() - t0, scope["method"], path, str(status[0]))
+
+    async def _profiled(self, scope, receive, send, profiler, t0):
+        # The profile file name has to go out with the response headers, so
+        # the response is buffered until the request has finished. A streamed
+        # response (no Content-Length, or an event stream) is sent on as it
+        # comes and not profiled.
+        messages = []
+        streaming = False
+
+        async def buffer(message):
+            nonlocal streaming
+            if streaming:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers", []))
+                if b"content-length" not in headers or headers.get(b"content-type", b"").startswith(b"text/event-stream"):
+                    streaming = True
+                    profiler.stop()
+                    scope["fleetstat.status"] = message["status"]
+                    return await send(message)
+            messages.append(message)
+
+        try:
+            await self.app(scope, receive, buffer)
+        finally:
+            if not streaming:
+                profiler.stop()
+        if streaming:
+            return
+        elapsed = time.perf_counter() - t0
+        start = next(m for m in messages if m["type"] == "http.response.start")
+        scope["fleetstat.status"] = start["status"]
+        if elapsed >= PROFILE_MIN_S:
+            route = getattr(scope.get("route"), "path", "unmatched").strip("/").replace("/", "_") or "root"
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{elapsed * 1000:.0f}ms.folded"
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.write(os.path.join(PROFILE_DIR, name))
+            start["headers"] = list(start.get("headers", [])) + [(b"x-profile-file", name.encode())]
+        for message in messages:
+            await send(message)
+
+
+def instrument_app(app):
+    # Middleware plus GET /metrics on a FastAPI app
+    from fastapi.responses import Response
+
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return Response(render(), media_type=CONTENT_TYPE)
+
+
+# ---------- Standalone exporter ----------
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_from_env():
+    # For processes without an API (Streamlit): FLEETSTAT_METRICS_PORT=9108
+    # serves /metrics from a background thread; safe to call on every rerun
+    global _server
+    port = os.getenv("FLEETSTAT_METRICS_PORT")
+    if not port or _server is not None:
+        return
+    with _server_lock:
+        if _server is None:
+            _server = _start_server(int(port))
+
+
+def _start_server(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render().encode()
+            self.send_response(200 if self.path == "/metrics" else 404)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
@@ -0,0 +1,165 @@
+import sqlite3
+
+from rollups import (ROLLUP_TABLES, ROLLUP_TRIGGERS, REBUILD_SQL, ARCHIVED_ROLLUP_TABLE, FLEET_DAILY_TABLE,
+                     FLEET_DAILY_TRIGGERS, FLEET_DAILY_REBUILD_SQL)
+from versions import TABLE_VERSIONS_SQL
+from changefeed import TRIP_CHANGES
+from queries import VEHICLE_SEARCH
+from trip_routes import TRIP_ROUTE
+
+# Ordered schema migrations. The applied version is stored in the database
+# itself (PRAGMA user_version); migrate() runs every newer step, each in its
+# own write transaction, so a half-applied migration never sticks.
+# Append new steps at the end with the next version number; never edit or
+# reorder a step that has shipped. A step is an SQL script or a callable
+# taking the connection.
+
+BASE_TABLES = """
+CREATE TABLE IF NOT EXISTS vehicle_info (
+    vehicle_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vehicle_name TEXT,
+    vehicle_number TEXT UNIQUE,
+    owner_name TEXT,
+    vehicle_type TEXT,
+    registration_date TEXT
+);
+
+CREATE TABLE IF NOT EXISTS trip_info (
+    trip_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vehicle_number TEXT,
+    fuel_consumption REAL,
+    trip_date TEXT,
+    start_location TEXT,
+    end_location TEXT,
+    lat_start REAL,
+    lon_start REAL,
+    lat_end REAL,
+    lon_end REAL,
+    distance REAL
+);
+"""
+
+TRIP_INDEXES = """
+-- vehicle search / per-vehicle history ordered by date, and the vehicle <-> trip join
+CREATE INDEX IF NOT EXISTS idx_trip_vehicle_date ON trip_info (vehicle_number, trip_date);
+-- date-range filters and ORDER BY trip_date
+CREATE INDEX IF NOT EXISTS idx_trip_date ON trip_info (trip_date);
+ANALYZE;
+"""
+
+# Monthly archive files of old trips (see partitions.py)
+TRIP_PARTITIONS = """
+CREATE TABLE IF NOT EXISTS trip_partitions (
+    period TEXT PRIMARY KEY,            -- YYYY-MM
+    file_name TEXT NOT NULL,            -- relative to the archive directory
+    trip_count INTEGER NOT NULL,
+    first_trip_id INTEGER,
+    last_trip_id INTEGER,
+    date_from TEXT,
+    date_to TEXT,
+    size_bytes INTEGER,
+    archived_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+"""
+
+# Report jobs (see reports.py); lease_until is a unix time
+REPORT_JOBS = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    job_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,                 -- fleet | vehicle
+    period TEXT NOT NULL,               -- YYYY-MM
+    vehicle_number TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+    sections_total INTEGER,
+    sections_done INTEGER NOT NULL DEFAULT 0,
+    charts_reused INTEGER NOT NULL DEFAULT 0,
+    file_name TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs (status, job_id);
+"""
+
+# Outbound mail (see mailer.py); next_attempt_at and lease_until are unix times
+MAIL_OUTBOX = """
+CREATE TABLE IF NOT EXISTS mail_outbox (
+    message_id INTEGER PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    body TEXT,
+    attachment_path TEXT,
+    attachment_name TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',   -- queued | sending | sent | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+    sent_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox (status, next_attempt_at);
+"""
+
+MIGRATIONS = [
+    (1, "vehicle_info and trip_info tables", BASE_TABLES),
+    (2, "fleet / vehicle / daily rollups", ROLLUP_TABLES + REBUILD_SQL + ROLLUP_TRIGGERS),
+    (3, "trip_info secondary indexes", TRIP_INDEXES),
+    (4, "per-table change counters", TABLE_VERSIONS_SQL),
+    (5, "trip archive partitions", TRIP_PARTITIONS + ARCHIVED_ROLLUP_TABLE),
+    (6, "report job queue", REPORT_JOBS),
+    (7, "outbound mail queue", MAIL_OUTBOX),
+    (8, "trip change log", TRIP_CHANGES),
+    (9, "vehicle number search indexes", VEHICLE_SEARCH),
+    (10, "fleet daily rollup", FLEET_DAILY_TABLE + FLEET_DAILY_REBUILD_SQL + FLEET_DAILY_TRIGGERS),
+    (11, "stored trip routes", TRIP_ROUTE),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _statements(script):
+    # Split a script into single statements (trigger bodies stay whole)
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        if not statement and line.lstrip().startswith("--"):
+            continue
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+    if statement.strip():
+        yield statement
+
+
+def migrate(conn, target=LATEST_VERSION):
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > target or version <= schema_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have migrated while we waited for the lock
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for statement in _statements(step):
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
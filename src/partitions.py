@@ -0,0 +1,265 @@
+import argparse
+import os
+import sqlite3
+from datetime import date
+
+import pandas as pd
+
+from db_pool import DB_PATH, get_pool
+
+# Monthly partitions of trip history. Recent trips live in trip_info; months
+# older than the retention window are moved into one read-only SQLite file
+# per month under ARCHIVE_DIR (db/archive/trips_2024-01.db by default), listed
+# in the trip_partitions table (migrations.TRIP_PARTITIONS). db_handler.query_trips() reads trip_info plus
+# only the archive files whose dates overlap the requested range.
+#
+# Moving a month takes two transactions, because a transaction over an
+# ATTACHed file is not atomic when the main database is in WAL mode. First
+# the rows are copied into the archive file and committed there, and the
+# copy is counted. Then, in main alone, their totals are folded into
+# archived_rollup, they are deleted from trip_info and the partition is
+# recorded. The delete runs with the rollup, change-log and route delete
+# triggers suspended: the fleet / vehicle / daily rollups keep counting
+# archived trips, the change feed does not report them as deleted, and they
+# keep their stored routes. Only rows identical to their archived copy are
+# deleted. A crash between the two steps leaves the month in both places;
+# the next run copies it again and finishes the move.
+#
+# Archived months are read-only: trips that arrive later with an old date
+# stay in trip_info until the next run merges them into the month's file.
+
+ARCHIVE_DIR = os.path.abspath(os.getenv("FLEETSTAT_ARCHIVE_DIR") or os.path.join(os.path.dirname(DB_PATH), "archive"))
+KEEP_MONTHS = 12
+
+ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS {db}.trip_info (
+        trip_id INTEGER PRIMARY KEY,
+        vehicle_number TEXT,
+        fuel_consumption REAL,
+        trip_date TEXT,
+        start_location TEXT,
+        end_location TEXT,
+        lat_start REAL,
+        lon_start REAL,
+        lat_end REAL,
+        lon_end REAL,
+        distance REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS {db}.idx_trip_vehicle_date ON trip_info (vehicle_number, trip_date)",
+    "CREATE INDEX IF NOT EXISTS {db}.idx_trip_date ON trip_info (trip_date)",
+]
+
+TRIP_COLUMNS = ("trip_id, vehicle_number, fuel_consumption, trip_date, start_location, end_location, "
+                "lat_start, lon_start, lat_end, lon_end, distance")
+
+
+def next_period(period):
+    year, month = (int(p) for p in period.split("-"))
+    return f"{year + month // 12}-{month % 12 + 1:02d}"
+
+
+def _in_period(period):
+    # trip_date range of a month; plain string bounds so idx_trip_date is used
+    return "trip_date >= ? AND trip_date < ?", (period, next_period(period))
+
+
+# ---------- Reads ----------
+
+def archived_partitions(date_from=None, date_to=None, archive_dir=ARCHIVE_DIR):
+    # [(period, path)] of archives holding trips in [date_from, date_to]
+    clauses, params = [], []
+    if date_from:
+        clauses.append("date_to >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("date_from < date(?, '+1 day')")
+        params.append(str(date_to))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with get_pool().reader() as conn:
+        rows = conn.execute(f"SELECT period, file_name FROM trip_partitions {where} ORDER BY period", params).fetchall()
+    return [(period, os.path.join(archive_dir, name)) for period, name in rows]
+
+
+def open_archive(path):
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def read_archive(path, sql, params=()):
+    conn = open_archive(path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+
+def iter_archive_rows(columns=TRIP_COLUMNS, chunk_size=100000, archive_dir=ARCHIVE_DIR):
+    # Every archived trip, a list of rows at a time (for full exports)
+    for _, path in archived_partitions(archive_dir=archive_dir):
+        conn = open_archive(path)
+        try:
+            after = 0
+            while True:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM trip_info WHERE trip_id > ? ORDER BY trip_id LIMIT ?", (after, chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                yield rows
+                after = rows[-1][0]
+        finally:
+            conn.close()
+
+
+def date_bounds():
+    # (first, last) trip date over trip_info and every archive
+    with get_pool().reader() as conn:
+        return conn.execute("""
+            SELECT MIN(d_from), MAX(d_to) FROM (
+                SELECT MIN(trip_date) AS d_from, MAX(trip_date) AS d_to FROM trip_info
+                UNION ALL
+                SELECT MIN(date_from), MAX(date_to) FROM trip_partitions
+            )
+        """).fetchone()
+
+
+# ---------- Archival ----------
+
+def cold_periods(keep_months=KEEP_MONTHS, today=None):
+    # Months with trips in trip_info that are older than the retention window
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - keep_months
+    cutoff = f"{months // 12}-{months % 12 + 1:02d}"
+    with get_pool().reader() as conn:
+        rows = conn.execute("""
+            SELECT DISTINCT substr(trip_date, 1, 7) FROM trip_info
+            WHERE trip_date < ? AND trip_date GLOB '[0-9][0-9][0-9][0-9]-[0-1][0-9]*'
+            ORDER BY 1
+        """, (cutoff,)).fetchall()
+    return [period for period, in rows]
+
+
+def archive_period(period, archive_dir=ARCHIVE_DIR):
+    # Move one month out of trip_info into its archive file; returns a summary
+    os.makedirs(archive_dir, exist_ok=True)
+    file_name = f"trips_{period}.db"
+    path = os.path.join(archive_dir, file_name)
+    if os.path.exists(path):
+        os.chmod(path, 0o644)      # merging late arrivals into an archived month
+    in_period, bounds = _in_period(period)
+
+    with get_pool().writer() as conn:
+        conn.commit()
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            for statement in ARCHIVE_SCHEMA:
+                conn.execute(statement.format(db="archive"))
+            conn.execute("BEGIN IMMEDIATE")
+            moved = conn.execute(
+                f"INSERT OR REPLACE INTO archive.trip_info ({TRIP_COLUMNS}) "
+                f"SELECT {TRIP_COLUMNS} FROM main.trip_info WHERE {in_period}", bounds
+            ).rowcount
+            conn.commit()
+            archived = conn.execute(f"SELECT COUNT(*) FROM archive.trip_info WHERE {in_period}", bounds).fetchone()[0]
+            if archived < moved:
+                raise RuntimeError(f"archive {file_name} holds {archived} trips for {period}, {moved} were copied")
+
+            # main only from here on; a row changed since the copy stays for the next run
+            conn.execute("BEGIN IMMEDIATE")
+            same = " AND ".join(f"a.{c} IS trip_info.{c}" for c in TRIP_COLUMNS.split(", "))
+            moving = f"{in_period} AND EXISTS (SELECT 1 FROM archive.trip_info a WHERE {same})"
+            conn.execute(f"""
+                INSERT INTO archived_rollup (vehicle_number, trip_date, trip_count, total_distance, total_fuel)
+                SELECT COALESCE(vehicle_number, ''), COALESCE(date(trip_date), ''), COUNT(*),
+                       COALESCE(SUM(distance), 0), COALESCE(SUM(fuel_consumption), 0)
+                FROM main.trip_info WHERE {moving} GROUP BY 1, 2
+                ON CONFLICT (vehicle_number, trip_date) DO UPDATE SET trip_count = trip_count + excluded.trip_count,
+                    total_distance = total_distance + excluded.total_distance,
+                    total_fuel = total_fuel + excluded.total_fuel
+            """, bounds)
+
+            # the rows leave trip_info but stay in the rollups, keep their
+            # stored routes and are not deletions as far as the change feed
+            # is concerned
+            suspended = conn.execute(
+                "SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger' AND name IN "
+                "('trip_rollup_delete', 'trip_rollup_day_delete', 'trip_changes_delete', 'trip_route_delete')"
+            ).fetchall()
+            for name, _ in suspended:
+                conn.execute(f"DROP TRIGGER main.{name}")
+            conn.execute(f"DELETE FROM main.trip_info WHERE {moving}", bounds)
+            for _, trigger_sql in suspended:
+                conn.execute(trigger_sql)
+
+            count, first, last, date_from, date_to = conn.execute(
+                "SELECT COUNT(*), MIN(trip_id), MAX(trip_id), MIN(trip_date), MAX(trip_date) FROM archive.trip_info"
+            ).fetchone()
+            conn.execute("""
+                INSERT OR REPLACE INTO trip_partitions
+                    (period, file_name, trip_count, first_trip_id, last_trip_id, date_from, date_to)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (period, file_name, count, first, last, date_from, date_to))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+
+    size = compact_archive(path)
+    with get_pool().writer() as conn:
+        conn.execute("UPDATE trip_partitions SET size_bytes = ? WHERE period = ?", (size, period))
+    return {"period": period, "moved": moved, "trips": count, "size_bytes": size, "path": path}
+
+
+def compact_archive(path):
+    # Rollback journal (no -wal/-shm beside a read-only file), VACUUM, fresh
+    # planner stats, then drop write permission
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.chmod(path, 0o444)
+    return os.path.getsize(path)
+
+
+def archive_cold_partitions(keep_months=KEEP_MONTHS, today=None, archive_dir=ARCHIVE_DIR, dry_run=False):
+    periods = cold_periods(keep_months, today)
+    if dry_run:
+        return [{"period": p} for p in periods]
+    return [archive_period(period, archive_dir) for period in periods]
+
+
+def vacuum_main():
+    # Give the space freed by archiving back to the filesystem (takes the
+    # database offline for writers while it runs)
+    with get_pool().writer() as conn:
+        conn.commit()
+        conn.execute("VACUUM")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive cold trip_info months into read-only files")
+    parser.add_argument("--keep-months", type=int, default=KEEP_MONTHS, help="months kept in trip_info")
+    parser.add_argument("--dry-run", action="store_true", help="only list the months that would move")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the main database afterwards")
+    parser.add_argument("--list", action="store_true", help="list archived partitions")
+    args = parser.parse_args()
+
+    if args.list:
+        with get_pool().reader() as conn:
+            for row in conn.execute("SELECT period, trip_count, date_from, date_to, size_bytes, file_name "
+                                    "FROM trip_partitions ORDER BY period"):
+                print("  {}  {:>9,} trips  {} .. {}  {:>12,} bytes  {}".format(*row))
+    else:
+        results = archive_cold_partitions(args.keep_months, dry_run=args.dry_run)
+        for r in results:
+            if args.dry_run:
+                print(f"  would archive {r['period']}")
+            else:
+                print(f"  {r['period']}: moved {r['moved']:,} trips -> {r['path']} ({r['size_bytes']:,} bytes)")
+        if args.vacuum and not args.dry_run:
+            vacuum_main()
+        print(f"✅ {len(results)} month(s) {'to archive' if args.dry_run else 'archived'}")
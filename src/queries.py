@@ -0,0 +1,286 @@
+import base64
+import json
+
+from metrics import timed_query
+
+# Keyset ("seek") pagination and filtering for trip and vehicle listings.
+# A page is fetched with WHERE (sort key) > (last key seen) ... LIMIT n, so the
+# cost of a page does not grow with how deep into the table it is, and an
+# export can walk the whole result in short batches.
+
+TRIP_COLUMNS = ["trip_id", "vehicle_number", "fuel_consumption", "trip_date", "start_location",
+                "end_location", "lat_start", "lon_start", "lat_end", "lon_end", "distance"]
+
+VEHICLE_COLUMNS = ["vehicle_id", "vehicle_name", "vehicle_number", "owner_name", "vehicle_type",
+                   "registration_date", "trip_count", "total_distance"]
+
+# order name -> (key columns, descending)
+TRIP_ORDERS = {
+    "trip_id": (("trip_id",), False),
+    "-trip_id": (("trip_id",), True),
+    "trip_date": (("trip_date", "trip_id"), False),
+    "-trip_date": (("trip_date", "trip_id"), True),
+}
+
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 2000
+SEARCH_IN_LIST_MAX = 500
+
+
+def encode_cursor(order, key):
+    raw = json.dumps([order, list(key)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, order, key_length):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_order, key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(key, list) or len(key) != key_length or None in key:
+        raise ValueError("invalid cursor")
+    if cursor_order != order:
+        raise ValueError(f"cursor was issued for order={cursor_order}, not order={order}")
+    return key
+
+
+def parse_bbox(bbox):
+    # "min_lon,min_lat,max_lon,max_lat" (GeoJSON order)
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def trip_filters(vehicle_number=None, date_from=None, date_to=None, bbox=None, vehicle_numbers=None,
+                 vehicle_like=None):
+    # vehicle_numbers / vehicle_like come from vehicle_search_filter()
+    clauses, params = [], []
+    if vehicle_number:
+        clauses.append("vehicle_number = ?")
+        params.append(vehicle_number)
+    if vehicle_numbers is not None:
+        clauses.append(f"vehicle_number IN ({', '.join('?' * len(vehicle_numbers))})")
+        params += vehicle_numbers
+    if vehicle_like:
+        clauses.append("vehicle_number LIKE ? ESCAPE '\\'")
+        params.append(vehicle_like)
+    if date_from:
+        clauses.append("trip_date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        # trip_date may carry a time part, so compare against the next day's prefix
+        clauses.append("trip_date < date(?, '+1 day')")
+        params.append(str(date_to))
+    if bbox:
+        # trips that start or end inside the box
+        min_lon, min_lat, max_lon, max_lat = bbox
+        clauses.append(
+            "((lat_start BETWEEN ? AND ? AND lon_start BETWEEN ? AND ?)"
+            " OR (lat_end BETWEEN ? AND ? AND lon_end BETWEEN ? AND ?))"
+        )
+        params += [min_lat, max_lat, min_lon, max_lon] * 2
+    return clauses, params
+
+
+# ---------- Vehicle number search ----------
+# Substring search over vehicle numbers uses FTS5 trigram indexes (migrations.py,
+# version 9) instead of LIKE '%...%' over every trip: trip_vehicle_search
+# indexes vehicle_rollup, i.e. every vehicle with trips (archived months
+# included), vehicle_search the registered vehicles. A search is resolved to
+# the matching numbers first and trips are then read through
+# idx_trip_vehicle_date. A term matching more than SEARCH_IN_LIST_MAX vehicles
+# is not selective; it is applied as a LIKE on rows walked in sort order,
+# which stops as soon as a page is full.
+
+def _search_index(index, table, rowid):
+    # External-content index: it stores only the trigrams, kept in step with
+    # `table` by triggers (UPDATE OF vehicle_number, so rollup counters do not
+    # touch it)
+    return f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+    vehicle_number, content='{table}', content_rowid='{rowid}', tokenize='trigram'
+);
+INSERT INTO {index} ({index}) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table}
+BEGIN INSERT INTO {index} (rowid, vehicle_number) VALUES (NEW.{rowid}, NEW.vehicle_number); END;
+
+CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table}
+BEGIN INSERT INTO {index} ({index}, rowid, vehicle_number) VALUES ('delete', OLD.{rowid}, OLD.vehicle_number); END;
+
+CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF vehicle_number ON {table}
+BEGIN
+    INSERT INTO {index} ({index}, rowid, vehicle_number) VALUES ('delete', OLD.{rowid}, OLD.vehicle_number);
+    INSERT INTO {index} (rowid, vehicle_number) VALUES (NEW.{rowid}, NEW.vehicle_number);
+END;
+"""
+
+
+# migrations.py, version 9
+VEHICLE_SEARCH = (_search_index("vehicle_search", "vehicle_info", "vehicle_id")
+                  + _search_index("trip_vehicle_search", "vehicle_rollup", "rowid"))
+
+
+def like_pattern(term):
+    # '%term%' with LIKE wildcards in the term taken literally (ESCAPE '\')
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _search_condition(index, term):
+    # (SQL condition on the index table, parameter) for a case-insensitive substring
+    if len(term) >= 3:
+        return f"{index} MATCH ?", '"' + term.replace('"', '""') + '"'
+    # shorter than a trigram: scan the (small) content table instead
+    return "vehicle_number LIKE ? ESCAPE '\\'", like_pattern(term)
+
+
+def vehicle_matches(conn, term, index="trip_vehicle_search"):
+    condition, param = _search_condition(index, term.strip())
+    return [number for number, in conn.execute(f"SELECT vehicle_number FROM {index} WHERE {condition}", (param,))]
+
+
+def vehicle_search_filter(conn, term):
+    # trip_filters() arguments for a vehicle number substring search
+    matches = vehicle_matches(conn, term)
+    if len(matches) <= SEARCH_IN_LIST_MAX:
+        return {"vehicle_numbers": matches}
+    return {"vehicle_like": like_pattern(term.strip())}
+
+
+def resolve_search(conn, filters):
+    # Replace vehicle_search=term in a filter dict by what trip_filters() takes
+    filters = dict(filters)
+    term = filters.pop("vehicle_search", None)
+    if term and term.strip():
+        filters.update(vehicle_search_filter(conn, term))
+    return filters
+
+
+# ---------- Trip pages ----------
+
+def _seek(key_columns, descending, key):
+    op = "<" if descending else ">"
+    if len(key_columns) == 1:
+        return f"{key_columns[0]} {op} ?", list(key)
+    return f"({', '.join(key_columns)}) {op} ({', '.join('?' * len(key))})", list(key)
+
+
+def fetch_trips(conn, order, after, limit, filters):
+    # Up to `limit` rows after keyset `after` (None: from the start), in `order`
+    key_columns, descending = TRIP_ORDERS[order]
+    clauses, params = trip_filters(**filters)
+    if "trip_date" in key_columns:
+        # a NULL key would make the next page's seek NULL too; undated trips
+        # are listed by the trip_id orders only
+        clauses.append("trip_date IS NOT NULL")
+    if after is not None:
+        seek, seek_params = _seek(key_columns, descending, after)
+        clauses.append(seek)
+        params += seek_params
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    direction = "DESC" if descending else "ASC"
+    sql = f"""
+        SELECT {', '.join(TRIP_COLUMNS)} FROM trip_info {where}
+        ORDER BY {', '.join(f'{c} {direction}' for c in key_columns)}
+        LIMIT ?
+    """
+    return conn.execute(sql, params + [limit]).fetchall()
+
+
+def trip_key(row, order):
+    key_columns, _ = TRIP_ORDERS[order]
+    return [row[TRIP_COLUMNS.index(c)] for c in key_columns]
+
+
+@timed_query("queries.trip_page")
+def trip_page(conn, limit=100, cursor=None, order="trip_id", **filters):
+    if order not in TRIP_ORDERS:
+        raise ValueError(f"order must be one of {', '.join(TRIP_ORDERS)}")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    after = decode_cursor(cursor, order, len(TRIP_ORDERS[order][0])) if cursor else None
+
+    rows = fetch_trips(conn, order, after, limit + 1, resolve_search(conn, filters))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(order, trip_key(rows[-1], order))
+    return {"items": [dict(zip(TRIP_COLUMNS, row)) for row in rows], "next_cursor": next_cursor}
+
+
+def iter_trip_batches(checkout, order="trip_id", batch_size=EXPORT_BATCH_SIZE, **filters):
+    # Walk the whole filtered result in keyset batches. checkout() is a context
+    # manager yielding a connection (e.g. get_pool().reader); it is held only
+    # for one batch at a time so a slow client never pins a connection or an
+    # old WAL snapshot.
+    after = None
+    with checkout() as conn:
+        filters = resolve_search(conn, filters)
+    while True:
+        with checkout() as conn:
+            rows = fetch_trips(conn, order, after, batch_size, filters)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = trip_key(rows[-1], order)
+
+
+def _fetch_vehicles(conn, after, limit, vehicle_type=None, vehicle_number=None, vehicle_search=None):
+    clauses, params = [], []
+    if vehicle_type:
+        clauses.append("v.vehicle_type = ?")
+        params.append(vehicle_type)
+    if vehicle_number:
+        clauses.append("v.vehicle_number = ?")
+        params.append(vehicle_number)
+    if vehicle_search and vehicle_search.strip():
+        condition, param = _search_condition("vehicle_search", vehicle_search.strip())
+        clauses.append(f"v.vehicle_id IN (SELECT rowid FROM vehicle_search WHERE {condition})")
+        params.append(param)
+    if after is not None:
+        clauses.append("v.vehicle_id > ?")
+        params.append(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"""
+        SELECT v.vehicle_id, v.vehicle_name, v.vehicle_number, v.owner_name, v.vehicle_type,
+               v.registration_date, COALESCE(r.trip_count, 0), ROUND(COALESCE(r.total_distance, 0), 2)
+        FROM vehicle_info v
+        LEFT JOIN vehicle_rollup r ON r.vehicle_number = v.vehicle_number
+        {where}
+        ORDER BY v.vehicle_id
+        LIMIT ?
+    """
+    return conn.execute(sql, params + [limit]).fetchall()
+
+
+@timed_query("queries.vehicle_page")
+def vehicle_page(conn, limit=100, cursor=None, **filters):
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    after = decode_cursor(cursor, "vehicle_id", 1)[0] if cursor else None
+
+    rows = _fetch_vehicles(conn, after, limit + 1, **filters)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor("vehicle_id", [rows[-1][0]])
+    return {"items": [dict(zip(VEHICLE_COLUMNS, row)) for row in rows], "next_cursor": next_cursor}
+
+
+def iter_vehicle_batches(checkout, batch_size=EXPORT_BATCH_SIZE, **filters):
+    after = None
+    while True:
+        with checkout() as conn:
+            rows = _fetch_vehicles(conn, after, batch_size, **filters)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][0]
@@ -1,22 +1,58 @@
 import time
 from db_handler import insert_trip
 from datetime import datetime
-from random import uniform
+from random import Random
 
-def simulate_trip():
+from geo import estimate_road_km
+
+# City depots trips run between: (name, lat, lon)
+CITIES = [
+    ("Jaipur", 26.9124, 75.7873),
+    ("Churu", 28.3042, 74.7375),
+    ("Jodhpur", 26.2389, 73.0243),
+    ("Udaipur", 24.5854, 73.7125),
+    ("Ajmer", 26.4499, 74.6399),
+    ("Kota", 25.2138, 75.8648),
+    ("Bikaner", 28.0229, 73.3119),
+    ("Alwar", 27.5530, 76.6346),
+    ("Sikar", 27.6094, 75.1399),
+    ("Bhilwara", 25.3407, 74.6313),
+    ("Delhi", 28.6139, 77.2090),
+    ("Agra", 27.1767, 78.0081),
+    ("Ahmedabad", 23.0225, 72.5714),
+    ("Indore", 22.7196, 75.8577),
+]
+
+# km per litre, (low, high) by vehicle type
+MILEAGE = {"Car": (12, 18), "Bike": (35, 55), "Truck": (3, 6), "Bus": (3.5, 5.5)}
+VEHICLE_TYPES = list(MILEAGE)
+
+
+def make_trip(vehicle_number, vehicle_type="Truck", rng=None, trip_date=None):
+    # One plausible trip between two different cities: road distance is the
+    # detour estimate with some jitter, fuel follows the type's mileage.
+    rng = rng or Random()
+    (start, lat1, lon1), (end, lat2, lon2) = rng.sample(CITIES, 2)
+    distance = float(estimate_road_km(lat1, lon1, lat2, lon2)) * rng.uniform(0.95, 1.1)
+    fuel = distance / rng.uniform(*MILEAGE.get(vehicle_type, MILEAGE["Truck"]))
+    return {
+        "vehicle_number": vehicle_number,
+        "fuel_consumption": round(fuel, 2),
+        "trip_date": str(trip_date or datetime.now().date()),
+        "start_location": start,
+        "end_location": end,
+        "lat_start": lat1, "lon_start": lon1,
+        "lat_end": lat2, "lon_end": lon2,
+        "distance": round(distance, 2),
+    }
+
+
+def simulate_trip(vehicle_number="RJ14XYZ1234", interval=5):
+    # Single-vehicle trickle feed; see loadgen.py for fleet-scale load
     while True:
-        insert_trip(
-            vehicle_number="RJ14XYZ1234",
-            fuel_consumption=round(uniform(2.5, 8.5), 2),
-            trip_date=datetime.now().date(),
-            start_location="Jaipur",
-            end_location="Churu",
-            lat_start=26.9124, lon_start=75.7873,
-            lat_end=28.3042, lon_end=74.7375,
-            distance=round(uniform(180, 220), 2)
-        )
+        insert_trip(**make_trip(vehicle_number, "Truck"))
         print("Trip inserted.")
-        time.sleep(5)  # Simulate every 5 seconds
+        time.sleep(interval)
 
 if __name__ == "__main__":
     simulate_trip()
@@ -0,0 +1,382 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+from db_pool import DB_PATH, get_pool
+from partitions import next_period
+
+# Monthly PDF reports, rendered off the UI/API by a worker process.
+#
+#   python reports.py worker [--processes 4]      run the queue
+#   python reports.py enqueue 2025-06 [--vehicle RJ14AB1234]
+#
+# The Streamlit "Reports" page and POST /reports only insert a row into
+# report_jobs; the worker claims jobs one at a time with a lease (a crashed
+# worker's job is picked up again once its lease runs out), renders chart
+# images on a process pool and assembles the PDF.
+#
+# Everything is read from vehicle_daily_rollup, which also counts archived
+# months, so a report never scans trip_info. Each section (one vehicle, or
+# the fleet overview) is keyed on a hash of the rollup rows it is drawn from:
+# charts whose rows did not change since an earlier report are reused from
+# the chart cache, and a report whose sections all match an existing PDF is
+# served from that file without rendering anything.
+
+REPORT_DIR = os.path.abspath(os.getenv("FLEETSTAT_REPORT_DIR") or os.path.join(os.path.dirname(DB_PATH), "reports"))
+CHART_DIR = os.path.join(REPORT_DIR, "charts")
+RENDER_VERSION = 1          # bump when charts or layout change, to invalidate the caches
+JOB_LEASE_S = 600           # a running job is reclaimed after this long without progress
+PROGRESS_EVERY_S = 2.0      # progress is stored, and the lease renewed, at least this often
+KINDS = ("fleet", "vehicle")
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# ---------- Queue ----------
+
+def enqueue_report(kind, period, vehicle_number=None):
+    # Returns the job id; an identical job that is still queued or running is reused
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    datetime.strptime(period, "%Y-%m")
+    if (kind == "vehicle") != bool(vehicle_number):
+        raise ValueError("vehicle reports need a vehicle_number, fleet reports must not have one")
+    with get_pool().writer() as conn:
+        row = conn.execute("""
+            SELECT job_id FROM report_jobs
+            WHERE kind = ? AND period = ? AND vehicle_number IS ? AND status IN ('queued', 'running')
+        """, (kind, period, vehicle_number)).fetchone()
+        if row:
+            return row[0]
+        return conn.execute(
+            "INSERT INTO report_jobs (kind, period, vehicle_number) VALUES (?, ?, ?)",
+            (kind, period, vehicle_number),
+        ).lastrowid
+
+
+JOB_COLUMNS = ("job_id", "kind", "period", "vehicle_number", "status", "sections_total", "sections_done",
+               "charts_reused", "file_name", "error", "created_at", "started_at", "finished_at")
+
+
+def get_job(job_id):
+    with get_pool().reader() as conn:
+        row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM report_jobs WHERE job_id = ?",
+                           (job_id,)).fetchone()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+def list_jobs(limit=50):
+    with get_pool().reader() as conn:
+        rows = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM report_jobs ORDER BY job_id DESC LIMIT ?",
+                            (limit,)).fetchall()
+    return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+
+def report_path(job):
+    # Absolute path of a finished job's PDF, or None
+    if not job or job["status"] != "done" or not job["file_name"]:
+        return None
+    path = os.path.join(REPORT_DIR, job["file_name"])
+    return path if os.path.exists(path) else None
+
+
+def claim_job(worker):
+    now = time.time()
+    with get_pool().writer() as conn:
+        row = conn.execute("""
+            UPDATE report_jobs SET status = 'running', started_at = ?, lease_until = ?,
+                attempts = attempts + 1, worker = ?, error = NULL
+            WHERE job_id = (
+                SELECT job_id FROM report_jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)
+                ORDER BY job_id LIMIT 1
+            )
+            RETURNING job_id, kind, period, vehicle_number
+        """, (_now(), now + JOB_LEASE_S, worker, now)).fetchone()
+    return dict(zip(("job_id", "kind", "period", "vehicle_number"), row)) if row else None
+
+
+def _update_job(job_id, **fields):
+    if "status" in fields or "sections_done" in fields:
+        fields["lease_until"] = time.time() + JOB_LEASE_S
+    if fields.get("status") in ("done", "failed"):
+        fields["finished_at"] = _now()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with get_pool().writer() as conn:
+        conn.execute(f"UPDATE report_jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+
+# ---------- Report data ----------
+
+def _digest(*parts):
+    return hashlib.blake2b(json.dumps([RENDER_VERSION, *parts], default=str).encode(), digest_size=10).hexdigest()
+
+
+def report_sections(period, vehicle_number=None):
+    # [(section dict)] for a month, built from the daily rollups. The first
+    # section of a fleet report is the fleet overview.
+    vehicle_clause, params = "", [period, next_period(period)]
+    if vehicle_number:
+        vehicle_clause = "AND r.vehicle_number = ?"
+        params.append(vehicle_number)
+    with get_pool().reader() as conn:
+        rows = conn.execute(f"""
+            SELECT r.vehicle_number, r.trip_date, r.trip_count, r.total_distance, r.total_fuel,
+                   v.vehicle_name, v.vehicle_type, v.owner_name
+            FROM vehicle_daily_rollup r
+            LEFT JOIN vehicle_info v ON v.vehicle_number = r.vehicle_number
+            WHERE r.trip_date >= ? AND r.trip_date < ? {vehicle_clause}
+            ORDER BY r.vehicle_number, r.trip_date
+        """, params).fetchall()
+
+    vehicles = {}
+    for number, day, trips, distance, fuel, name, vtype, owner in rows:
+        section = vehicles.setdefault(number, {
+            "title": number, "vehicle_name": name, "vehicle_type": vtype, "owner_name": owner,
+            "days": [], "trips": [], "distance": [], "fuel": [],
+        })
+        section["days"].append(day)
+        section["trips"].append(trips)
+        section["distance"].append(round(distance, 3))
+        section["fuel"].append(round(fuel, 3))
+
+    sections = list(vehicles.values())
+    if not vehicle_number:
+        fleet = {}
+        for s in sections:
+            for day, trips, distance, fuel in zip(s["days"], s["trips"], s["distance"], s["fuel"]):
+                totals = fleet.setdefault(day, [0, 0.0, 0.0])
+                totals[0] += trips
+                totals[1] += distance
+                totals[2] += fuel
+        days = sorted(fleet)
+        sections.insert(0, {
+            "title": "Fleet overview", "vehicles": len(vehicles), "days": days,
+            "trips": [fleet[d][0] for d in days],
+            "distance": [round(fleet[d][1], 3) for d in days],
+            "fuel": [round(fleet[d][2], 3) for d in days],
+        })
+
+    for s in sections:
+        s["totals"] = {"trips": sum(s["trips"]), "distance": round(sum(s["distance"]), 2),
+                       "fuel": round(sum(s["fuel"]), 2)}
+        s["totals"]["mileage"] = round(s["totals"]["distance"] / s["totals"]["fuel"], 2) if s["totals"]["fuel"] else 0
+        chart_key = _digest(s["title"], s["days"], s["distance"], s["fuel"])
+        s["chart"] = os.path.join(CHART_DIR, f"{_digest(s['title'])}-{chart_key}.png")
+        s["key"] = _digest(chart_key, s["trips"], [s.get(k) for k in ("vehicle_name", "vehicle_type", "owner_name")])
+    return sections
+
+
+# ---------- Rendering (runs in the worker processes) ----------
+
+def render_chart(path, title, days, distance, fuel):
+    # Daily distance bars with fuel on a second axis. Figure objects (no
+    # pyplot) keep the worker free of global GUI state.
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 3), dpi=110)
+    ax = fig.subplots()
+    labels = [d[8:10] for d in days]
+    ax.bar(labels, distance, color="#4c78a8", label="Distance (km)")
+    ax.set_ylabel("Distance (km)")
+    ax.set_xlabel("Day")
+    ax.set_title(title)
+    ax.tick_params(axis="x", labelsize=7)
+    fuel_ax = ax.twinx()
+    fuel_ax.plot(labels, fuel, color="#e45756", marker="o", markersize=3, label="Fuel (L)")
+    fuel_ax.set_ylabel("Fuel (L)")
+    fig.tight_layout()
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp, format="png")
+    os.replace(tmp, path)
+    return path
+
+
+def _latin1(text):
+    # FPDF 1.7 core fonts are latin-1 only
+    return str(text if text is not None else "-").encode("latin-1", "replace").decode("latin-1")
+
+
+def build_pdf(path, heading, period, sections):
+    from fpdf import FPDF
+
+    pdf = FPDF(orientation="P", unit="mm", format="A4")
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 18)
+    pdf.cell(0, 12, _latin1(heading), ln=1)
+    pdf.set_font("Arial", "", 10)
+    pdf.cell(0, 6, _latin1(f"Period {period} - generated {_now()}"), ln=1)
+
+    for index, s in enumerate(sections):
+        if pdf.get_y() > 180:
+            pdf.add_page()
+        pdf.ln(4)
+        pdf.set_font("Arial", "B", 13)
+        pdf.cell(0, 8, _latin1(s["title"]), ln=1)
+        pdf.set_font("Arial", "", 9)
+        details = [f"{k.replace('_', ' ').title()}: {s[k]}" for k in ("vehicle_name", "vehicle_type", "owner_name",
+                                                                     "vehicles") if k in s]
+        totals = s["totals"]
+        details.append(f"Trips: {totals['trips']:,}   Distance: {totals['distance']:,.1f} km   "
+                       f"Fuel: {totals['fuel']:,.1f} L   Mileage: {totals['mileage']} km/L")
+        for line in details:
+            pdf.cell(0, 5, _latin1(line), ln=1)
+        if s["days"] and os.path.exists(s["chart"]):
+            pdf.image(s["chart"], x=pdf.l_margin, y=pdf.get_y() + 1, w=180)
+            pdf.set_y(pdf.get_y() + 70)
+
+        if index == 0 and "vehicles" in s and len(sections) > 1:
+            # fleet overview: one table row per vehicle before the vehicle pages
+            pdf.ln(2)
+            pdf.set_font("Arial", "B", 9)
+            for label, width in (("Vehicle", 45), ("Trips", 25), ("Distance km", 35), ("Fuel L", 30), ("km/L", 25)):
+                pdf.cell(width, 6, label, border=1)
+            pdf.ln()
+            pdf.set_font("Arial", "", 8)
+            for v in sorted(sections[1:], key=lambda v: -v["totals"]["distance"]):
+                t = v["totals"]
+                for value, width in ((v["title"], 45), (f"{t['trips']:,}", 25), (f"{t['distance']:,.1f}", 35),
+                                     (f"{t['fuel']:,.1f}", 30), (t["mileage"], 25)):
+                    pdf.cell(width, 5, _latin1(value), border=1)
+                pdf.ln()
+            pdf.add_page()
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pdf.output(tmp, "F")
+    os.replace(tmp, path)
+    return path
+
+
+# ---------- Worker ----------
+
+def run_job(job, pool):
+    # Render one claimed job; returns the fields stored on completion
+    sections = report_sections(job["period"], job["vehicle_number"])
+    name = job["vehicle_number"] or "fleet"
+    report_key = _digest(job["kind"], name, job["period"], [s["key"] for s in sections])
+    file_name = f"{job['kind']}-{_digest(name)}-{job['period']}-{report_key}.pdf"
+    path = os.path.join(REPORT_DIR, file_name)
+    if os.path.exists(path):
+        # nothing the report is drawn from changed since it was last built
+        os.utime(path)
+        return {"file_name": file_name, "sections_total": len(sections), "sections_done": len(sections),
+                "charts_reused": len(sections)}
+
+    missing = []
+    for s in sections:
+        if not s["days"]:
+            continue
+        try:
+            os.utime(s["chart"])     # keeps reused charts out of prune_cache()
+        except FileNotFoundError:
+            missing.append(s)
+    reused = len(sections) - len(missing)
+    _update_job(job["job_id"], sections_total=len(sections), sections_done=reused, charts_reused=reused)
+
+    # Waits time out every PROGRESS_EVERY_S so the lease is renewed while a
+    # slow chart or a long PDF is still running, not only when one finishes
+    done, last_update = reused, time.monotonic()
+    futures = [pool.submit(render_chart, s["chart"], s["title"], s["days"], s["distance"], s["fuel"])
+               for s in missing]
+    pending = set(futures)
+    try:
+        while pending:
+            finished, pending = wait(pending, timeout=PROGRESS_EVERY_S, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()
+                done += 1
+            if time.monotonic() - last_update >= PROGRESS_EVERY_S:
+                _update_job(job["job_id"], sections_done=done)
+                last_update = time.monotonic()
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    heading = f"FleetStat {'fleet' if job['kind'] == 'fleet' else 'vehicle'} report: {name}"
+    pdf = pool.submit(build_pdf, path, heading, job["period"], sections)
+    while True:
+        try:
+            pdf.result(timeout=PROGRESS_EVERY_S)
+            break
+        except FutureTimeout:
+            if pdf.done():      # build_pdf itself raised TimeoutError
+                raise
+            _update_job(job["job_id"], sections_done=done)
+    return {"file_name": file_name, "sections_total": len(sections), "sections_done": len(sections),
+            "charts_reused": reused}
+
+
+def run_worker(processes=None, poll_interval=1.0, once=False):
+    # Claim and run jobs until stopped (or until the queue is empty with once=True)
+    os.makedirs(CHART_DIR, exist_ok=True)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    # spawn: the children import only what rendering needs and inherit no
+    # SQLite connections or threads from this process
+    with ProcessPoolExecutor(processes, mp_context=get_context("spawn")) as pool:
+        while True:
+            job = claim_job(worker)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            started = time.perf_counter()
+            try:
+                result = run_job(job, pool)
+            except Exception as e:
+                _update_job(job["job_id"], status="failed", error=f"{type(e).__name__}: {e}")
+                print(f"  job {job['job_id']} failed: {e}")
+                continue
+            _update_job(job["job_id"], status="done", **result)
+            print(f"  job {job['job_id']} {job['kind']} {job['vehicle_number'] or ''} {job['period']}: "
+                  f"{result['sections_total']} sections ({result['charts_reused']} reused) "
+                  f"in {time.perf_counter() - started:.1f}s")
+
+
+def prune_cache(max_age_days=30):
+    # Remove charts and PDFs that were neither built nor reused for max_age_days
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for directory in (REPORT_DIR, CHART_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FleetStat report queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker_cmd = commands.add_parser("worker", help="run queued report jobs")
+    worker_cmd.add_argument("--processes", type=int, default=None, help="render processes (default: CPUs)")
+    worker_cmd.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    enqueue_cmd = commands.add_parser("enqueue", help="queue a monthly report")
+    enqueue_cmd.add_argument("period", help="YYYY-MM")
+    enqueue_cmd.add_argument("--vehicle", help="vehicle number (default: fleet report)")
+    prune_cmd = commands.add_parser("prune", help="delete cached charts and reports")
+    prune_cmd.add_argument("--max-age-days", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(args.processes, once=args.once)
+    elif args.command == "enqueue":
+        kind = "vehicle" if args.vehicle else "fleet"
+        print(f"✅ queued job {enqueue_report(kind, args.period, args.vehicle)}")
+    else:
+        print(f"✅ removed {prune_cache(args.max_age_days)} cached file(s)")
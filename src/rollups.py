@@ -0,0 +1,293 @@
+from contextlib import contextmanager
+
+# Summary tables kept in sync with trip_info by triggers, so every writer
+# (db_handler, the API, the Streamlit forms, plain sqlite3) updates them
+# without having to remember to. Rows with no vehicle/date are grouped under ''.
+
+ROLLUP_TABLES = """
+CREATE TABLE IF NOT EXISTS fleet_rollup (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    trip_count INTEGER NOT NULL DEFAULT 0,
+    total_distance REAL NOT NULL DEFAULT 0,
+    total_fuel REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS vehicle_rollup (
+    vehicle_number TEXT PRIMARY KEY,
+    trip_count INTEGER NOT NULL DEFAULT 0,
+    total_distance REAL NOT NULL DEFAULT 0,
+    total_fuel REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS vehicle_daily_rollup (
+    vehicle_number TEXT NOT NULL,
+    trip_date TEXT NOT NULL,
+    trip_count INTEGER NOT NULL DEFAULT 0,
+    total_distance REAL NOT NULL DEFAULT 0,
+    total_fuel REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (vehicle_number, trip_date)
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO fleet_rollup (id) VALUES (1);
+"""
+
+
+def _vehicle_key(row):
+    return f"COALESCE({row}.vehicle_number, '')"
+
+
+def _day_key(row):
+    return f"COALESCE(date({row}.trip_date), '')"
+
+
+def _add(row):
+    distance = f"COALESCE({row}.distance, 0)"
+    fuel = f"COALESCE({row}.fuel_consumption, 0)"
+    return f"""
+    UPDATE fleet_rollup SET trip_count = trip_count + 1,
+        total_distance = total_distance + {distance}, total_fuel = total_fuel + {fuel}
+    WHERE id = 1;
+    INSERT INTO vehicle_rollup (vehicle_number, trip_count, total_distance, total_fuel)
+    VALUES ({_vehicle_key(row)}, 1, {distance}, {fuel})
+    ON CONFLICT (vehicle_number) DO UPDATE SET trip_count = trip_count + 1,
+        total_distance = total_distance + excluded.total_distance,
+        total_fuel = total_fuel + excluded.total_fuel;
+    INSERT INTO vehicle_daily_rollup (vehicle_number, trip_date, trip_count, total_distance, total_fuel)
+    VALUES ({_vehicle_key(row)}, {_day_key(row)}, 1, {distance}, {fuel})
+    ON CONFLICT (vehicle_number, trip_date) DO UPDATE SET trip_count = trip_count + 1,
+        total_distance = total_distance + excluded.total_distance,
+        total_fuel = total_fuel + excluded.total_fuel;
+    """
+
+
+def _subtract(row):
+    distance = f"COALESCE({row}.distance, 0)"
+    fuel = f"COALESCE({row}.fuel_consumption, 0)"
+    return f"""
+    UPDATE fleet_rollup SET trip_count = trip_count - 1,
+        total_distance = total_distance - {distance}, total_fuel = total_fuel - {fuel}
+    WHERE id = 1;
+    UPDATE vehicle_rollup SET trip_count = trip_count - 1,
+        total_distance = total_distance - {distance}, total_fuel = total_fuel - {fuel}
+    WHERE vehicle_number = {_vehicle_key(row)};
+    DELETE FROM vehicle_rollup WHERE vehicle_number = {_vehicle_key(row)} AND trip_count <= 0;
+    UPDATE vehicle_daily_rollup SET trip_count = trip_count - 1,
+        total_distance = total_distance - {distance}, total_fuel = total_fuel - {fuel}
+    WHERE vehicle_number = {_vehicle_key(row)} AND trip_date = {_day_key(row)};
+    DELETE FROM vehicle_daily_rollup
+    WHERE vehicle_number = {_vehicle_key(row)} AND trip_date = {_day_key(row)} AND trip_count <= 0;
+    """
+
+
+ROLLUP_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS trip_rollup_insert AFTER INSERT ON trip_info
+BEGIN {_add("NEW")} END;
+
+CREATE TRIGGER IF NOT EXISTS trip_rollup_delete AFTER DELETE ON trip_info
+BEGIN {_subtract("OLD")} END;
+
+CREATE TRIGGER IF NOT EXISTS trip_rollup_update
+AFTER UPDATE OF vehicle_number, trip_date, distance, fuel_consumption ON trip_info
+BEGIN {_subtract("OLD")} {_add("NEW")} END;
+"""
+
+
+REBUILD_SQL = """
+DELETE FROM vehicle_rollup;
+DELETE FROM vehicle_daily_rollup;
+
+UPDATE fleet_rollup SET
+    trip_count = (SELECT COUNT(*) FROM trip_info),
+    total_distance = (SELECT COALESCE(SUM(distance), 0) FROM trip_info),
+    total_fuel = (SELECT COALESCE(SUM(fuel_consumption), 0) FROM trip_info)
+WHERE id = 1;
+
+INSERT INTO vehicle_rollup (vehicle_number, trip_count, total_distance, total_fuel)
+SELECT COALESCE(vehicle_number, ''), COUNT(*),
+       COALESCE(SUM(distance), 0), COALESCE(SUM(fuel_consumption), 0)
+FROM trip_info GROUP BY 1;
+
+INSERT INTO vehicle_daily_rollup (vehicle_number, trip_date, trip_count, total_distance, total_fuel)
+SELECT COALESCE(vehicle_number, ''), COALESCE(date(trip_date), ''), COUNT(*),
+       COALESCE(SUM(distance), 0), COALESCE(SUM(fuel_consumption), 0)
+FROM trip_info GROUP BY 1, 2;
+"""
+
+
+# Trips moved out of trip_info into monthly archive files (partitions.py)
+# still count towards the rollups. Their per-vehicle, per-day totals are kept
+# here so a rebuild can add them back without opening the archives.
+ARCHIVED_ROLLUP_TABLE = """
+CREATE TABLE IF NOT EXISTS archived_rollup (
+    vehicle_number TEXT NOT NULL,
+    trip_date TEXT NOT NULL,
+    trip_count INTEGER NOT NULL DEFAULT 0,
+    total_distance REAL NOT NULL DEFAULT 0,
+    total_fuel REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (vehicle_number, trip_date)
+) WITHOUT ROWID;
+"""
+
+ARCHIVED_REBUILD_SQL = """
+UPDATE fleet_rollup SET
+    trip_count = trip_count + (SELECT COALESCE(SUM(trip_count), 0) FROM archived_rollup),
+    total_distance = total_distance + (SELECT COALESCE(SUM(total_distance), 0) FROM archived_rollup),
+    total_fuel = total_fuel + (SELECT COALESCE(SUM(total_fuel), 0) FROM archived_rollup)
+WHERE id = 1;
+
+INSERT INTO vehicle_rollup (vehicle_number, trip_count, total_distance, total_fuel)
+SELECT vehicle_number, SUM(trip_count), SUM(total_distance), SUM(total_fuel)
+FROM archived_rollup WHERE true GROUP BY vehicle_number
+ON CONFLICT (vehicle_number) DO UPDATE SET trip_count = trip_count + excluded.trip_count,
+    total_distance = total_distance + excluded.total_distance,
+    total_fuel = total_fuel + excluded.total_fuel;
+
+INSERT INTO vehicle_daily_rollup (vehicle_number, trip_date, trip_count, total_distance, total_fuel)
+SELECT vehicle_number, trip_date, trip_count, total_distance, total_fuel
+FROM archived_rollup WHERE true
+ON CONFLICT (vehicle_number, trip_date) DO UPDATE SET trip_count = trip_count + excluded.trip_count,
+    total_distance = total_distance + excluded.total_distance,
+    total_fuel = total_fuel + excluded.total_fuel;
+"""
+
+
+# Fleet-wide totals per day (migrations.py, version 10), for charts over the
+# whole fleet that would otherwise sum vehicle_daily_rollup across every
+# vehicle. Kept by triggers of its own so the version 2 triggers stay as
+# shipped; rebuilt from vehicle_daily_rollup, which already holds the
+# archived days.
+FLEET_DAILY_TABLE = """
+CREATE TABLE IF NOT EXISTS fleet_daily_rollup (
+    trip_date TEXT PRIMARY KEY,
+    trip_count INTEGER NOT NULL DEFAULT 0,
+    total_distance REAL NOT NULL DEFAULT 0,
+    total_fuel REAL NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+
+def _add_day(row):
+    return f"""
+    INSERT INTO fleet_daily_rollup (trip_date, trip_count, total_distance, total_fuel)
+    VALUES ({_day_key(row)}, 1, COALESCE({row}.distance, 0), COALESCE({row}.fuel_consumption, 0))
+    ON CONFLICT (trip_date) DO UPDATE SET trip_count = trip_count + 1,
+        total_distance = total_distance + excluded.total_distance,
+        total_fuel = total_fuel + excluded.total_fuel;
+    """
+
+
+def _subtract_day(row):
+    return f"""
+    UPDATE fleet_daily_rollup SET trip_count = trip_count - 1,
+        total_distance = total_distance - COALESCE({row}.distance, 0),
+        total_fuel = total_fuel - COALESCE({row}.fuel_consumption, 0)
+    WHERE trip_date = {_day_key(row)};
+    DELETE FROM fleet_daily_rollup WHERE trip_date = {_day_key(row)} AND trip_count <= 0;
+    """
+
+
+FLEET_DAILY_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS trip_rollup_day_insert AFTER INSERT ON trip_info
+BEGIN {_add_day("NEW")} END;
+
+CREATE TRIGGER IF NOT EXISTS trip_rollup_day_delete AFTER DELETE ON trip_info
+BEGIN {_subtract_day("OLD")} END;
+
+CREATE TRIGGER IF NOT EXISTS trip_rollup_day_update
+AFTER UPDATE OF trip_date, distance, fuel_consumption ON trip_info
+BEGIN {_subtract_day("OLD")} {_add_day("NEW")} END;
+"""
+
+# run after REBUILD_SQL + ARCHIVED_REBUILD_SQL
+FLEET_DAILY_REBUILD_SQL = """
+DELETE FROM fleet_daily_rollup;
+
+INSERT INTO fleet_daily_rollup (trip_date, trip_count, total_distance, total_fuel)
+SELECT trip_date, SUM(trip_count), SUM(total_distance), SUM(total_fuel)
+FROM vehicle_daily_rollup GROUP BY trip_date;
+"""
+
+# Stored routes (trip_routes.py) whose trip was deleted while the triggers
+# were down. Archived trips are no longer in trip_info but keep their routes,
+# so anything inside an archived partition's trip_id range is left alone.
+ORPHAN_ROUTES_SQL = """
+DELETE FROM trip_route
+WHERE trip_id NOT IN (SELECT trip_id FROM trip_info)
+  AND NOT EXISTS (SELECT 1 FROM trip_partitions p
+                  WHERE trip_route.trip_id BETWEEN p.first_trip_id AND p.last_trip_id);
+"""
+
+
+def rebuild_rollups(conn):
+    # Recompute every summary from trip_info (plus archived totals), e.g. after
+    # a bulk load or to wash out floating-point drift from long runs of
+    # incremental updates. The tables and triggers themselves are installed
+    # by migrations.py.
+    conn.executescript(f"BEGIN IMMEDIATE;\n{REBUILD_SQL}\n{ARCHIVED_REBUILD_SQL}\n{FLEET_DAILY_REBUILD_SQL}\nCOMMIT;")
+
+
+@contextmanager
+def triggers_suspended(conn, tables=("trip_info",)):
+    # For bulk loads and moves: drop the per-row triggers on these tables
+    # (rollups, change counters, the trip change log, search indexes, stored
+    # routes) while the body runs, then reinstall them, rebuild the rollups
+    # and search indexes, drop stored routes left without a trip, bump each
+    # table's counter once and log a single `reload` change for trip_info.
+    # The drop, the body and the reinstall are one BEGIN IMMEDIATE
+    # transaction (DDL is transactional in SQLite), so other connections never
+    # see the triggers missing and a loader that dies half way leaves them
+    # in place. The body must not commit; it holds the write lock throughout.
+    from migrations import _statements     # migrations -> rollups at import time
+
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        marks = ", ".join("?" * len(tables))
+        saved = conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ({marks})", tuple(tables)
+        ).fetchall()
+        for name, _ in saved:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        yield conn
+        committed = not conn.in_transaction
+        if committed:
+            conn.execute("BEGIN IMMEDIATE")
+
+        change_log = "trip_info" in tables and any(name == "trip_changes_insert" for name, _ in saved)
+        # search indexes (queries.VEHICLE_SEARCH) over these tables are rebuilt afterwards
+        search_indexes = [name[:-len("_insert")] for name, _ in saved if name.endswith("search_insert")]
+        routes = any(name == "trip_route_delete" for name, _ in saved)
+        bump = f"""
+        UPDATE table_versions SET version = version + 1, updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+        WHERE table_name IN ({", ".join(f"'{t}'" for t in tables)});
+        """
+        for _, sql in saved:
+            conn.execute(sql)
+        for statement in _statements(
+            (REBUILD_SQL + ARCHIVED_REBUILD_SQL + FLEET_DAILY_REBUILD_SQL if "trip_info" in tables else "") + bump
+            + ("INSERT INTO trip_changes (op) VALUES ('reload');\n" if change_log else "")
+            + (ORPHAN_ROUTES_SQL if routes else "")
+            + "".join(f"INSERT INTO {index} ({index}) VALUES ('rebuild');\n" for index in search_indexes)
+        ):
+            conn.execute(statement)
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    if committed:
+        raise RuntimeError("the body of triggers_suspended committed; the triggers were reinstalled afterwards")
+
+
+if __name__ == "__main__":
+    from db_pool import DB_PATH, connect
+    from migrations import migrate
+
+    conn = connect(DB_PATH)
+    migrate(conn)
+    rebuild_rollups(conn)
+    count, distance, fuel = conn.execute(
+        "SELECT trip_count, total_distance, total_fuel FROM fleet_rollup"
+    ).fetchone()
+    conn.close()
+    print(f"✅ Rollups rebuilt: {count} trips, {distance:.2f} km, {fuel:.2f} L")
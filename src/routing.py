@@ -0,0 +1,263 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import polyline
+import requests
+from requests.adapters import HTTPAdapter
+
+from geo import DETOUR_FACTOR, haversine_km
+from metrics import CACHES, external_call
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Routing providers (Google Directions / Distance Matrix, or an offline stub)
+# behind a persistent SQLite cache with TTL + LRU eviction, one pooled HTTP
+# session, and coalescing of identical in-flight lookups.
+
+CACHE_PATH = os.path.abspath(
+    os.getenv("FLEETSTAT_ROUTE_CACHE") or os.path.join(BASE_DIR, "..", "db", "route_cache.db")
+)
+CACHE_TTL = float(os.getenv("FLEETSTAT_ROUTE_CACHE_TTL", str(30 * 24 * 3600)))   # seconds
+CACHE_MAX_ENTRIES = int(os.getenv("FLEETSTAT_ROUTE_CACHE_MAX", "50000"))
+HTTP_TIMEOUT = float(os.getenv("FLEETSTAT_ROUTING_TIMEOUT", "10"))
+COORD_PRECISION = 4   # decimal places kept in cache keys (~11 m)
+
+_COORDS = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+class RoutingError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(f"{status}: {message}" if message else status)
+        self.status = status
+        self.message = message
+
+
+def parse_coords(place):
+    match = _COORDS.match(str(place))
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def normalize_place(place):
+    coords = parse_coords(place)
+    if coords:
+        return f"{coords[0]:.{COORD_PRECISION}f},{coords[1]:.{COORD_PRECISION}f}"
+    return " ".join(str(place).lower().split())
+
+
+# ---------- Providers ----------
+
+class GoogleRoutingProvider:
+    name = "google"
+    DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+    DISTANCE_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+    def __init__(self, api_key, timeout=HTTP_TIMEOUT):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2)
+        self.session.mount("https://", adapter)
+
+    def _get(self, url, params):
+        with external_call("google", url.rsplit("/", 2)[-2]):
+            try:
+                response = self.session.get(url, params={**params, "key": self.api_key}, timeout=self.timeout)
+                data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                raise RoutingError("REQUEST_FAILED", str(e))
+            if data.get("status") != "OK":
+                raise RoutingError(data.get("status", "UNKNOWN_ERROR"), data.get("error_message"))
+            return data
+
+    def directions(self, origin, destination):
+        data = self._get(self.DIRECTIONS_URL, {"origin": origin, "destination": destination, "mode": "driving"})
+        points = polyline.decode(data["routes"][0]["overview_polyline"]["points"])
+        return {"points": [list(p) for p in points]}
+
+    def distance(self, origin, destination):
+        data = self._get(self.DISTANCE_URL, {"origins": origin, "destinations": destination, "units": "metric"})
+        element = data["rows"][0]["elements"][0]
+        if element["status"] != "OK":
+            raise RoutingError(element["status"])
+        return {"text": element["distance"]["text"], "km": element["distance"]["value"] / 1000}
+
+
+class StubRoutingProvider:
+    # Offline stand-in: straight-line geometry and great-circle distance times a
+    # road detour factor. Place names are hashed to stable points so any input
+    # works. FLEETSTAT_STUB_LATENCY_MS simulates a remote round trip.
+    name = "stub"
+
+    def __init__(self, latency_ms=None):
+        self.latency = float(latency_ms if latency_ms is not None else os.getenv("FLEETSTAT_STUB_LATENCY_MS", "0")) / 1000
+
+    def _locate(self, place):
+        coords = parse_coords(place)
+        if coords:
+            return coords
+        digest = hashlib.sha1(normalize_place(place).encode()).digest()
+        # somewhere in India, deterministic per name
+        return 8 + 27 * digest[0] / 255, 68 + 29 * digest[1] / 255
+
+    def directions(self, origin, destination):
+        time.sleep(self.latency)
+        a, b = self._locate(origin), self._locate(destination)
+        steps = 20
+        points = [[a[0] + (b[0] - a[0]) * i / steps, a[1] + (b[1] - a[1]) * i / steps] for i in range(steps + 1)]
+        return {"points": points}
+
+    def distance(self, origin, destination):
+        time.sleep(self.latency)
+        km = round(float(haversine_km(*self._locate(origin), *self._locate(destination))) * DETOUR_FACTOR, 3)
+        return {"text": f"{km:,.1f} km", "km": km}
+
+
+# ---------- Cache ----------
+
+class RouteCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS route_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_route_cache_accessed ON route_cache (accessed_at);
+        """)
+        self._writes = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM route_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE route_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO route_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM route_cache WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            """
+            DELETE FROM route_cache WHERE key IN (
+                SELECT key FROM route_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM route_cache")
+
+
+# ---------- Router ----------
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Router:
+    def __init__(self, provider, cache=None):
+        self.provider = provider
+        self.cache = cache
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, kind, origin, destination, fetch):
+        key = f"{self.provider.name}:{kind}:{normalize_place(origin)}|{normalize_place(destination)}"
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        # Coalesce: the first caller for a key does the request, others wait on it
+        with self._lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[key] = _InFlight()
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = fetch(origin, destination)
+            if self.cache is not None:
+                self.cache.put(key, pending.value)
+            return pending.value
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending.done.set()
+
+    def route(self, origin, destination):
+        # [(lat, lon), ...] along the driving route
+        return [tuple(p) for p in self._lookup("directions", origin, destination, self.provider.directions)["points"]]
+
+    def distance(self, origin, destination):
+        # (display text, kilometres)
+        result = self._lookup("distance", origin, destination, self.provider.distance)
+        return result["text"], result["km"]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router(api_key=None):
+    # FLEETSTAT_ROUTING=google|stub; defaults to Google when a key is configured
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                api_key = api_key or os.getenv("GOOGLE_API_KEY")
+                choice = os.getenv("FLEETSTAT_ROUTING") or ("google" if api_key else "stub")
+                provider = GoogleRoutingProvider(api_key) if choice == "google" else StubRoutingProvider()
+                _router = Router(provider, RouteCache())
+                CACHES.register("route_cache", _router.cache)
+    return _router
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+
+import partitions
+from db_pool import BASE_DIR, get_pool
+from versions import table_versions
+
+# Columnar snapshot of trip_info / vehicle_info for analytics.
+#
+#   db/snapshot/
+#     _manifest.json                        watermark + table versions exported
+#     vehicles.parquet
+#     trips/month=2024-01/part-<first trip_id>-<last trip_id>.parquet
+#
+# export_snapshot() appends the trips above the watermark as new part files
+# (one per month touched). The table_versions counters tell whether anything
+# else changed: each inserted, updated or deleted row bumps trip_info's
+# counter once, so a delta larger than the number of new rows means older
+# trips were edited or deleted and the snapshot is rebuilt instead. A bulk
+# load with the triggers suspended bumps it once, which also forces a rebuild.
+#
+# A full export also includes the archived months, so the snapshot covers the
+# whole trip history.
+#
+# Every file is written under a dot-prefixed temporary name and renamed into
+# place, and the manifest lists the part files that make up the snapshot.
+# Readers open only those, so parts being appended or compacted are never
+# seen half-written. Parts merged away by compaction are deleted only after
+# the new manifest is in place, and files the manifest does not list (left
+# by an export that died) are removed by the next export.
+#
+# Reads go through pyarrow with memory-mapped files and only decode the
+# requested columns; a date range prunes month directories.
+
+SNAPSHOT_DIR = os.path.abspath(os.getenv("FLEETSTAT_SNAPSHOT_DIR") or os.path.join(BASE_DIR, "..", "db", "snapshot"))
+MANIFEST = "_manifest.json"
+CHUNK_SIZE = 200000
+MAX_PARTS_PER_MONTH = 16      # appends beyond this are compacted into one file
+
+TRIP_SCHEMA = pa.schema([
+    ("trip_id", pa.int64()),
+    ("vehicle_number", pa.string()),
+    ("fuel_consumption", pa.float64()),
+    ("trip_date", pa.string()),
+    ("start_location", pa.string()),
+    ("end_location", pa.string()),
+    ("lat_start", pa.float64()),
+    ("lon_start", pa.float64()),
+    ("lat_end", pa.float64()),
+    ("lon_end", pa.float64()),
+    ("distance", pa.float64()),
+])
+
+VEHICLE_SCHEMA = pa.schema([
+    ("vehicle_id", pa.int64()),
+    ("vehicle_name", pa.string()),
+    ("vehicle_number", pa.string()),
+    ("owner_name", pa.string()),
+    ("vehicle_type", pa.string()),
+    ("registration_date", pa.string()),
+])
+
+
+# ---------- Manifest ----------
+
+def read_manifest(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(snapshot_dir, manifest):
+    tmp = os.path.join(snapshot_dir, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(snapshot_dir, MANIFEST))
+
+
+def is_fresh(snapshot_dir=SNAPSHOT_DIR, tables=("trip_info", "vehicle_info")):
+    # True when the snapshot reflects the current contents of these tables
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        return False
+    with get_pool().reader() as conn:
+        current = table_versions(conn, tables)
+    return all(manifest["versions"].get(t) == current.get(t, (0,))[0] for t in tables)
+
+
+# ---------- Export ----------
+
+def _month(trip_date):
+    month = pc.utf8_slice_codeunits(trip_date, 0, 7)
+    return pc.if_else(pc.match_substring_regex(month, r"^\d{4}-\d{2}$"), month, "unknown")
+
+
+def _table(rows, schema):
+    columns = list(zip(*rows)) or [()] * len(schema)
+    return pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema)
+
+
+def _write_parquet(table, path):
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+def _part_files(trips_dir):
+    # part files under trips_dir, relative to it
+    return {os.path.relpath(os.path.join(directory, name), trips_dir)
+            for directory, _, files in os.walk(trips_dir) for name in files if name.startswith("part-")}
+
+
+def _drop_unlisted(trips_dir, listed):
+    # files from an export that died before its manifest was written
+    for directory, _, files in os.walk(trips_dir):
+        for name in files:
+            path = os.path.join(directory, name)
+            if name.startswith(".") or (name.startswith("part-") and os.path.relpath(path, trips_dir) not in listed):
+                os.remove(path)
+
+
+def _write_trip_chunk(trips_dir, rows):
+    table = _table(rows, TRIP_SCHEMA)
+    months = _month(table["trip_date"])
+    for month in pc.unique(months).to_pylist():
+        part = table.filter(pc.equal(months, month))
+        ids = part["trip_id"]
+        directory = os.path.join(trips_dir, f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{pc.min(ids).as_py():010d}-{pc.max(ids).as_py():010d}.parquet"
+        _write_parquet(part, os.path.join(directory, name))
+        yield directory
+
+
+def _compact(directory):
+    # Merge a month's parts into one file; returns the paths of the parts it
+    # replaces, which stay on disk until the manifest no longer lists them
+    parts = sorted(f for f in os.listdir(directory) if f.startswith("part-") and f.endswith(".parquet"))
+    if len(parts) <= MAX_PARTS_PER_MONTH:
+        return []
+    table = pa.concat_tables(pq.read_table(os.path.join(directory, p), schema=TRIP_SCHEMA) for p in parts)
+    first, last = parts[0].split("-")[1], parts[-1].split("-")[2].split(".")[0]
+    merged = f"part-{first}-{last}.parquet"
+    _write_parquet(table.sort_by("trip_id"), os.path.join(directory, merged))
+    return [os.path.join(directory, p) for p in parts if p != merged]
+
+
+def _export_vehicles(conn, path):
+    rows = conn.execute(f"SELECT {', '.join(VEHICLE_SCHEMA.names)} FROM vehicle_info ORDER BY vehicle_id").fetchall()
+    _write_parquet(_table(rows, VEHICLE_SCHEMA), path)
+    return len(rows)
+
+
+def export_snapshot(full=False, snapshot_dir=SNAPSHOT_DIR, chunk_size=CHUNK_SIZE):
+    # Bring the snapshot up to date; returns a summary dict
+    started = time.perf_counter()
+    manifest = None if full else read_manifest(snapshot_dir)
+    summary = {"mode": "incremental", "trips_written": 0, "vehicles_written": 0}
+
+    with get_pool().reader() as conn:
+        # one read transaction, so versions and rows come from the same state
+        conn.execute("BEGIN")
+        versions = {t: v for t, (v, _) in table_versions(conn).items()}
+        watermark = manifest["trip_watermark"] if manifest else 0
+        new_rows = conn.execute("SELECT COUNT(*) FROM trip_info WHERE trip_id > ?", (watermark,)).fetchone()[0]
+        if (manifest is None or "files" not in manifest
+                or versions.get("trip_info", 0) - manifest["versions"].get("trip_info", 0) != new_rows):
+            summary["mode"] = "full"
+            watermark = 0
+
+        target = snapshot_dir if summary["mode"] == "incremental" else snapshot_dir + ".building"
+        if target != snapshot_dir:
+            shutil.rmtree(target, ignore_errors=True)
+        trips_dir = os.path.join(target, "trips")
+        os.makedirs(trips_dir, exist_ok=True)
+        _drop_unlisted(trips_dir, set(manifest["files"]) if summary["mode"] == "incremental" else set())
+
+        touched = set()
+        if summary["mode"] == "full":
+            # months moved out of trip_info into archive files (partitions.py)
+            for rows in partitions.iter_archive_rows(", ".join(TRIP_SCHEMA.names), chunk_size):
+                touched.update(_write_trip_chunk(trips_dir, rows))
+                summary["trips_written"] += len(rows)
+        while True:
+            rows = conn.execute(
+                f"SELECT {', '.join(TRIP_SCHEMA.names)} FROM trip_info WHERE trip_id > ? ORDER BY trip_id LIMIT ?",
+                (watermark, chunk_size),
+            ).fetchall()
+            if not rows:
+                break
+            touched.update(_write_trip_chunk(trips_dir, rows))
+            watermark = rows[-1][0]
+            summary["trips_written"] += len(rows)
+        retired = [path for directory in touched for path in _compact(directory)]
+
+        vehicles_path = os.path.join(target, "vehicles.parquet")
+        if (summary["mode"] == "full" or not os.path.exists(vehicles_path)
+                or manifest["versions"].get("vehicle_info") != versions.get("vehicle_info")):
+            summary["vehicles_written"] = _export_vehicles(conn, vehicles_path)
+
+    _write_manifest(target, {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "trip_watermark": watermark,
+        "versions": versions,
+        "files": sorted(_part_files(trips_dir) - {os.path.relpath(p, trips_dir) for p in retired}),
+    })
+    for path in retired:
+        os.remove(path)
+    if target != snapshot_dir:
+        # swap the rebuilt snapshot in; readers holding mapped files of the
+        # old one keep them until they finish
+        old = snapshot_dir + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(snapshot_dir):
+            os.replace(snapshot_dir, old)
+        os.replace(target, snapshot_dir)
+        shutil.rmtree(old, ignore_errors=True)
+
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+# ---------- Reads ----------
+
+_fs = LocalFileSystem(use_mmap=True)
+
+
+def read_trips(columns=None, date_from=None, date_to=None, snapshot_dir=SNAPSHOT_DIR, _retry=False):
+    # trip_info columns as a DataFrame (row order is by month, not trip_id).
+    # date_from / date_to are inclusive ISO dates.
+    trips_dir = os.path.join(snapshot_dir, "trips")
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or not os.path.isdir(trips_dir):
+        raise FileNotFoundError(f"no snapshot at {snapshot_dir} (run snapshot.py)")
+    # only the parts the manifest lists; a snapshot from before the list
+    # existed is read by directory
+    source = [os.path.join(trips_dir, f) for f in manifest["files"]] if "files" in manifest else trips_dir
+    # month directories are pruned first, then rows filtered like queries.trip_filters
+    condition = None
+    if date_from:
+        date_from = str(date_from)
+        condition = (ds.field("month") >= date_from[:7]) & (ds.field("trip_date") >= date_from)
+    if date_to:
+        next_day = str(date.fromisoformat(str(date_to)[:10]) + timedelta(days=1))
+        clause = (ds.field("month") <= str(date_to)[:7]) & (ds.field("trip_date") < next_day)
+        condition = clause if condition is None else condition & clause
+    columns = list(columns) if columns else TRIP_SCHEMA.names
+    try:
+        dataset = ds.dataset(source, schema=TRIP_SCHEMA.append(pa.field("month", pa.string())), format="parquet",
+                             partitioning="hive", partition_base_dir=trips_dir, filesystem=_fs)
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
+    except FileNotFoundError:
+        if _retry:
+            raise
+        # compaction removed a part after we read the manifest: go by the new one
+        return read_trips(columns, date_from, date_to, snapshot_dir, _retry=True)
+
+
+def read_vehicles(columns=None, snapshot_dir=SNAPSHOT_DIR):
+    return pq.read_table(os.path.join(snapshot_dir, "vehicles.parquet"), columns=columns,
+                         memory_map=True).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export trip_info / vehicle_info to a Parquet snapshot")
+    parser.add_argument("--full", action="store_true", help="rebuild instead of appending new trips")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    summary = export_snapshot(args.full, args.dir)
+    print(f"✅ Snapshot {summary['mode']}: {summary['trips_written']:,} trips, "
+          f"{summary['vehicles_written']:,} vehicles written in {summary['seconds']}s -> {args.dir}")
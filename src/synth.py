@@ -0,0 +1,246 @@
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+
+from db_pool import DB_PATH, connect
+from geo import DETOUR_FACTOR, haversine_km
+from migrations import migrate
+from rollups import triggers_suspended
+
+# Synthetic fleet data for capacity planning and benchmarks. Vehicles and
+# trips are generated in NumPy blocks and written with executemany, all in
+# one transaction with the per-row rollup / change-counter triggers
+# suspended and the rollups rebuilt once at the end.
+#
+# The output depends only on the parameters and the seed: each block of
+# BLOCK trips draws from its own generator seeded with (seed, block number).
+#
+#   python synth.py --vehicles 5000 --trips 2000000 --regions rajasthan north
+
+BLOCK = 100000
+
+# region -> (registration state code, [(city, lat, lon), ...])
+REGIONS = {
+    "rajasthan": ("RJ", [
+        ("Jaipur", 26.9124, 75.7873), ("Jodhpur", 26.2389, 73.0243), ("Udaipur", 24.5854, 73.7125),
+        ("Ajmer", 26.4499, 74.6399), ("Kota", 25.2138, 75.8648), ("Bikaner", 28.0229, 73.3119),
+        ("Churu", 28.3042, 74.7375), ("Alwar", 27.5530, 76.6346), ("Sikar", 27.6094, 75.1399),
+    ]),
+    "north": ("DL", [
+        ("Delhi", 28.6139, 77.2090), ("Gurugram", 28.4595, 77.0266), ("Noida", 28.5355, 77.3910),
+        ("Agra", 27.1767, 78.0081), ("Chandigarh", 30.7333, 76.7794), ("Lucknow", 26.8467, 80.9462),
+        ("Dehradun", 30.3165, 78.0322),
+    ]),
+    "west": ("GJ", [
+        ("Ahmedabad", 23.0225, 72.5714), ("Surat", 21.1702, 72.8311), ("Vadodara", 22.3072, 73.1812),
+        ("Rajkot", 22.3039, 70.8022), ("Mumbai", 19.0760, 72.8777), ("Pune", 18.5204, 73.8567),
+    ]),
+    "south": ("KA", [
+        ("Bengaluru", 12.9716, 77.5946), ("Mysuru", 12.2958, 76.6394), ("Chennai", 13.0827, 80.2707),
+        ("Hyderabad", 17.3850, 78.4867), ("Coimbatore", 11.0168, 76.9558), ("Kochi", 9.9312, 76.2673),
+    ]),
+    "east": ("WB", [
+        ("Kolkata", 22.5726, 88.3639), ("Durgapur", 23.5204, 87.3119), ("Bhubaneswar", 20.2961, 85.8245),
+        ("Patna", 25.5941, 85.1376), ("Ranchi", 23.3441, 85.3096),
+    ]),
+}
+
+# vehicle type -> (share of the fleet, mean km/l, standard deviation)
+VEHICLE_PROFILES = {
+    "Truck": (0.45, 4.5, 0.8),
+    "Bus": (0.15, 4.2, 0.6),
+    "Car": (0.30, 14.0, 2.5),
+    "Bike": (0.10, 45.0, 7.0),
+}
+
+MODELS = {
+    "Truck": ["Tata Prima", "Ashok Leyland 2518", "BharatBenz 1617", "Eicher Pro 3015"],
+    "Bus": ["Volvo 9400", "Tata Starbus", "Ashok Leyland Viking"],
+    "Car": ["Maruti Dzire", "Toyota Innova", "Mahindra Bolero", "Hyundai Aura"],
+    "Bike": ["Hero Splendor", "Bajaj Pulsar", "TVS Apache"],
+}
+
+OWNERS = ["Shree Logistics", "Marwar Transport", "Desert Carriers", "Northline Freight", "Coastal Movers",
+          "Eastern Roadways", "City Cabs", "Metro Travels", "Om Sai Transport", "Green Fleet Co"]
+
+LOCAL_TRIP_SHARE = 0.15       # trips that start and end in the same city
+HOME_REGION_SHARE = 0.85      # other trips that stay within the vehicle's region
+CITY_SPREAD_DEG = 0.05        # jitter around a city centre (~5 km)
+
+INSERT_VEHICLE_SQL = '''
+    INSERT OR IGNORE INTO vehicle_info (vehicle_name, vehicle_number, owner_name, vehicle_type, registration_date)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+INSERT_TRIP_SQL = '''
+    INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
+                           lat_start, lon_start, lat_end, lon_end, distance)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Relaxed for the duration of the load only (the connection is private to it)
+LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "cache_size": -262144,        # 256 MB
+    "temp_store": "MEMORY",
+}
+
+
+# ---------- Fleet ----------
+
+def make_fleet(vehicles, regions, profiles, seed, start_date):
+    # Columns of the generated fleet as arrays, indexed by vehicle
+    rng = np.random.default_rng([seed, 0])
+    types = list(profiles)
+    share = np.array([profiles[t][0] for t in types], dtype=float)
+    type_idx = rng.choice(len(types), vehicles, p=share / share.sum())
+    region_idx = rng.integers(0, len(regions), vehicles)
+
+    mean = np.array([profiles[t][1] for t in types])[type_idx]
+    sd = np.array([profiles[t][2] for t in types])[type_idx]
+    efficiency = np.clip(rng.normal(mean, sd), mean * 0.4, None)
+
+    letters = rng.integers(0, 26, (vehicles, 2)) + ord("A")
+    numbers = [
+        f"{REGIONS[regions[r]][0]}{i // 10000 + 1:02d}{chr(a)}{chr(b)}{i % 10000:04d}"
+        for i, (r, (a, b)) in enumerate(zip(region_idx.tolist(), letters.tolist()))
+    ]
+    registered = np.datetime64(start_date) - rng.integers(30, 3650, vehicles)
+    # a few vehicles do most of the work
+    activity = rng.gamma(2.0, 1.0, vehicles)
+    return {
+        "number": np.array(numbers),
+        "type": np.array(types)[type_idx],
+        "region": region_idx,
+        "efficiency": efficiency,
+        "registered": registered.astype(str),
+        "model": [MODELS.get(types[t], ["Generic"])[i % len(MODELS.get(types[t], ["Generic"]))]
+                  for i, t in enumerate(type_idx.tolist())],
+        "owner": [OWNERS[i] for i in rng.integers(0, len(OWNERS), vehicles).tolist()],
+        "weight": activity / activity.sum(),
+    }
+
+
+def vehicle_rows(fleet):
+    return zip(fleet["model"], fleet["number"].tolist(), fleet["owner"], fleet["type"].tolist(),
+               fleet["registered"].tolist())
+
+
+# ---------- Trips ----------
+
+def _cities(regions):
+    # flat city table plus, per region, the slice of it that region owns
+    names, coords, spans = [], [], []
+    for region in regions:
+        cities = REGIONS[region][1]
+        spans.append((len(names), len(names) + len(cities)))
+        names += [c[0] for c in cities]
+        coords += [c[1:] for c in cities]
+    return np.array(names), np.array(coords), np.array(spans)
+
+
+def trip_block(block, size, first, total, fleet, cities, start_date, days, seed):
+    # Trips first .. first+size-1 of `total`, as columns
+    names, coords, spans = cities
+    rng = np.random.default_rng([seed, block + 1])
+    vehicle = rng.choice(len(fleet["weight"]), size, p=fleet["weight"])
+    lo, hi = spans[fleet["region"][vehicle]].T
+    start = lo + (rng.random(size) * (hi - lo)).astype(np.int64)
+
+    # same city, another city in the home region, or anywhere in the generated regions
+    kind = rng.random(size)
+    end = lo + (rng.random(size) * (hi - lo)).astype(np.int64)
+    away = kind >= LOCAL_TRIP_SHARE + (1 - LOCAL_TRIP_SHARE) * HOME_REGION_SHARE
+    end[away] = rng.integers(0, len(names), int(away.sum()))
+    local = kind < LOCAL_TRIP_SHARE
+    end[local] = start[local]
+
+    lat1, lon1 = (coords[start] + rng.normal(0, CITY_SPREAD_DEG, (size, 2))).T
+    lat2, lon2 = (coords[end] + rng.normal(0, CITY_SPREAD_DEG, (size, 2))).T
+    distance = np.maximum(haversine_km(lat1, lon1, lat2, lon2) * DETOUR_FACTOR * rng.uniform(0.9, 1.2, size), 1.0)
+    fuel = distance / (fleet["efficiency"][vehicle] * rng.lognormal(0.0, 0.08, size))
+
+    # dates advance with the trip index, so trip_id order is chronological
+    position = (first + np.arange(size) + rng.random(size)) / total
+    trip_date = np.datetime64(start_date) + np.minimum((position * days).astype(np.int64), days - 1)
+
+    return zip(
+        fleet["number"][vehicle].tolist(), fuel.round(2).tolist(), trip_date.astype(str).tolist(),
+        names[start].tolist(), names[end].tolist(), lat1.round(6).tolist(), lon1.round(6).tolist(),
+        lat2.round(6).tolist(), lon2.round(6).tolist(), distance.round(2).tolist(),
+    )
+
+
+# ---------- Load ----------
+
+def generate(conn, vehicles=1000, trips=100000, start_date="2024-01-01", days=365,
+             regions=("rajasthan",), profiles=VEHICLE_PROFILES, seed=42, progress=None):
+    # Writes the fleet and its trips through conn; returns the row counts.
+    # Vehicle numbers that already exist are kept as they are.
+    regions = list(regions)
+    unknown = [r for r in regions if r not in REGIONS]
+    if unknown:
+        raise ValueError(f"unknown region(s) {', '.join(unknown)}; choose from {', '.join(REGIONS)}")
+    if vehicles < 1 or trips < 0 or days < 1:
+        raise ValueError("vehicles and days must be positive, trips non-negative")
+
+    migrate(conn)
+    for name, value in LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+    fleet = make_fleet(vehicles, regions, profiles, seed, start_date)
+    cities = _cities(regions)
+    with triggers_suspended(conn, ("trip_info", "vehicle_info")):
+        conn.executemany(INSERT_VEHICLE_SQL, vehicle_rows(fleet))
+        for block, first in enumerate(range(0, trips, BLOCK)):
+            size = min(BLOCK, trips - first)
+            conn.executemany(INSERT_TRIP_SQL, trip_block(block, size, first, trips, fleet, cities,
+                                                         start_date, days, seed))
+            if progress:
+                progress(first + size, trips)
+    conn.execute("ANALYZE")
+    return {"vehicles": vehicles, "trips": trips}
+
+
+def parse_profiles(specs):
+    # ["Truck=0.5:4.5:0.8", ...] -> profiles, starting from the defaults
+    profiles = dict(VEHICLE_PROFILES)
+    for spec in specs or []:
+        try:
+            name, values = spec.split("=")
+            share, mean, sd = (float(v) for v in values.split(":"))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad profile {spec!r}, expected TYPE=share:mean_kmpl:sd")
+        profiles[name] = (share, mean, sd)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic FleetStat fleet")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--trips", type=int, default=100000)
+    parser.add_argument("--start", default="2024-01-01", help="first trip date (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=365, help="date span of the trips")
+    parser.add_argument("--regions", nargs="+", default=["rajasthan"], choices=list(REGIONS))
+    parser.add_argument("--profile", action="append", metavar="TYPE=SHARE:MEAN:SD",
+                        help="fleet share and km/l distribution for a vehicle type (repeatable)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    date.fromisoformat(args.start)
+
+    conn = connect(args.db)
+    t0 = time.perf_counter()
+    report = lambda done, total: print(f"  {done:,}/{total:,} trips ({time.perf_counter() - t0:.1f}s)")
+    counts = generate(conn, args.vehicles, args.trips, args.start, args.days, args.regions,
+                      parse_profiles(args.profile), args.seed, progress=report)
+    conn.close()
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Generated {counts['vehicles']:,} vehicles and {counts['trips']:,} trips in {elapsed:.1f}s "
+          f"({counts['trips'] / elapsed:,.0f} trips/s) -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
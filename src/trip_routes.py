@@ -0,0 +1,197 @@
+import argparse
+import math
+
+import numpy as np
+
+# Stored trip route geometry.
+#
+# A route is fetched from the routing provider once per trip and stored in
+# trip_route as little-endian float32 (lat, lon) pairs: 8 bytes a vertex,
+# about 1 m of precision, decoded with one np.frombuffer. One row is kept
+# per ZOOM_LEVELS entry, simplified with Douglas-Peucker to half a screen
+# pixel at that zoom, so a country-wide view of a 2,000 km route draws a few
+# hundred vertices rather than every bend in the road.
+#
+# A map picks its zoom from the route's extent (fit_zoom) and draws the
+# coarsest level that is still exact ZOOM_HEADROOM steps further in, so
+# zooming in a little stays smooth. Triggers drop a trip's rows when it is
+# deleted or its end points move; the next map view fetches it again.
+# Moving a trip to an archive file (partitions.py) keeps its route.
+
+ZOOM_LEVELS = (5, 7, 9, 11, 13, 15)
+ZOOM_HEADROOM = 1
+MAX_ZOOM = 18
+TILE_PX = 256
+MAP_PADDING_PX = 20
+
+
+# migrations.py, version 11
+TRIP_ROUTE = """
+CREATE TABLE IF NOT EXISTS trip_route (
+    trip_id INTEGER NOT NULL,
+    zoom INTEGER NOT NULL,              -- simplified for maps up to this zoom
+    point_count INTEGER NOT NULL,
+    points BLOB NOT NULL,               -- float32 lat, lon pairs
+    PRIMARY KEY (trip_id, zoom)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trip_route_delete AFTER DELETE ON trip_info
+BEGIN DELETE FROM trip_route WHERE trip_id = OLD.trip_id; END;
+
+CREATE TRIGGER IF NOT EXISTS trip_route_update AFTER UPDATE OF lat_start, lon_start, lat_end, lon_end ON trip_info
+WHEN OLD.lat_start IS NOT NEW.lat_start OR OLD.lon_start IS NOT NEW.lon_start
+  OR OLD.lat_end IS NOT NEW.lat_end OR OLD.lon_end IS NOT NEW.lon_end
+BEGIN DELETE FROM trip_route WHERE trip_id = OLD.trip_id; END;
+"""
+
+# ---------- Geometry ----------
+
+def encode_points(points):
+    return np.asarray(points, dtype="<f4").reshape(-1, 2).tobytes()
+
+
+def decode_points(blob):
+    return np.frombuffer(blob, dtype="<f4").reshape(-1, 2)
+
+
+def simplify(points, tolerance):
+    # Douglas-Peucker on an (n, 2) array of (lat, lon). `tolerance` is in
+    # degrees of latitude; longitudes are scaled by cos(latitude) so it is
+    # about the same distance in every direction. Returns the indices kept,
+    # first and last always included. Each segment measures all the points
+    # it spans in one numpy expression; the recursion is a stack.
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    xy = np.column_stack((points[:, 1] * math.cos(math.radians(points[:, 0].mean())), points[:, 0]))
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a = xy[first]
+        ab = xy[last] - a
+        inner = xy[first + 1:last] - a
+        length2 = ab @ ab
+        # distance to the segment rather than the line through it, so a
+        # road doubling back past an end point is not cut off
+        t = np.clip(inner @ ab / length2, 0.0, 1.0) if length2 else np.zeros(len(inner))
+        d2 = ((inner - t[:, None] * ab) ** 2).sum(axis=1)
+        i = int(d2.argmax())
+        if d2[i] > tolerance * tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack += [(first, split), (split, last)]
+    return np.flatnonzero(keep)
+
+
+def pixel_degrees(zoom, lat):
+    # One screen pixel at `zoom` in degrees of latitude (Web Mercator tiles)
+    return 360 / (TILE_PX * 2 ** zoom) * math.cos(math.radians(lat))
+
+
+def route_levels(points):
+    # [(zoom, point_count, blob)] for every ZOOM_LEVELS entry
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    lat = float(points[:, 0].mean()) if len(points) else 0.0
+    levels = []
+    for zoom in ZOOM_LEVELS:
+        kept = points[simplify(points, pixel_degrees(zoom, lat) / 2)]
+        levels.append((zoom, len(kept), encode_points(kept)))
+    return levels
+
+
+def _mercator_y(lat):
+    s = math.sin(math.radians(max(-85.0, min(85.0, lat))))
+    return 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+
+
+def fit_zoom(points, width, height, padding=MAP_PADDING_PX):
+    # The zoom Leaflet's fitBounds settles on for these points in a
+    # width x height map
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    lat_min, lon_min = points.min(axis=0)
+    lat_max, lon_max = points.max(axis=0)
+    dx = (lon_max - lon_min) / 360
+    dy = _mercator_y(lat_min) - _mercator_y(lat_max)
+    scales = [(size - 2 * padding) / (TILE_PX * extent) for size, extent in ((width, dx), (height, dy)) if extent > 0]
+    if not scales:
+        return MAX_ZOOM
+    return max(0, min(MAX_ZOOM, math.floor(math.log2(min(scales)))))
+
+
+# ---------- Store ----------
+
+def store_route(conn, trip_id, points):
+    # Replace a trip's stored route; returns the vertex count at each zoom
+    levels = route_levels(points)
+    conn.execute("DELETE FROM trip_route WHERE trip_id = ?", (trip_id,))
+    conn.executemany("INSERT INTO trip_route (trip_id, zoom, point_count, points) VALUES (?, ?, ?, ?)",
+                     [(trip_id, zoom, count, blob) for zoom, count, blob in levels])
+    return {zoom: count for zoom, count, _ in levels}
+
+
+def load_route(conn, trip_id, zoom):
+    # (level, points) of the coarsest stored level exact at `zoom`, or the
+    # finest level when zoomed in further; None if the trip has no route
+    row = conn.execute("""
+        SELECT zoom, points FROM trip_route WHERE trip_id = ?
+        ORDER BY zoom < ?, CASE WHEN zoom >= ? THEN zoom ELSE -zoom END LIMIT 1
+    """, (trip_id, zoom, zoom)).fetchone()
+    return (row[0], decode_points(row[1])) if row else None
+
+
+def load_route_for_map(conn, trip_id, width, height):
+    # (zoom the map opens at, points to draw) or None. The coarsest level,
+    # a few dozen vertices, is enough to find the extent.
+    overview = load_route(conn, trip_id, 0)
+    if overview is None:
+        return None
+    zoom = fit_zoom(overview[1], width, height)
+    _, points = load_route(conn, trip_id, zoom + ZOOM_HEADROOM)
+    return zoom, points
+
+
+def missing_routes(conn, limit):
+    # (trip_id, origin, destination) of trips with coordinates and no stored route
+    return [(trip_id, f"{lat1},{lon1}", f"{lat2},{lon2}") for trip_id, lat1, lon1, lat2, lon2 in conn.execute("""
+        SELECT trip_id, lat_start, lon_start, lat_end, lon_end FROM trip_info t
+        WHERE lat_start IS NOT NULL AND lat_end IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM trip_route r WHERE r.trip_id = t.trip_id)
+        ORDER BY trip_id DESC LIMIT ?
+    """, (limit,))]
+
+
+if __name__ == "__main__":
+    from db_pool import get_pool   # db_pool -> migrations -> trip_routes at import time
+    from routing import RoutingError, get_router
+
+    parser = argparse.ArgumentParser(description="FleetStat stored trip routes")
+    parser.add_argument("command", choices=["status", "backfill"])
+    parser.add_argument("--limit", type=int, default=1000, help="trips fetched by backfill, newest first")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        with get_pool().reader() as conn:
+            pending = missing_routes(conn, args.limit)
+        router, stored, failed = get_router(), 0, 0
+        for trip_id, origin, destination in pending:
+            try:
+                points = router.route(origin, destination)
+            except RoutingError:
+                failed += 1
+                continue
+            if points:
+                with get_pool().writer() as conn:
+                    store_route(conn, trip_id, points)
+                stored += 1
+        print(f"✅ stored {stored:,} route(s), {failed:,} lookup(s) failed")
+    else:
+        with get_pool().reader() as conn:
+            for zoom, trips, points, size in conn.execute("""
+                SELECT zoom, COUNT(*), SUM(point_count), SUM(length(points)) FROM trip_route GROUP BY zoom
+            """):
+                print(f"  zoom {zoom:>2}: {trips:,} trips, {points:,} points, {size / 1024:,.0f} KiB")
@@ -0,0 +1,56 @@
+# Per-table change counters. Triggers bump table_versions.version on every
+# inserted, updated or deleted row, so "has anything changed since I last
+# looked?" is a single primary-key read instead of a scan or a checksum.
+# Caches key their entries on these numbers.
+
+VERSIONED_TABLES = ("trip_info", "vehicle_info")
+
+
+def _bump(table):
+    return f"""
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE table_name = '{table}';
+    """
+
+
+def _triggers(table):
+    return f"""
+CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table}
+BEGIN {_bump(table)} END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE ON {table}
+BEGIN {_bump(table)} END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table}
+BEGIN {_bump(table)} END;
+"""
+
+
+TABLE_VERSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+""" + "".join(
+    f"INSERT OR IGNORE INTO table_versions (table_name) VALUES ('{table}');\n" + _triggers(table)
+    for table in VERSIONED_TABLES
+)
+
+
+def table_versions(conn, tables=VERSIONED_TABLES):
+    # {table: (version, updated_at)}
+    rows = conn.execute(
+        f"SELECT table_name, version, updated_at FROM table_versions WHERE table_name IN ({', '.join('?' * len(tables))})",
+        tuple(tables),
+    ).fetchall()
+    return {name: (version, updated_at) for name, version, updated_at in rows}
+
+
+def data_version(tables=VERSIONED_TABLES):
+    # A hashable token that changes whenever any of the tables changes
+    from db_pool import get_pool   # db_pool -> migrations -> versions at import time
+
+    with get_pool().reader() as conn:
+        versions = table_versions(conn, tables)
+    return tuple(versions.get(table, (0, None))[0] for table in tables)
@@ -1,17 +1,94 @@
+import threading
 import folium
 from folium.plugins import HeatMap
-import pandas as pd
-import streamlit as st
-from streamlit_folium import st_folium
+import numpy as np
+from db_handler import query_trips
+from versions import data_version
 
 # ========== FOLIUM HEATMAP FUNCTION ==========
 
-def generate_trip_heatmap(df):
+DEFAULT_CENTER = [26.9, 75.8]
+DEFAULT_ZOOM = 6
+PIXELS_PER_CELL = 4      # heat cell edge on screen at the binning zoom level
+
+def generate_trip_heatmap(df, aggregate=True, zoom=DEFAULT_ZOOM):
+    # With aggregate=False every start/end point is embedded in the page (the
+    # original behaviour); otherwise points are binned into weighted grid cells.
+    if aggregate:
+        lat = np.concatenate([df["lat_start"].to_numpy(float), df["lat_end"].to_numpy(float)])
+        lon = np.concatenate([df["lon_start"].to_numpy(float), df["lon_end"].to_numpy(float)])
+        return heatmap_from_cells(bin_points(lat, lon, cell_size_for_zoom(zoom)), zoom)
+
     heat_data = df[['lat_start', 'lon_start']].dropna().values.tolist()
     heat_data += df[['lat_end', 'lon_end']].dropna().values.tolist()
 
-    m = folium.Map(location=[26.9, 75.8], zoom_start=6)
+    m = folium.Map(location=DEFAULT_CENTER, zoom_start=zoom)
     HeatMap(heat_data).add_to(m)
     return m
 
+# ========== GRID BINNING ==========
+
+def cell_size_for_zoom(zoom):
+    # Degrees of longitude covered by PIXELS_PER_CELL screen pixels at this
+    # web-mercator zoom; finer zooms get finer cells.
+    return 360.0 / (256 * 2 ** zoom) * PIXELS_PER_CELL
+
+def bin_points(lat, lon, cell_deg):
+    # Snap points to a cell_deg grid and count them per cell.
+    # Returns an (n_cells, 3) array of [cell centre lat, cell centre lon, count].
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    keep = np.isfinite(lat) & np.isfinite(lon)
+    if not keep.any():
+        return np.empty((0, 3))
+    row = np.floor((lat[keep] + 90.0) / cell_deg).astype(np.int64)
+    col = np.floor((lon[keep] + 180.0) / cell_deg).astype(np.int64)
+    n_cols = int(np.ceil(360.0 / cell_deg)) + 1
+    cells, counts = np.unique(row * n_cols + col, return_counts=True)
+    cell_row, cell_col = np.divmod(cells, n_cols)
+    return np.column_stack([
+        (cell_row + 0.5) * cell_deg - 90.0,
+        (cell_col + 0.5) * cell_deg - 180.0,
+        counts,
+    ])
+
+def heatmap_from_cells(cells, zoom=DEFAULT_ZOOM):
+    m = folium.Map(location=DEFAULT_CENTER, zoom_start=zoom)
+    if len(cells):
+        # leaflet.heat expects intensities in [0, 1]; log-scale so a few hot
+        # depots do not wash out the rest of the map
+        weights = np.log1p(cells[:, 2])
+        weights = weights / weights.max()
+        data = np.column_stack([cells[:, 0].round(5), cells[:, 1].round(5), weights.round(3)])
+        HeatMap(data.tolist(), max_zoom=zoom).add_to(m)
+    return m
+
+# ========== CACHED FLEET HEATMAP ==========
+
+_cell_cache = {}
+_cell_cache_lock = threading.Lock()
+
+def fleet_heatmap_cells(zoom=DEFAULT_ZOOM):
+    # Binned start/end points for the whole fleet, archived months included
+    # (as in the Dashboard totals), recomputed only when trip_info changes
+    # (keyed on its change counter and the zoom level; archiving bumps it).
+    version = data_version(("trip_info",))
+    key = (version, zoom)
+    cells = _cell_cache.get(key)
+    if cells is not None:
+        return cells
+
+    df = query_trips(["lat_start", "lon_start", "lat_end", "lon_end"])
+    lat = np.concatenate([df["lat_start"].to_numpy(float), df["lat_end"].to_numpy(float)])
+    lon = np.concatenate([df["lon_start"].to_numpy(float), df["lon_end"].to_numpy(float)])
+    cells = bin_points(lat, lon, cell_size_for_zoom(zoom))
+
+    with _cell_cache_lock:
+        # drop bins computed for older data versions
+        for stale in [k for k in _cell_cache if k[0] != version]:
+            del _cell_cache[stale]
+        _cell_cache[key] = cells
+    return cells
 
+def generate_fleet_heatmap(zoom=DEFAULT_ZOOM):
+    return heatmap_from_cells(fleet_heatmap_cells(zoom), zoom)
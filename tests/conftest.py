@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The src modules are flat and read their paths at import time, so the
+# database, archive and model directories are pointed at a scratch directory
+# before any of them is imported. Every test shares that one database.
+_TMP = tempfile.mkdtemp(prefix="fleetstat-tests-")
+os.environ["FLEETSTAT_DB"] = os.path.join(_TMP, "FleetStat.db")
+os.environ["FLEETSTAT_ARCHIVE_DIR"] = os.path.join(_TMP, "archive")
+os.environ["FLEETSTAT_MODEL_DIR"] = os.path.join(_TMP, "models")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+@pytest.fixture(scope="session")
+def add_trips():
+    # add_trips([(vehicle_number, fuel_consumption, trip_date, distance), ...]) -> new trip_ids
+    from db_pool import get_pool
+
+    def add(rows):
+        with get_pool().writer() as conn:
+            return [conn.execute("""
+                INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
+                                       lat_start, lon_start, lat_end, lon_end, distance)
+                VALUES (?, ?, ?, 'Jaipur', 'Ajmer', 26.91, 75.79, 26.45, 74.64, ?)
+            """, row).lastrowid for row in rows]
+    return add
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import changefeed
+from db_pool import get_pool
+
+
+class Request:
+    # The one thing stream_response reads from a request
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def head():
+    with get_pool().reader() as conn:
+        return changefeed.head_seq(conn)
+
+
+def first_events(response):
+    # The events of the first non-empty batch a streaming response sends
+    async def read():
+        body = response.body_iterator
+        try:
+            async for chunk in body:
+                if chunk.startswith("id: "):
+                    return [json.loads(line[len("data: "):]) for line in chunk.splitlines()
+                            if line.startswith("data: ")]
+        finally:
+            await body.aclose()
+    return asyncio.run(asyncio.wait_for(read(), 10))
+
+
+def test_stream_resumes_from_last_event_id(add_trips):
+    add_trips([("CF01", 1.0, "2024-08-01", 10.0)])
+    seen = head()
+    ids = add_trips([("CF01", 2.0, "2024-08-02", 20.0), ("CF02", 3.0, "2024-08-03", 30.0)])
+
+    feed = changefeed.ChangeFeed(poll_interval=0.05)
+    events = first_events(changefeed.stream_response(feed, Request({"last-event-id": str(seen)}), after=0))
+    assert [(e["op"], e["trip_id"]) for e in events] == [("insert", trip_id) for trip_id in ids]
+    assert [e["seq"] for e in events] == [seen + 1, seen + 2]
+    assert events[1]["trip"]["vehicle_number"] == "CF02"
+
+
+def test_stream_resume_filters_by_vehicle(add_trips):
+    seen = head()
+    ids = add_trips([("CF03", 1.0, "2024-08-04", 10.0), ("CF04", 2.0, "2024-08-04", 20.0)])
+    with get_pool().writer() as conn:
+        conn.execute("UPDATE trip_info SET fuel_consumption = 5 WHERE trip_id = ?", (ids[1],))
+
+    feed = changefeed.ChangeFeed(poll_interval=0.05)
+    events = first_events(changefeed.stream_response(feed, Request({}), after=seen, vehicle_number="CF04"))
+    assert [(e["op"], e["trip_id"]) for e in events] == [("insert", ids[1]), ("update", ids[1])]
+
+
+def test_stream_from_unknown_id_asks_for_reload():
+    feed = changefeed.ChangeFeed(poll_interval=0.05)
+    events = first_events(changefeed.stream_response(feed, Request({"last-event-id": str(head() + 1000)})))
+    assert [e["op"] for e in events] == ["reload"]
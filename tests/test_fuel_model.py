@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fuel_model
+
+# litres per km of each vehicle in the fixed dataset
+RATES = {"TR1": 0.24, "TR2": 0.30, "CAR1": 0.07, "CAR2": 0.08}
+TYPES = {"TR1": "Truck", "TR2": "Truck", "CAR1": "Car", "CAR2": "Car"}
+
+
+def fixed_trips():
+    rng = np.random.default_rng(3)
+    vehicles = np.tile(list(RATES), 50)
+    distance = rng.uniform(20, 400, len(vehicles)).round(1)
+    return pd.DataFrame({
+        "trip_id": np.arange(1, len(vehicles) + 1),
+        "vehicle_number": vehicles,
+        "vehicle_type": [TYPES[v] for v in vehicles],
+        "distance": distance,
+        "fuel_consumption": (distance * np.array([RATES[v] for v in vehicles])).round(2),
+    })
+
+
+@pytest.fixture(scope="module")
+def model():
+    state = fuel_model.new_state()
+    fuel_model.add_chunk(state, fixed_trips())
+    return fuel_model.FuelModel(fuel_model.solve(state), state, {"version": "test"})
+
+
+def test_known_vehicles_get_their_own_rate(model):
+    vehicles = list(RATES)
+    litres = model.predict([100.0] * len(vehicles), [TYPES[v] for v in vehicles], vehicles)
+    assert litres / 100 == pytest.approx([RATES[v] for v in vehicles], rel=0.15)
+
+
+def test_without_vehicle_numbers_uses_the_type_rate(model):
+    litres = model.predict([100.0, 100.0], ["Truck", "Car"])
+    assert litres / 100 == pytest.approx([0.27, 0.075], rel=0.1)
+
+
+def test_unknown_vehicle_falls_back_to_its_type(model):
+    with_number = model.predict([100.0], ["Truck"], ["NEW1"])
+    without = model.predict([100.0], ["Truck"])
+    assert with_number == pytest.approx(without)
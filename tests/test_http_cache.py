@@ -0,0 +1,40 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import api_async
+
+TRIP = {"vehicle_number": "HC1", "fuel_consumption": 4.0, "trip_date": "2024-10-01", "start_location": "Jaipur",
+        "end_location": "Ajmer", "lat_start": 26.91, "lon_start": 75.79, "lat_end": 26.45, "lon_end": 74.64,
+        "distance": 40.0}
+
+
+@pytest.fixture(params=[api.app, api_async.app], ids=["sync", "async"])
+def client(request):
+    with TestClient(request.param) as client:
+        yield client
+
+
+@pytest.mark.parametrize("path", ["/trips", "/vehicles"])
+def test_unchanged_listing_revalidates_to_304(client, path):
+    first = client.get(path, params={"limit": 5})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"') and first.headers["cache-control"] == "private, no-cache"
+
+    again = client.get(path, params={"limit": 5}, headers={"If-None-Match": etag})
+    assert (again.status_code, again.content, again.headers["etag"]) == (304, b"", etag)
+    # the tag covers the query string too
+    other = client.get(path, params={"limit": 6}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["etag"] != etag
+
+
+@pytest.mark.parametrize("path", ["/trips", "/vehicles"])
+def test_write_invalidates_the_etag(client, path):
+    etag = client.get(path, params={"limit": 5}).headers["etag"]
+    assert client.post("/add_trip", json=TRIP).status_code == 200
+
+    after = client.get(path, params={"limit": 5}, headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["etag"] != etag
+    assert client.get(path, params={"limit": 5}, headers={"If-None-Match": after.headers["etag"]}).status_code == 304
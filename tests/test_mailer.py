@@ -0,0 +1,42 @@
+import pytest
+
+import mailer
+from bench_mailer import SmtpSink
+from db_pool import get_pool
+
+
+@pytest.fixture
+def sink():
+    sink = SmtpSink()
+    yield sink
+    sink.shutdown()
+
+
+def outbox(ids):
+    with get_pool().reader() as conn:
+        return {message_id: (status, attempts) for message_id, status, attempts in conn.execute(
+            f"SELECT message_id, status, attempts FROM mail_outbox WHERE message_id IN ({', '.join('?' * len(ids))})",
+            ids)}
+
+
+def test_dropped_connection_requeues_the_rest_without_an_attempt(sink):
+    mailer.enqueue_many({"recipient": recipient, "subject": "Report", "body": "attached"}
+                        for recipient in ("drop0@example.com", "owner1@example.com", "owner2@example.com"))
+    session = mailer.SmtpSession("127.0.0.1", sink.port, security="none", user=None, password=None)
+    limiter = mailer.RateLimiter(0)
+
+    batch = mailer.claim_batch()
+    ids = [item["message_id"] for item in batch]
+    sent, retry, failed = mailer.send_batch(batch, session, limiter, "fleetstat@example.com")
+    mailer.record_results(sent, retry, failed)
+    assert (sent, failed) == ([], [])
+    # only the message the server hung up on used an attempt
+    assert outbox(ids) == {ids[0]: ("queued", 1), ids[1]: ("queued", 0), ids[2]: ("queued", 0)}
+    assert sink.received == 0
+
+    with get_pool().writer() as conn:
+        conn.execute("UPDATE mail_outbox SET next_attempt_at = 0 WHERE status = 'queued'")
+    totals = mailer.run_mailer(session, limiter, once=True)
+    assert totals == {"sent": 3, "retry": 0, "failed": 0}
+    assert outbox(ids) == {ids[0]: ("sent", 2), ids[1]: ("sent", 1), ids[2]: ("sent", 1)}
+    assert sink.received == 3
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import api_async
+import partitions
+import rollups
+from db_pool import get_pool
+from test_rollups import assert_rollups_match
+
+
+def test_rollups_keep_archived_months(add_trips):
+    ids = add_trips([("RJ20", 8.0, "2020-03-05", 90.0), ("RJ20", 9.0, "2020-03-20", 95.0),
+                     ("RJ21", 2.0, "2020-04-01", 20.0)])
+    summary = partitions.archive_period("2020-03")
+    assert summary["moved"] == 2
+
+    with get_pool().reader() as conn:
+        left = [trip_id for trip_id, in conn.execute(
+            "SELECT trip_id FROM trip_info WHERE trip_id IN (?, ?, ?)", ids)]
+    assert left == [ids[2]]
+    assert_rollups_match()
+
+    with get_pool().writer() as conn:
+        conn.commit()
+        rollups.rebuild_rollups(conn)
+    assert_rollups_match()
+
+
+@pytest.fixture(scope="module")
+def archived(add_trips):
+    # Two trips in an archived month and one left in trip_info
+    ids = add_trips([("AR1", 3.0, "2019-01-10", 30.0), ("AR1", 4.0, "2019-01-20", 40.0),
+                     ("AR1", 5.0, "2019-02-01", 50.0)])
+    assert partitions.archive_period("2019-01")["moved"] == 2
+    return ids
+
+
+@pytest.fixture(params=[api.app, api_async.app], ids=["sync", "async"])
+def client(request):
+    with TestClient(request.param) as client:
+        yield client
+
+
+@pytest.mark.parametrize("order", ["trip_id", "-trip_id", "trip_date", "-trip_date"])
+def test_trips_pages_over_archived_months(archived, client, order):
+    seen, cursor = [], None
+    while True:
+        params = {"vehicle_number": "AR1", "order": order, "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/trips", params=params).json()
+        seen += [item["trip_id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == (archived if order in ("trip_id", "trip_date") else archived[::-1])
+
+
+def test_trips_date_range_inside_an_archived_month(archived, client):
+    page = client.get("/trips", params={"date_from": "2019-01-01", "date_to": "2019-01-31"}).json()
+    assert [item["trip_id"] for item in page["items"]] == archived[:2]
+
+
+def test_trip_export_includes_archived_months(archived, client):
+    response = client.get("/trips/export", params={"vehicle_number": "AR1", "format": "ndjson"})
+    assert [json.loads(line)["trip_id"] for line in response.text.splitlines()] == archived
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import api_async
+import fuel_model
+from db_pool import get_pool
+
+# litres per km and type of each vehicle the model is trained on
+VEHICLES = {"FP-TRK1": (0.25, "Truck"), "FP-TRK2": (0.30, "Truck"), "FP-CAR1": (0.07, "Car")}
+
+
+@pytest.fixture(scope="module")
+def trained(add_trips):
+    with get_pool().writer() as conn:
+        conn.executemany("INSERT INTO vehicle_info (vehicle_name, vehicle_number, owner_name, vehicle_type, "
+                         "registration_date) VALUES ('Fleet', ?, 'Owner', ?, '2020-01-01')",
+                         [(number, vehicle_type) for number, (_, vehicle_type) in VEHICLES.items()])
+    rng = np.random.default_rng(5)
+    rows = []
+    for _ in range(40):
+        for number, (rate, _) in VEHICLES.items():
+            distance = round(float(rng.uniform(30, 400)), 1)
+            rows.append((number, round(distance * rate, 2), "2024-09-01", distance))
+    add_trips(rows)
+    fuel_model.train(full=True)
+    fuel_model.get_model_holder().load()
+
+
+@pytest.mark.parametrize("app", [api.app, api_async.app], ids=["sync", "async"])
+def test_predict_fuel_for_known_vehicles(trained, app):
+    trips = [{"distance": 100, "vehicle_number": number} for number in VEHICLES]
+    trips += [{"distance": 100, "vehicle_type": "Truck"}, {"distance": 100, "vehicle_type": "Car"}]
+    with TestClient(app) as client:
+        response = client.post("/predict/fuel", json={"trips": trips})
+    assert response.status_code == 200
+    litres = response.json()["predictions"]
+    assert litres[:3] == pytest.approx([100 * rate for rate, _ in VEHICLES.values()], rel=0.15)
+    assert litres[3:] == pytest.approx([27.5, 7.0], rel=0.15)
@@ -0,0 +1,77 @@
+import pytest
+
+import db_handler
+import queries
+from db_pool import get_pool
+
+
+@pytest.fixture(scope="module")
+def trips(add_trips):
+    # Several trips on the same days, so the trip_date orders need their trip_id tie-break
+    return add_trips([(f"PG{i % 3}", 1.0 + i, f"2023-07-{1 + i % 4:02d}", 10.0) for i in range(11)])
+
+
+def walk(page, **kwargs):
+    # Every item of a keyset listing, following next_cursor to the end
+    items, cursor = [], None
+    while True:
+        result = page(cursor=cursor, **kwargs)
+        items += result["items"]
+        cursor = result["next_cursor"]
+        if cursor is None:
+            return items
+
+
+@pytest.mark.parametrize("order", list(queries.TRIP_ORDERS))
+def test_trip_page_cursor_round_trip(trips, order):
+    key_columns, descending = queries.TRIP_ORDERS[order]
+    with get_pool().reader() as conn:
+        items = walk(lambda cursor: queries.trip_page(conn, 3, cursor, order, vehicle_search="PG"))
+    keys = [tuple(item[c] for c in key_columns) for item in items]
+    assert sorted(item["trip_id"] for item in items) == sorted(trips)
+    assert keys == sorted(keys, reverse=descending)
+
+
+def test_vehicle_page_cursor_round_trip():
+    with get_pool().writer() as conn:
+        conn.executemany("INSERT INTO vehicle_info (vehicle_name, vehicle_number, owner_name, vehicle_type, "
+                         "registration_date) VALUES ('Tata', ?, 'Owner', 'Truck', '2020-01-01')",
+                         [(f"PGV{i}",) for i in range(5)])
+    with get_pool().reader() as conn:
+        items = walk(lambda cursor: queries.vehicle_page(conn, 2, cursor, vehicle_search="PGV"))
+    assert [item["vehicle_number"] for item in items] == [f"PGV{i}" for i in range(5)]
+
+
+def test_trip_page_between_cursor_round_trip(trips):
+    seen, cursor = [], None
+    while True:
+        df, cursor = db_handler.trip_page_between(4, cursor, "2023-07-01", "2023-07-31", vehicle_search="PG")
+        seen += df["trip_id"].tolist()
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(trips)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 json",
+    queries.encode_cursor("trip_date", ["2023-07-01"]),          # key too short for the order
+    queries.encode_cursor("trip_date", ["2023-07-01", 1, 2]),    # and too long
+    queries.encode_cursor("trip_id", [1]),                       # issued for another order
+    queries.encode_cursor("trip_date", [None, 1]),               # a NULL date is never a key
+])
+def test_trip_page_rejects_bad_cursors(cursor):
+    with get_pool().reader() as conn, pytest.raises(ValueError):
+        queries.trip_page(conn, 10, cursor, "trip_date")
+
+
+def test_date_orders_skip_undated_trips_without_stalling(add_trips):
+    ids = add_trips([("ND1", 1.0, None, 5.0), ("ND1", 1.0, "2023-08-01", 5.0), ("ND1", 1.0, None, 5.0),
+                     ("ND1", 1.0, "2023-08-02", 5.0), ("ND1", 1.0, None, 5.0), ("ND1", 1.0, "2023-08-03", 5.0)])
+    dated = ids[1::2]
+    with get_pool().reader() as conn:
+        for order in ("trip_date", "-trip_date"):
+            items = walk(lambda cursor: queries.trip_page(conn, 2, cursor, order, vehicle_number="ND1"))
+            assert sorted(item["trip_id"] for item in items) == dated
+        items = walk(lambda cursor: queries.trip_page(conn, 2, cursor, "trip_id", vehicle_number="ND1"))
+        assert [item["trip_id"] for item in items] == ids
@@ -0,0 +1,51 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import reports
+
+
+def test_worker_renders_and_then_reuses_reports(add_trips):
+    add_trips([("RP1", 6.0, "2016-07-03", 60.0), ("RP1", 4.0, "2016-07-04", 45.0),
+               ("RP2", 9.0, "2016-07-03", 80.0), ("RP2", 7.5, "2016-07-20", 70.0)])
+    fleet = reports.enqueue_report("fleet", "2016-07")
+    vehicle = reports.enqueue_report("vehicle", "2016-07", "RP1")
+    reports.run_worker(processes=2, once=True)
+
+    fleet_job, vehicle_job = reports.get_job(fleet), reports.get_job(vehicle)
+    assert (fleet_job["status"], fleet_job["error"]) == ("done", None)
+    assert (fleet_job["sections_total"], fleet_job["sections_done"], fleet_job["charts_reused"]) == (3, 3, 0)
+    # the vehicle's chart was drawn for the fleet report just before
+    assert (vehicle_job["status"], vehicle_job["charts_reused"]) == ("done", 1)
+    for job in (fleet_job, vehicle_job):
+        with open(reports.report_path(job), "rb") as pdf:
+            assert pdf.read(5) == b"%PDF-"
+    assert all(os.path.exists(s["chart"]) for s in reports.report_sections("2016-07"))
+
+    again = reports.get_job(reports.enqueue_report("fleet", "2016-07"))
+    reports.run_worker(processes=1, once=True)
+    again = reports.get_job(again["job_id"])
+    assert again["file_name"] == fleet_job["file_name"]
+    assert again["charts_reused"] == again["sections_total"] == 3
+
+
+def test_lease_is_renewed_while_the_pdf_builds(add_trips, monkeypatch):
+    add_trips([("RP3", 5.0, "2016-08-02", 50.0)])
+    monkeypatch.setattr(reports, "JOB_LEASE_S", 0.5)
+    monkeypatch.setattr(reports, "PROGRESS_EVERY_S", 0.05)
+    build_pdf, stolen = reports.build_pdf, []
+
+    def slow_build_pdf(*args):
+        # runs for three leases; another worker must not take the job meanwhile
+        time.sleep(1.5)
+        stolen.append(reports.claim_job("other"))
+        return build_pdf(*args)
+
+    monkeypatch.setattr(reports, "build_pdf", slow_build_pdf)
+    job_id = reports.enqueue_report("vehicle", "2016-08", "RP3")
+    job = reports.claim_job("test")
+    assert job["job_id"] == job_id
+    with ThreadPoolExecutor(1) as pool:
+        result = reports.run_job(job, pool)
+    assert stolen == [None]
+    assert os.path.exists(os.path.join(reports.REPORT_DIR, result["file_name"]))
@@ -0,0 +1,59 @@
+import pytest
+
+import db_handler
+from db_pool import get_pool
+
+
+def expected_totals():
+    # The rollups recomputed with GROUP BY over every trip, archived months included
+    df = db_handler.query_trips(["vehicle_number", "trip_date", "distance", "fuel_consumption"])
+    df = df.assign(vehicle_number=df["vehicle_number"].fillna(""), trip_date=df["trip_date"].fillna(""),
+                   distance=df["distance"].fillna(0), fuel_consumption=df["fuel_consumption"].fillna(0))
+
+    def grouped(keys):
+        g = df.groupby(keys).agg(trips=("distance", "size"), distance=("distance", "sum"),
+                                 fuel=("fuel_consumption", "sum"))
+        return {k: (row.trips, row.distance, row.fuel) for k, row in g.iterrows()}
+
+    fleet = (len(df), df["distance"].sum(), df["fuel_consumption"].sum())
+    return fleet, grouped("vehicle_number"), grouped(["vehicle_number", "trip_date"]), grouped("trip_date")
+
+
+def stored_totals():
+    with get_pool().reader() as conn:
+        def table(keys, name):
+            rows = conn.execute(f"SELECT {keys}, trip_count, total_distance, total_fuel FROM {name}")
+            return {row[0] if "," not in keys else row[:-3]: row[-3:] for row in rows}
+
+        fleet = conn.execute("SELECT trip_count, total_distance, total_fuel FROM fleet_rollup").fetchone()
+        return (fleet, table("vehicle_number", "vehicle_rollup"),
+                table("vehicle_number, trip_date", "vehicle_daily_rollup"),
+                table("trip_date", "fleet_daily_rollup"))
+
+
+def assert_rollups_match():
+    fleet, vehicles, vehicle_days, days = expected_totals()
+    stored_fleet, stored_vehicles, stored_vehicle_days, stored_days = stored_totals()
+    assert stored_fleet == pytest.approx(fleet)
+    for expected, stored in ((vehicles, stored_vehicles), (vehicle_days, stored_vehicle_days), (days, stored_days)):
+        assert stored.keys() == expected.keys()
+        for key, totals in expected.items():
+            assert stored[key] == pytest.approx(totals), key
+
+
+def test_rollups_follow_inserts_updates_and_deletes(add_trips):
+    ids = add_trips([("RJ01", 10.5, "2024-05-01", 120.0), ("RJ01", 4.0, "2024-05-01", 40.0),
+                     ("RJ02", 7.25, "2024-05-02", 80.0), ("RJ03", None, "2024-05-03", None)])
+    assert_rollups_match()
+
+    with get_pool().writer() as conn:
+        conn.execute("UPDATE trip_info SET fuel_consumption = 12, distance = 150 WHERE trip_id = ?", (ids[0],))
+        conn.execute("UPDATE trip_info SET vehicle_number = 'RJ02', trip_date = '2024-05-04' WHERE trip_id = ?",
+                     (ids[1],))
+        conn.execute("UPDATE trip_info SET start_location = 'Kota' WHERE trip_id = ?", (ids[2],))
+    assert_rollups_match()
+
+    with get_pool().writer() as conn:
+        conn.execute("DELETE FROM trip_info WHERE trip_id IN (?, ?)", (ids[2], ids[3]))
+    assert_rollups_match()
+
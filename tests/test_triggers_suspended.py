@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import rollups
+import synth
+from db_pool import DB_PATH, connect, get_pool
+from test_rollups import assert_rollups_match
+
+
+def trip_triggers():
+    with get_pool().reader() as conn:
+        return {name for name, in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'trip_info'")}
+
+
+def test_rollups_rebuilt_after_triggers_suspended(add_trips):
+    ids = add_trips([("RJ10", 3.0, "2024-06-01", 30.0), ("RJ10", 5.0, "2024-06-02", 50.0)])
+    before = trip_triggers()
+    with get_pool().writer() as conn:
+        with rollups.triggers_suspended(conn):
+            conn.executemany("""
+                INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date, start_location, end_location,
+                                       distance)
+                VALUES (?, ?, ?, 'Jaipur', 'Ajmer', ?)
+            """, [("RJ11", 6.0, "2024-06-01", 60.0), ("RJ10", 2.5, "2024-06-03", 25.0)])
+            conn.execute("DELETE FROM trip_info WHERE trip_id = ?", (ids[0],))
+        last_op = conn.execute("SELECT op FROM trip_changes ORDER BY seq DESC LIMIT 1").fetchone()[0]
+    assert last_op == "reload"
+    assert trip_triggers() == before
+    assert_rollups_match()
+
+    # and the reinstalled triggers keep them in step again
+    add_trips([("RJ11", 1.0, "2024-06-04", 10.0)])
+    assert_rollups_match()
+
+
+def test_failed_load_rolls_back_with_the_triggers_in_place(add_trips):
+    before = trip_triggers()
+    with get_pool().writer() as conn, pytest.raises(ZeroDivisionError):
+        with rollups.triggers_suspended(conn):
+            conn.execute("DELETE FROM trip_info")
+            1 / 0
+    assert trip_triggers() == before
+    assert_rollups_match()
+
+
+def test_killed_loader_leaves_the_triggers_in_place(add_trips):
+    before = trip_triggers()
+    # a loader that dies half way through, without running any cleanup
+    script = textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {os.path.dirname(synth.__file__)!r})
+        import rollups
+        from db_pool import connect
+        conn = connect({DB_PATH!r})
+        with rollups.triggers_suspended(conn):
+            conn.execute("INSERT INTO trip_info (vehicle_number, fuel_consumption, trip_date, distance) "
+                         "VALUES ('KILL1', 1, '2024-06-10', 10)")
+            os._exit(1)
+    """)
+    assert subprocess.run([sys.executable, "-c", script], env=os.environ).returncode == 1
+    assert trip_triggers() == before
+
+    add_trips([("RJ12", 2.0, "2024-06-11", 20.0)])
+    assert_rollups_match()
+    with get_pool().reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM trip_info WHERE vehicle_number = 'KILL1'").fetchone()[0] == 0
+
+
+def test_synth_loads_in_one_suspended_transaction():
+    before = trip_triggers()
+    conn = connect(DB_PATH)
+    try:
+        counts = synth.generate(conn, vehicles=10, trips=250, start_date="2018-01-01", days=30, seed=7)
+    finally:
+        conn.close()
+    assert counts == {"vehicles": 10, "trips": 250}
+    assert trip_triggers() == before
+    assert_rollups_match()
@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+import pytest
+
+import trip_routes
+from db_pool import get_pool
+
+
+def winding_route(n=2000, seed=11):
+    # a random walk north-east from Jaipur, ~50 m steps
+    rng = np.random.default_rng(seed)
+    steps = rng.normal([0.0003, 0.0003], 0.0004, size=(n, 2))
+    return np.array([26.91, 75.79]) + np.cumsum(steps, axis=0)
+
+
+def max_error(points, kept):
+    # Largest distance (degrees of latitude, longitudes scaled as simplify
+    # does) from a point to the kept segment spanning it
+    xy = np.column_stack((points[:, 1] * math.cos(math.radians(points[:, 0].mean())), points[:, 0]))
+    worst = 0.0
+    for first, last in zip(kept[:-1], kept[1:]):
+        a, ab = xy[first], xy[last] - xy[first]
+        inner = xy[first + 1:last] - a
+        if not len(inner):
+            continue
+        t = np.clip(inner @ ab / (ab @ ab), 0, 1) if ab @ ab else np.zeros(len(inner))
+        worst = max(worst, float(np.sqrt(((inner - t[:, None] * ab) ** 2).sum(axis=1)).max()))
+    return worst
+
+
+@pytest.mark.parametrize("tolerance", [0.0001, 0.001, 0.01])
+def test_simplify_stays_within_tolerance(tolerance):
+    points = winding_route()
+    kept = trip_routes.simplify(points, tolerance)
+    assert kept[0] == 0 and kept[-1] == len(points) - 1
+    assert (np.diff(kept) > 0).all() and len(kept) < len(points)
+    assert max_error(points, kept) <= tolerance
+
+
+def test_route_levels_are_exact_to_half_a_pixel():
+    points = winding_route()
+    levels = trip_routes.route_levels(points)
+    assert [zoom for zoom, _, _ in levels] == list(trip_routes.ZOOM_LEVELS)
+    counts = [count for _, count, _ in levels]
+    assert counts == sorted(counts) and counts[0] < counts[-1] <= len(points)
+    lat = points[:, 0].mean()
+    for zoom, count, blob in levels:
+        decoded = trip_routes.decode_points(blob)
+        assert decoded.shape == (count, 2)
+        kept = trip_routes.simplify(points, trip_routes.pixel_degrees(zoom, lat) / 2)
+        assert max_error(points, kept) <= trip_routes.pixel_degrees(zoom, lat) / 2
+        assert decoded == pytest.approx(points[kept], abs=1e-5)     # float32 storage
+
+
+@pytest.fixture
+def trip_with_route(add_trips):
+    trip_id, = add_trips([("TRT1", 5.0, "2024-11-01", 60.0)])
+    with get_pool().writer() as conn:
+        counts = trip_routes.store_route(conn, trip_id, winding_route())
+    return trip_id, counts
+
+
+def stored_zooms(trip_id):
+    with get_pool().reader() as conn:
+        return [zoom for zoom, in conn.execute("SELECT zoom FROM trip_route WHERE trip_id = ? ORDER BY zoom",
+                                               (trip_id,))]
+
+
+def test_store_and_load_route(trip_with_route):
+    trip_id, counts = trip_with_route
+    assert list(counts) == list(trip_routes.ZOOM_LEVELS)
+    with get_pool().reader() as conn:
+        # the coarsest level exact at the zoom asked for, the finest past the last one
+        assert [trip_routes.load_route(conn, trip_id, zoom)[0] for zoom in (0, 5, 6, 12, 15, 18)] == \
+            [5, 5, 7, 13, 15, 15]
+        level, points = trip_routes.load_route(conn, trip_id, 9)
+        assert points.shape == (counts[9], 2) and points.dtype == np.float32
+        zoom, drawn = trip_routes.load_route_for_map(conn, trip_id, 800, 600)
+        assert len(drawn) == counts[min(z for z in trip_routes.ZOOM_LEVELS if z >= zoom + trip_routes.ZOOM_HEADROOM)]
+        assert trip_routes.load_route(conn, -1, 9) is None
+
+
+def test_update_trigger_drops_route_only_when_end_points_move(trip_with_route):
+    trip_id, _ = trip_with_route
+    with get_pool().writer() as conn:
+        conn.execute("UPDATE trip_info SET distance = 61, fuel_consumption = 5.5 WHERE trip_id = ?", (trip_id,))
+        conn.execute("UPDATE trip_info SET lat_start = lat_start WHERE trip_id = ?", (trip_id,))
+    assert stored_zooms(trip_id) == list(trip_routes.ZOOM_LEVELS)
+
+    with get_pool().writer() as conn:
+        conn.execute("UPDATE trip_info SET lat_end = 26.5 WHERE trip_id = ?", (trip_id,))
+    assert stored_zooms(trip_id) == []
+
+
+def test_delete_trigger_drops_route(trip_with_route):
+    trip_id, _ = trip_with_route
+    with get_pool().writer() as conn:
+        conn.execute("DELETE FROM trip_info WHERE trip_id = ?", (trip_id,))
+    assert stored_zooms(trip_id) == []
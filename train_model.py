@@ -1,30 +1,14 @@
 import os
-import joblib
-import sqlite3
-import pandas as pd
-from sklearn.linear_model import LinearRegression
+import sys
 
-# Connect to your SQLite database
-conn = sqlite3.connect("db/FleetStat.db")  # Adjust path if needed
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "src"))
 
-# Load trip data from database
-df = pd.read_sql_query("SELECT distance, fuel_consumption FROM trip_info", conn)
-conn.close()
+from fuel_model import main
 
-# Drop any rows with missing data
-df = df.dropna()
+# Kept for the old entry point: updates the versioned fuel model with the
+# trips added since the last run (pass --full to retrain from scratch).
+# Artifacts live in ml_models/fuel/; see src/fuel_model.py.
 
-# Training data
-X = df[["distance"]]
-y = df["fuel_consumption"]
-
-# Train model
-model = LinearRegression()
-model.fit(X, y)
-
-# Make sure ml_models/ exists
-os.makedirs("ml_models", exist_ok=True)
-
-# Save model
-joblib.dump(model, "ml_models/fuel_predictor.pkl")
-print("Model trained and saved as ml_models/fuel_predictor.pkl")  # ← Fixed
+if __name__ == "__main__":
+    main()